@@ -4,6 +4,9 @@ import numpy as np  # Provides support for large, multi-dimensional arrays and m
 import clr  # Provides support for calling .NET code from Python
 import sys  # Provides access to system-specific parameters and functions
 import matplotlib.pyplot as plt  # Provides plotting functionality for data visualization
+import ctypes  # Provides the memory copy from pinned .NET buffers into NumPy arrays
+from statecache import shadow_state  # Skips redundant writes of unchanged spectrometer settings
+from tracer import tracer  # Per-step timing trace
 
 # Add reference to the external assembly (DLL) for interfacing with the spectrometer.
 # The path where the DLL is located is added to the system path.
@@ -14,6 +17,11 @@ clr.AddReference("HSSUSB2A")  # Add reference to the DLL for spectrometer contro
 # Import necessary functions and structures from the DLL.
 from HSSUSB2_DLL import *
 
+# Import the .NET types used to preallocate the capture buffers.
+import System  # Provides the .NET element types and Array
+from System.Runtime.InteropServices import GCHandle, GCHandleType  # For pinning .NET buffers while they are copied
+from System.Runtime.InteropServices import Marshal  # For the element size of .NET buffers
+
 # Constants for image and data handling.
 IMAGE_HEADER_SIZE = 256  # Size of the image header.
 DATA_COUNT_MAX_VALUE = 1  # Maximum value for data count.
@@ -23,6 +31,11 @@ EXPOSURE_TIME = 20000  # Exposure time for the spectrometer (in microseconds).
 CYCLE_TIME = 210000  # Cycle time between exposures.
 REPEAT_COUNT = 5  # Number of times to repeat the measurement.
 
+# .NET element types of the buffers passed to USB2_getImageHeaderData, with the matching NumPy data types.
+HEADER_NET_TYPE, HEADER_DTYPE = System.Byte, np.uint8  # Image headers.
+DATA_NET_TYPE, DATA_DTYPE = System.UInt16, np.uint16  # Image data (counts).
+TIME_NET_TYPE, TIME_DTYPE = System.Int64, np.int64  # Image time stamps.
+
 # Enumeration class for different capture modes in the spectrometer.
 class E_CAPTUREMODE:
     D_CAPTUREMODE_COUNT = 0x00000000  # Single capture mode.
@@ -40,13 +53,52 @@ class E_SENSORGAINMODE:
     D_SENSORGAINMODE_HIGHGAIN = 0x00000001  # High gain mode for the sensor.
     D_SENSORGAINMODE_NOTHING = 0x000000FF  # No gain applied.
 
+# Function to copy a .NET array into a NumPy array.
+def net_to_numpy(net_array, out, offset=0):
+    """
+    Copies part of a .NET array into a preallocated NumPy array with a single memory copy.
+
+    The .NET array is pinned so that the garbage collector cannot move it during the copy, which avoids converting
+    every element through Python.
+
+    Args:
+        net_array (System.Array): The source .NET array.
+        out (np.ndarray): The contiguous destination array, with the same element size as the .NET array.
+        offset (int): Index of the first element of the .NET array to copy (default: 0).
+
+    Returns:
+        np.ndarray: The destination array.
+
+    Raises:
+        AssertionError: If the element sizes differ or the copy would read outside the .NET array; the copy is a raw
+            memory read, so these are checked before it.
+    """
+    assert out.itemsize == Marshal.SizeOf(net_array.GetType().GetElementType()), \
+        'net_to_numpy: element size of the NumPy array does not match the .NET array'
+    assert out.flags['C_CONTIGUOUS'], 'net_to_numpy: the destination array must be contiguous'
+    assert 0 <= offset and offset + out.size <= net_array.Length, 'net_to_numpy: copy outside the .NET array'
+    handle = GCHandle.Alloc(net_array, GCHandleType.Pinned)
+    try:
+        source = handle.AddrOfPinnedObject().ToInt64() + offset * out.itemsize
+        ctypes.memmove(out.ctypes.data, source, out.nbytes)
+    finally:
+        handle.Free()
+    return out
+
 # Main function to perform the spectrometer measurement.
-def Measurement(USB_Device=HSSUSB2()):
+def Measurement(USB_Device=None, n_cycles=10, results=None, display=True):
     """
     Function to perform a measurement using the HSSUSB2 spectrometer.
 
+    The capture buffers are allocated once as .NET arrays and reused for every cycle, and the spectra are copied into
+    a preallocated NumPy array. Nothing is printed or plotted inside the capture loop, so spectra are read at the
+    device's cycle rate.
+
     Args:
-        USB_Device (HSSUSB2): The connected USB device object representing the spectrometer.
+        USB_Device (HSSUSB2): The connected USB device object representing the spectrometer (default: None creates one).
+        n_cycles (int): Number of capture cycles (default: 10).
+        results (dict): Optional dict filled with the captured 'spectra' as a (n, pixels) array and their 'times'.
+        display (bool): Print and plot the captured spectra once the capture has finished (default: True).
 
     Returns:
         int: The result code from the measurement process (success or error code).
@@ -58,7 +110,6 @@ def Measurement(USB_Device=HSSUSB2()):
     i_old = 0  # Old index for frame capture.
     mode_gain = E_GAINMODE.D_GAINMODE_SENSOR  # Set gain mode to sensor gain.
     mode_sensor = E_SENSORGAINMODE.D_SENSORGAINMODE_LOWGAIN  # Set sensor gain mode to low gain.
-    n_cycles = 10  # Number of capture cycles.
     n_captured = 0  # Number of captured frames.
     n_device = 0  # Number of connected devices.
     n_data = DATA_COUNT_MAX_VALUE  # Maximum data count.
@@ -67,7 +118,6 @@ def Measurement(USB_Device=HSSUSB2()):
     size_x = 0  # X dimension of the image.
     size_y = 0  # Y dimension of the image.
     size_image = 0  # Total image size (pixels).
-    size_data = 0  # Size of the data buffer.
     spectro_info = Usb2Struct.CSpectroInformation()  # Object to store spectro information.
     usb_return = 0  # Variable to store return codes from USB functions.
     usb_number = 0  # USB device number.
@@ -75,10 +125,9 @@ def Measurement(USB_Device=HSSUSB2()):
     # Begin the measurement process.
     print("Starting Measurement ............")
 
-    # Check if the USB device is properly initialized.
-    if USB_Device == None:
-        print("Wrong Input!")
-        return Usb2Struct.Cusb2Err.usb2Err_unsuccess.value__
+    # Create the USB device object if none was given.
+    if USB_Device is None:
+        USB_Device = HSSUSB2()
 
     # Initialize the USB device.
     usb_return = USB_Device.USB2_initialize()
@@ -166,6 +215,16 @@ def Measurement(USB_Device=HSSUSB2()):
         return usb_return
     size_image = size_x * size_y  # Calculate total image size.
 
+    # Allocate the .NET buffers for the image headers, data and time once, sized for the largest capture.
+    ImageHeaders = System.Array.CreateInstance(HEADER_NET_TYPE, IMAGE_HEADER_SIZE * n_frames)
+    ImageData = System.Array.CreateInstance(DATA_NET_TYPE, n_frames * n_transmit * size_image)
+    ImageTime = System.Array.CreateInstance(TIME_NET_TYPE, n_frames * n_transmit)
+
+    # Allocate the NumPy arrays receiving the latest spectrum of every cycle and its time stamp.
+    spectra = np.empty((n_cycles, size_image), dtype=DATA_DTYPE)
+    times = np.empty(n_cycles, dtype=TIME_DTYPE)
+    n_spectra = 0  # Number of spectra received.
+
     # Allocate buffer for the image data.
     usb_return = USB_Device.USB2_allocateBuffer(DeviceID, n_frames)
     if usb_return != Usb2Struct.Cusb2Err.usb2Success.value__:
@@ -180,15 +239,22 @@ def Measurement(USB_Device=HSSUSB2()):
         print("Error code 0x{:04x}: Cannot Start Capture!".format(usb_return))
         print("Exiting ............")
         return usb_return
-    print("Image Data:")
 
-    # Loop through capture cycles.
-    for i in range(n_cycles):
+    # Loop until a spectrum has been captured in every cycle, giving up after twice the expected duration.
+    t_deadline = time.perf_counter() + 2 * n_cycles * CYCLE_TIME * 1e-6 + 1.0
+    while n_spectra < n_cycles:
+        if time.perf_counter() > t_deadline:
+            print("Capture timed out after {} of {} spectra".format(n_spectra, n_cycles))
+            break
 
         # Get the capture status from the device.
         usb_return, n_captured, i_new = USB_Device.USB2_getCaptureStatus(DeviceID, n_captured, i_new)
         time.sleep(1e-2)  # Wait briefly between captures.
 
+        # Nothing has been captured yet in this cycle; poll again.
+        if usb_return == Usb2Struct.Cusb2Err.usb2Success.value__ and n_captured == 0:
+            continue
+
         # If the capture was successful, proceed with data processing.
         if usb_return == Usb2Struct.Cusb2Err.usb2Success.value__:
 
@@ -198,38 +264,18 @@ def Measurement(USB_Device=HSSUSB2()):
             else:
                 i_old = (i_new - n_captured) + 1
 
-            # Allocate a buffer for the image headers.
-            ImageHeaders = [0] * (IMAGE_HEADER_SIZE * n_captured)
-            if ImageHeaders == None:
-                return Usb2Struct.Cusb2Err.usb2Err_unsuccess.value__
-
-            # Allocate a buffer for the image data.
-            size_data = n_captured * n_transmit * size_image
-            ImageData = [0] * size_data
-            if ImageData == None:
-                return Usb2Struct.Cusb2Err.usb2Err_unsuccess.value__
-
-            # Allocate a buffer for the image time.
-            ImageTime = [0] * n_transmit * n_captured
-            if ImageTime == None:
-                return Usb2Struct.Cusb2Err.usb2Err_unsuccess.value__
-
-            # Retrieve the image data from the device.
+            # Retrieve the image data from the device into the preallocated buffers.
             usb_return, ImageHeaders, ImageData, ImageTime = USB_Device.USB2_getImageHeaderData(
                 DeviceID, ImageHeaders, ImageData, i_old, n_captured, ImageTime
             )
 
-            # Display the captured data.
-            Display_Data(ImageData)
-
-            # Convert the data to a NumPy array and plot it.
-            data = np.array(ImageData)
-            print(data)
-            plt.plot(np.linspace(950, 1700, len(data)), data)
-            plt.show()
+            # Copy the latest spectrum and its time stamp into the NumPy arrays.
+            n_latest = n_captured * n_transmit - 1
+            net_to_numpy(ImageData, spectra[n_spectra], offset=n_latest * size_image)
+            net_to_numpy(ImageTime, times[n_spectra:n_spectra + 1], offset=n_latest)
+            n_spectra += 1
 
             # Stop the capture process.
-            print("Stopping Capture ............")
             usb_return = USB_Device.USB2_captureStop(DeviceID)
             if usb_return != Usb2Struct.Cusb2Err.usb2Success.value__:
                 print("Error code 0x{:04x}: Cannot Stop Capture!".format(usb_return))
@@ -237,8 +283,7 @@ def Measurement(USB_Device=HSSUSB2()):
                 return usb_return
 
             # If there are more capture cycles, start the next capture.
-            if i < n_cycles - 1:
-                print("Starting Capture ............")
+            if n_spectra < n_cycles:
                 usb_return = USB_Device.USB2_captureStart(DeviceID, n_frames)
                 if usb_return != Usb2Struct.Cusb2Err.usb2Success.value__:
                     print("Error code 0x{:04x}: Cannot Start Capture!".format(usb_return))
@@ -249,6 +294,21 @@ def Measurement(USB_Device=HSSUSB2()):
         else:
             continue
 
+    print("Stopping Capture ............")
+
+    # Hand over the captured spectra.
+    if results is not None:
+        results['spectra'] = spectra[:n_spectra]
+        results['times'] = times[:n_spectra]
+
+    # Display and plot the captured data, now that the capture has finished.
+    if display and n_spectra > 0:
+        print("Image Data:")
+        for spectrum in spectra[:n_spectra]:
+            Display_Data(spectrum)
+        plt.plot(np.linspace(950, 1700, size_image), spectra[:n_spectra].T)
+        plt.show()
+
     # If the measurement finished unsuccessfully, return the error code.
     if usb_return == Usb2Struct.Cusb2Err.usb2Err_unsuccess.value__:
         return Usb2Struct.Cusb2Err.usb2Err_unsuccess.value__
@@ -278,17 +338,224 @@ def Measurement(USB_Device=HSSUSB2()):
     # Return the success code.
     return Usb2Struct.Cusb2Err.usb2Success.value__
 
+class SWIRSpectrometer:
+    """
+    A class to control and interface with a Hamamatsu HSSUSB2 (SWIR) spectrometer.
+
+    The device is initialised, opened, configured and given a ring of frame buffers once, and then kept open, so
+    each spectrum only costs the exposure. Spectra are read either one at a time with read_spectra(), or
+    continuously with stream(), which free-runs the spectrometer into its ring of frames.
+    """
+
+    def __init__(self, USB_Device=None, ring_frames=8, wavelength_range=(950, 1700),
+                 mode_gain=E_GAINMODE.D_GAINMODE_SENSOR, mode_sensor=E_SENSORGAINMODE.D_SENSORGAINMODE_LOWGAIN):
+        """
+        Initializes the USB driver, opens the first connected spectrometer and allocates its frame ring.
+
+        Args:
+            USB_Device (HSSUSB2): The USB device object (default: None creates one).
+            ring_frames (int): Number of frames in the capture ring buffer (default: 8).
+            wavelength_range (tuple): Wavelengths in nm of the first and last pixels (default: (950, 1700)).
+            mode_gain (int): The gain mode, see E_GAINMODE (default: sensor gain).
+            mode_sensor (int): The sensor gain mode, see E_SENSORGAINMODE (default: low gain).
+
+        Raises:
+            RuntimeError: If no spectrometer is found or a USB call fails.
+        """
+        self.device = HSSUSB2() if USB_Device is None else USB_Device
+        self.ring_frames = ring_frames
+        self.capturing = False
+
+        # Register the spectrometer's shadow state; nothing is known about a freshly opened device.
+        self.state = shadow_state.register('SWIRSpectrometer')
+
+        # Initialize the USB driver and find the connected devices.
+        self._check(self.device.USB2_initialize(), "Cannot Initialize!")
+        device_list = [0, 0, 0, 0, 0, 0, 0, 0]
+        usb_return, n_device = self.device.USB2_getModuleConnectionList(device_list, 0)
+        self._check(usb_return, "Cannot Get Device List!")
+        if n_device == 0:
+            raise RuntimeError("No SWIR spectrometers found")
+        self.device_id = device_list[0]
+
+        # Retrieve information about the spectrometer and open it.
+        spectro_info = Usb2Struct.CSpectroInformation()
+        self._check(self.device.USB2_getSpectroInformation(self.device_id, spectro_info)[0],
+                    "Cannot Get Spectro Information!")
+        print("Cooling Type: {}".format(spectro_info.unit))
+        self._check(self.device.USB2_open(self.device_id), "Cannot Open Device {}!".format(self.device_id))
+
+        # Configure the settings that do not change between measurements.
+        self._check(self.device.USB2_setDataCount(self.device_id, DATA_COUNT_MAX_VALUE), "Cannot Set Data Limit!")
+        self._check(self.device.USB2_setDataTransmit(self.device_id, DATA_TRANSMIT_COUNT), "Cannot Set Transmit Limit!")
+        self._check(self.device.USB2_setGain(self.device_id, mode_gain, mode_sensor), "Cannot Set Gain Value!")
+        usb_return, size_x, size_y = self.device.USB2_getImageSize(self.device_id, 0, 0)
+        self._check(usb_return, "Cannot Get Image Size!")
+        self.n_pixels = size_x * size_y
+
+        # The wavelength axis is fixed, so compute it once.
+        self.wavelengths = np.linspace(wavelength_range[0], wavelength_range[1], self.n_pixels)
+
+        # Allocate the device's frame ring, and the .NET and NumPy buffers it is read into, once.
+        self._check(self.device.USB2_allocateBuffer(self.device_id, ring_frames), "Cannot Allocate Buffer!")
+        self._headers = System.Array.CreateInstance(HEADER_NET_TYPE, IMAGE_HEADER_SIZE * ring_frames)
+        self._data = System.Array.CreateInstance(DATA_NET_TYPE, ring_frames * self.n_pixels)
+        self._time = System.Array.CreateInstance(TIME_NET_TYPE, ring_frames)
+        self._spectra = np.empty((ring_frames, self.n_pixels), dtype=DATA_DTYPE)
+        self._times = np.empty(ring_frames, dtype=TIME_DTYPE)
+
+        print("SWIR spectrometer {} has been initialised.".format(self.device_id))
+
+    def _check(self, usb_return, message):
+        """
+        Raises a RuntimeError with the error code if a USB call failed.
+        """
+        if usb_return != Usb2Struct.Cusb2Err.usb2Success.value__:
+            raise RuntimeError("Error code 0x{:04x}: {}".format(usb_return, message))
+
+    def _configure(self, capture_mode, exposure_time_Us, cycle_time_Us):
+        """
+        Sets the capture mode, exposure and cycle time, skipping settings the device already holds.
+        """
+        cycle_time_Us = max(cycle_time_Us, exposure_time_Us)
+        self.state.apply('capture_mode', capture_mode, lambda mode: self._check(
+            self.device.USB2_setCaptureMode(self.device_id, mode), "Cannot Set Capture Mode!"))
+        self.state.apply('cycle_time', cycle_time_Us, lambda cycle: self._check(
+            self.device.USB2_setExposureCycle(self.device_id, cycle), "Cannot Set Cycle Time!"))
+        self.state.apply('exposure_time', exposure_time_Us, lambda exposure: self._check(
+            self.device.USB2_setExposureTime(self.device_id, exposure), "Cannot Set Exposure Time!"))
+
+    def _wait_for_frames(self, poll_s):
+        """
+        Polls the capture status until at least one frame is available.
+
+        Returns:
+            tuple: The number of frames captured and the ring index of the newest frame.
+        """
+        while True:
+            usb_return, n_captured, i_new = self.device.USB2_getCaptureStatus(self.device_id, 0, 0)
+            if usb_return == Usb2Struct.Cusb2Err.usb2Success.value__ and n_captured > 0:
+                return n_captured, i_new
+            time.sleep(poll_s)
+
+    def _read_frames(self, n_captured, i_new):
+        """
+        Reads the newest frames of the ring into the preallocated NumPy buffers.
+
+        Returns:
+            int: The number of frames read, at most the size of the ring.
+        """
+        n = min(n_captured, self.ring_frames)
+        i_old = (i_new - n + 1) % self.ring_frames  # Ring index of the oldest frame read
+        with tracer.span('get_image_data', self.state.name, frames=n):
+            usb_return, self._headers, self._data, self._time = self.device.USB2_getImageHeaderData(
+                self.device_id, self._headers, self._data, i_old, n, self._time)
+        self._check(usb_return, "Cannot Get Image Data!")
+        with tracer.span('net_to_numpy', self.state.name, frames=n):
+            net_to_numpy(self._data, self._spectra[:n])
+            net_to_numpy(self._time, self._times[:n])
+        return n
+
+    @tracer.traced('read_spectra', 'SWIRSpectrometer')
+    def read_spectra(self, exposure_time_Us: int, num_average: int = 1):
+        """
+        Reads a spectrum from the spectrometer.
+
+        Args:
+            exposure_time_Us (int): The exposure time in microseconds.
+            num_average (int): The number of frames to average, at most the size of the ring (default: 1).
+
+        Returns:
+            tuple: The wavelength axis and the averaged spectrum (counts), as NumPy arrays.
+        """
+        assert num_average <= self.ring_frames, 'SWIRSpectrometer: num_average is larger than the frame ring'
+        self._configure(E_CAPTUREMODE.D_CAPTUREMODE_COUNT, exposure_time_Us, exposure_time_Us)
+
+        # Capture the frames, wait for all of them, and read them back.
+        self._check(self.device.USB2_captureStart(self.device_id, num_average), "Cannot Start Capture!")
+        try:
+            n_read = 0
+            while n_read < num_average:
+                n_captured, i_new = self._wait_for_frames(exposure_time_Us * 1e-6 / 4)
+                if n_captured >= num_average:
+                    n_read = self._read_frames(num_average, i_new)
+        finally:
+            self._check(self.device.USB2_captureStop(self.device_id), "Cannot Stop Capture!")
+
+        return self.wavelengths, self._spectra[:num_average].mean(axis=0)
+
+    def stream(self, exposure_time_Us: int, n_spectra=None, cycle_time_Us=None, status=None):
+        """
+        Streams spectra continuously, reading the frame ring as it fills.
+
+        The spectrometer free-runs in continuous capture mode, and the frames captured since the previous poll are
+        read out at each poll; frames already yielded are never read again. If more new frames were captured than
+        the ring holds, the oldest were overwritten and are counted as dropped.
+
+        Args:
+            exposure_time_Us (int): The exposure time in microseconds.
+            n_spectra (int): Number of spectra to acquire (default: None, stream until the caller stops iterating).
+            cycle_time_Us (int): The frame period in microseconds (default: None uses the exposure time).
+            status (dict): Optional dict updated in place with the number of 'spectra' received and 'dropped'.
+
+        Returns:
+            A generator of (times, spectra) batches, as views of preallocated buffers that are reused between
+            batches: the device time stamps as a (n,) array and the spectra as a (n, n_pixels) array.
+        """
+        if status is None:
+            status = {}
+        status['spectra'] = 0
+        status['dropped'] = 0
+        cycle_time_Us = exposure_time_Us if cycle_time_Us is None else cycle_time_Us
+        self._configure(E_CAPTUREMODE.D_CAPTUREMODE_CONTINUOUS, exposure_time_Us, cycle_time_Us)
+
+        self._check(self.device.USB2_captureStart(self.device_id, self.ring_frames), "Cannot Start Capture!")
+        self.capturing = True
+        poll_s = cycle_time_Us * 1e-6 / 4
+        delivered = 0  # Capture count at the previous read; frames up to it have been yielded or dropped
+        try:
+            while n_spectra is None or status['spectra'] < n_spectra:
+                n_captured, i_new = self._wait_for_frames(poll_s)
+                # The capture count is cumulative since captureStart; if it went backwards, the driver reset it
+                n_new = n_captured - delivered if n_captured >= delivered else n_captured
+                delivered = n_captured
+                if n_new == 0:
+                    time.sleep(poll_s)
+                    continue
+                # Only the newest frames of the ring are still available
+                if n_new > self.ring_frames:
+                    status['dropped'] += n_new - self.ring_frames
+                    n_new = self.ring_frames
+                n = self._read_frames(n_new, i_new)
+                if n_spectra is not None:
+                    n = min(n, n_spectra - status['spectra'])
+                status['spectra'] += n
+                yield self._times[:n], self._spectra[:n]
+        finally:
+            self._check(self.device.USB2_captureStop(self.device_id), "Cannot Stop Capture!")
+            self.capturing = False
+
+    def close(self):
+        """
+        Releases the frame ring, closes the spectrometer and uninitialises the USB driver.
+        """
+        if self.capturing:
+            self.device.USB2_captureStop(self.device_id)
+            self.capturing = False
+        self._check(self.device.USB2_releaseBuffer(self.device_id), "Cannot Release Buffer!")
+        self._check(self.device.USB2_close(self.device_id), "Cannot Close Device!")
+        self._check(self.device.USB2_uninitialize(), "Cannot Uninitialize!")
+        shadow_state.unregister(self.state)
+
 # Function to display the data in a readable format.
 def Display_Data(ImageData=[]):
     """
     Displays the image data captured from the spectrometer.
 
     Args:
-        ImageData (list): The image data to be displayed.
+        ImageData (array-like): The image data to be displayed.
     """
-    for i in range(len(ImageData)):
-        print("0x{:04x}".format(ImageData[i]), end=" ")
-    print()
+    print(" ".join("0x{:04x}".format(value) for value in np.asarray(ImageData).tolist()))
     return True
 
 if __name__ == "__main__":
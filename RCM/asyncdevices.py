@@ -0,0 +1,70 @@
+# Import necessary libraries
+import asyncio  # For awaiting device commands
+import functools  # For binding the arguments of device calls
+import threading  # For the device lock shared with synchronous callers
+from concurrent.futures import ThreadPoolExecutor  # For the per-device worker threads
+
+
+class AsyncDevice:
+    """
+    An asyncio facade over a blocking device driver.
+
+    Every method of the driver becomes a coroutine function that runs the blocking call on the device's own
+    single-worker executor. Calls to one device are therefore executed one at a time, in the order they were
+    awaited, while calls to different devices overlap. Attributes that are not methods are read directly.
+
+    Every call holds the facade's `lock` while it runs. Code that drives the device directly from another thread
+    (e.g. the threads of an AcquisitionPipeline) must hold the same lock, so that it never interleaves with
+    commands sent through the facade.
+
+    Example:
+        stage = AsyncDevice(Controller(...), 'stage')
+        camera = AsyncDevice(Camera_HS(), 'camera')
+        await asyncio.gather(stage.move_um(0, 100), camera.single_exposure(50))
+    """
+
+    def __init__(self, device, name=None):
+        """
+        Args:
+            device: The blocking device driver.
+            name (str): Name of the device's worker thread (default: None uses the driver's class name).
+        """
+        self.device = device
+        self.name = name or type(device).__name__
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=self.name)
+        self.lock = threading.RLock()  # Held by every call to the device
+
+    def __getattr__(self, attribute):
+        value = getattr(self.device, attribute)
+        if not callable(value):
+            return value
+
+        async def call(*args, **kwargs):
+            return await self.run(value, *args, **kwargs)
+
+        call.__name__ = attribute
+        call.__doc__ = value.__doc__
+        return call
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Runs any blocking callable on the device's worker thread, e.g. a routine making several calls to the device.
+
+        Returns:
+            The return value of `func`.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(self._call, func, *args, **kwargs))
+
+    def _call(self, func, *args, **kwargs):
+        """
+        Runs a call on the worker thread while holding the device lock.
+        """
+        with self.lock:
+            return func(*args, **kwargs)
+
+    def shutdown(self, wait=True):
+        """
+        Stops the device's worker thread once its pending calls have finished. The device itself is not closed.
+        """
+        self._executor.shutdown(wait=wait)
@@ -13,6 +13,58 @@ pll.par["devices/dlls/uc480"] = r"C:/Program Files/Thorlabs/Scientific Imaging/T
 # NumPy is a Python library used for working with arrays. It also has functions for working in the domain of linear algebra, Fourier transform, and matrices.
 import numpy as np
 
+# Streaming frame accumulation shared by the camera classes.
+from imaging import RunningAverage, HDRMerge
+
+# Shadow state that skips redundant writes of unchanged camera settings.
+from statecache import shadow_state
+
+# Per-step timing trace.
+from tracer import tracer
+
+
+def stream_frames(cam, n_frames=None, buffer_frames=8, timeout=5.0, status=None):
+    """
+    Streams frames from a pylablib camera in continuous acquisition mode.
+
+    The camera free-runs into a ring buffer of `buffer_frames` frames, and frames are read out in batches as they
+    arrive, so the loop runs at the sensor frame rate instead of arming and triggering the camera for every frame.
+    Frames that are overwritten before being read show up as gaps in the frame indices and are counted as dropped.
+
+    :param cam: The opened pylablib camera.
+    :param n_frames: Number of frames to acquire before stopping (default is None, stream until the caller stops iterating).
+    :param buffer_frames: Size of the camera's ring buffer in frames (default is 8).
+    :param timeout: Time in seconds to wait for each frame before raising an error (default is 5 s).
+    :param status: Optional dict updated in place with the number of 'frames' received and 'dropped'.
+    :return: A generator of (frame_index, frame) tuples.
+    """
+    if status is None:
+        status = {}
+    status['frames'] = 0
+    status['dropped'] = 0
+
+    # Set up the ring buffer and start free-running (0 frames per trigger means continuous acquisition).
+    cam.setup_acquisition(nframes=buffer_frames)
+    cam.start_acquisition(frames_per_trigger=0)
+    try:
+        next_index = None
+        while n_frames is None or status['frames'] < n_frames:
+            # Wait for at least one new frame, then read every frame available.
+            cam.wait_for_frame(timeout=timeout)
+            frames, infos = cam.read_multiple_images(return_info=True)
+            for frame, info in zip(frames, infos):
+                index = info.frame_index
+                # Any gap in the frame indices means frames were overwritten in the ring buffer.
+                if next_index is not None and index > next_index:
+                    status['dropped'] += index - next_index
+                next_index = index + 1
+                status['frames'] += 1
+                yield index, frame
+                if n_frames is not None and status['frames'] >= n_frames:
+                    break
+    finally:
+        cam.stop_acquisition()
+
 
 class Camera_HS():
     """
@@ -25,17 +77,18 @@ class Camera_HS():
         Initializes the Camera_HS class by opening a connection to the first camera found,
         setting the region of interest (ROI), and configuring exposure settings.
         """
-        # List all connected cameras and print the serial number of the first camera.
-        print('Camera Serial : ', tl.list_cameras_tlcam())
-
-        # Open the first camera found using its serial number.
-        self.cam = tl.ThorlabsTLCamera(serial='24070')
+        # Open the camera object (overridden by the simulated camera).
+        self.cam = self._open_camera()
 
         # Open the camera for use.
         self.cam.open()
 
+        # Register the camera's shadow state; a freshly opened camera has no known settings.
+        self.state = shadow_state.register('Camera_HS')
+
         # Set the camera's region of interest (ROI), which defines the area captured by the sensor.
-        self.cam.set_roi(0, 4096, 0, 2616)
+        self.sensor_roi = (0, 4096, 0, 2616)  # Full sensor (hstart, hend, vstart, vend)
+        self.set_roi(*self.sensor_roi)
 
         # Verify and print whether the camera was successfully opened.
         print('Camera opened : ', self.cam.is_opened())
@@ -48,74 +101,147 @@ class Camera_HS():
         self.exposure = 15  # ms
 
         # Apply the initial exposure time to the camera.
-        self.cam.set_exposure(self.exposure)
+        self.set_exposure(self.exposure)
+
+    def _open_camera(self):
+        """
+        Creates the pylablib camera object for this camera.
+
+        :return: The (not yet opened) ThorlabsTLCamera.
+        """
+        # List all connected cameras and print the serial number of the first camera.
+        print('Camera Serial : ', tl.list_cameras_tlcam())
 
-    def single_exposure(self, exposure_time=1):
+        # Open the first camera found using its serial number.
+        return tl.ThorlabsTLCamera(serial='24070')
+
+    def set_exposure(self, exposure_time):
+        """
+        Sets the exposure time, skipping the camera call if it is already set to this value.
+
+        :param exposure_time: The exposure time in milliseconds.
+        """
+        with tracer.span('set_exposure', self.state.name, exposure=exposure_time):
+            self.state.apply('exposure', exposure_time, self.cam.set_exposure)
+
+    def set_roi(self, hstart=0, hend=4096, vstart=0, vend=2616, hbin=1, vbin=1):
+        """
+        Sets the region of interest and binning, skipping the camera call if they are already set.
+
+        A smaller ROI or coarser binning shortens readout and reduces the data per frame.
+
+        :param hstart: First column of the ROI in sensor pixels (default is 0).
+        :param hend: End column of the ROI in sensor pixels, exclusive (default is 4096).
+        :param vstart: First row of the ROI in sensor pixels (default is 0).
+        :param vend: End row of the ROI in sensor pixels, exclusive (default is 2616).
+        :param hbin: Horizontal binning factor (default is 1).
+        :param vbin: Vertical binning factor (default is 1).
+        """
+        roi = (int(hstart), int(hend), int(vstart), int(vend), int(hbin), int(vbin))
+        self.state.apply('roi', roi, lambda r: self.cam.set_roi(*r))
+
+    @property
+    def roi(self):
+        """
+        The (hstart, hend, vstart, vend, hbin, vbin) region of interest actually applied by the camera.
+        """
+        return tuple(self.cam.get_roi())
+
+    @property
+    def frame_shape(self):
+        """
+        The (height, width) of the frames returned by the camera for the current ROI.
+        """
+        return tuple(self.cam.get_data_dimensions())
+
+    def single_exposure(self, exposure_time=1, out=None):
         """
         Captures a single image with the given exposure time.
 
         :param exposure_time: The exposure time in milliseconds (default is 1 ms).
-        :return: The captured image as a NumPy array of type uint16.
+        :param out: Optional preallocated uint16 array of shape `frame_shape` to write the image into (default is None).
+        :return: The captured image as a NumPy array of type uint16 (`out` if it was given).
         """
         # Set the camera exposure time.
-        self.cam.set_exposure(exposure_time)
-        # Capture a single image and convert it to a NumPy array of type uint16.
-        return self.cam.snap().astype(np.uint16)
-
-    def average_exposure(self, exposure_time=1, averages=5):
+        self.set_exposure(exposure_time)
+        # Capture a single image; only convert to uint16 if the camera did not already return that type.
+        with tracer.span('snap', self.state.name, exposure=exposure_time):
+            frame = self.cam.snap()
+        with tracer.span('astype', self.state.name):
+            if out is None:
+                return frame.astype(np.uint16, copy=False)
+            # Write the image straight into the caller's buffer.
+            np.copyto(out, frame, casting='unsafe')
+            return out
+
+    def average_exposure(self, exposure_time=1, averages=5, return_variance=False):
         """
         Captures multiple images with the specified exposure time and returns the average.
 
+        Frames are streamed at the sensor frame rate and folded into a running accumulator as they arrive, so memory
+        use does not grow with the number of averages.
+
         :param exposure_time: The exposure time in milliseconds (default is 1 ms).
         :param averages: Number of images to capture and average (default is 5).
-        :return: The averaged image as a NumPy array.
-        """
-        self.cam.set_exposure(exposure_time)
-        # Initialize an empty list to store the captured images.
-        exps = []
-        # Capture the specified number of images.
-        for i in range(averages):
-            exps.append(self.cam.snap().astype(np.uint16))
+        :param return_variance: If True, also return the per-pixel variance as a noise estimate (default is False).
+        :return: The averaged image as a float32 NumPy array, and the variance image if `return_variance` is True.
+        """
+        # Initialize a constant-memory accumulator for the captured images.
+        accumulator = RunningAverage(self.frame_shape, variance=return_variance)
+        # Capture the specified number of images and add each one to the accumulator.
+        for _, frame in self.stream(exposure_time=exposure_time, n_frames=averages):
+            accumulator.add(frame)
         # Return the mean of all captured images.
-        return np.mean(exps, axis=0)
+        if return_variance:
+            return accumulator.mean(), accumulator.variance()
+        return accumulator.mean()
+
+    def stream(self, exposure_time=1, n_frames=None, buffer_frames=8, timeout=5.0):
+        """
+        Streams frames at the sensor frame rate using continuous acquisition.
+
+        The number of frames received and dropped is kept in `stream_status` while streaming.
+
+        :param exposure_time: The exposure time in milliseconds (default is 1 ms).
+        :param n_frames: Number of frames to acquire (default is None, stream until the caller stops iterating).
+        :param buffer_frames: Size of the camera's ring buffer in frames (default is 8).
+        :param timeout: Time in seconds to wait for each frame (default is 5 s).
+        :return: A generator of (frame_index, frame) tuples.
+        """
+        self.set_exposure(exposure_time)
+        self.stream_status = {}
+        return stream_frames(self.cam, n_frames=n_frames, buffer_frames=buffer_frames, timeout=timeout,
+                             status=self.stream_status)
 
     def multi_exposure(self, start_exposure=1e-4, doubles=10, discard_ratio=0.2):
         """
         Captures multiple images with exposure times that double sequentially,
         and combines them into a single image while discarding over/under-exposed pixels.
 
+        Each exposure is folded into an HDRMerge as soon as it is captured, weighting pixels by how well exposed they are.
+
         :param start_exposure: Initial exposure time in seconds (default is 0.0001 s).
         :param doubles: Number of times the exposure is doubled (default is 10).
-        :param discard_ratio: The percentage of extreme pixel values to discard (default is 0.2).
-        :return: The mean image after processing multiple exposures.
+        :param discard_ratio: The fraction of the pixel range at each end that is discarded (default is 0.2).
+        :return: The merged image, normalised to the starting exposure (NaN where no exposure was usable).
         """
-        # Initialize a list to store the raw captured data.
-        raw_data = []
+        # Initialize the streaming HDR merge.
+        merger = HDRMerge(self.frame_shape, self.max_val, discard_ratio)
         # Loop through the exposure steps, doubling each time.
         for i in range(doubles):
             # Set the current exposure time.
-            self.cam.set_exposure(start_exposure * 2 ** i)
-            # Capture an image and convert it to a NumPy array of type float32.
-            temp = self.cam.snap().astype(np.float32)
-            # Discard pixels that are too bright (above the discard threshold).
-            temp[temp >= self.max_val * (1 - discard_ratio)] = np.NaN
-            # Discard pixels that are too dark (below the discard threshold).
-            temp[temp <= self.max_val * discard_ratio] = np.NaN
-            # Normalize the image by dividing by the exposure ratio and add to the list.
-            raw_data.append(temp / (2 ** i))
-
-        # Convert the list of raw data to a NumPy array.
-        raw_data = np.array(raw_data)
-        # Calculate the mean of the images, ignoring NaN values.
-        mean_data = np.nanmean(raw_data, axis=0)
-        # Return the processed mean image.
-        return mean_data
+            self.set_exposure(start_exposure * 2 ** i)
+            # Capture an image and add it to the merge, normalised by its exposure ratio.
+            merger.add(self.cam.snap(), 2 ** i)
+        # Return the merged image.
+        return merger.result()
 
     def close(self):
         """
         Closes the camera connection. This method should be called after finishing camera operations.
         """
         self.cam.close()
+        shadow_state.unregister(self.state)
 
 
 class Camera_BA():
@@ -129,40 +255,115 @@ class Camera_BA():
         Initializes the Camera_BA class by opening a connection to the first camera found,
         setting the region of interest (ROI), and configuring exposure settings.
         """
-        print('Camera Serial : ', tl.list_cameras_tlcam())
-        self.cam = tl.ThorlabsTLCamera(serial='23588')
+        self.cam = self._open_camera()
         self.cam.open()
-        self.cam.set_roi(0, 4096, 0, 2616)
+        self.state = shadow_state.register('Camera_BA')
+        self.sensor_roi = (0, 4096, 0, 2616)
+        self.set_roi(*self.sensor_roi)
         print('Camera opened : ', self.cam.is_opened())
         self.max_val = 4096
         self.min_val = 0
         self.exposure = 50  # ms
-        self.cam.set_exposure(self.exposure)
+        self.set_exposure(self.exposure)
+
+    def _open_camera(self):
+        """
+        Creates the pylablib camera object for this camera.
+
+        :return: The (not yet opened) ThorlabsTLCamera.
+        """
+        print('Camera Serial : ', tl.list_cameras_tlcam())
+        return tl.ThorlabsTLCamera(serial='23588')
+
+    def set_exposure(self, exposure_time):
+        """
+        Sets the exposure time, skipping the camera call if it is already set to this value.
+
+        :param exposure_time: The exposure time in milliseconds.
+        """
+        with tracer.span('set_exposure', self.state.name, exposure=exposure_time):
+            self.state.apply('exposure', exposure_time, self.cam.set_exposure)
+
+    def set_roi(self, hstart=0, hend=4096, vstart=0, vend=2616, hbin=1, vbin=1):
+        """
+        Sets the region of interest and binning, skipping the camera call if they are already set.
+
+        A smaller ROI or coarser binning shortens readout and reduces the data per frame.
+
+        :param hstart: First column of the ROI in sensor pixels (default is 0).
+        :param hend: End column of the ROI in sensor pixels, exclusive (default is 4096).
+        :param vstart: First row of the ROI in sensor pixels (default is 0).
+        :param vend: End row of the ROI in sensor pixels, exclusive (default is 2616).
+        :param hbin: Horizontal binning factor (default is 1).
+        :param vbin: Vertical binning factor (default is 1).
+        """
+        roi = (int(hstart), int(hend), int(vstart), int(vend), int(hbin), int(vbin))
+        self.state.apply('roi', roi, lambda r: self.cam.set_roi(*r))
+
+    @property
+    def roi(self):
+        """
+        The (hstart, hend, vstart, vend, hbin, vbin) region of interest actually applied by the camera.
+        """
+        return tuple(self.cam.get_roi())
 
-    def single_exposure(self, exposure_time=1, timeout=500e-3):
+    @property
+    def frame_shape(self):
+        """
+        The (height, width) of the frames returned by the camera for the current ROI.
+        """
+        return tuple(self.cam.get_data_dimensions())
+
+    def single_exposure(self, exposure_time=1, timeout=500e-3, out=None):
         """
         Captures a single image with the given exposure time and optional timeout.
 
         :param exposure_time: The exposure time in milliseconds (default is 1 ms).
         :param timeout: Timeout period in seconds (default is 0.5 s).
-        :return: The captured image as a NumPy array.
+        :param out: Optional preallocated array of shape `frame_shape` to write the image into (default is None).
+        :return: The captured image as a NumPy array (`out` if it was given).
         """
-        self.cam.set_exposure(exposure_time)
-        return self.cam.snap(timeout=timeout)
-
-    def average_exposure(self, exposure_time=1, averages=5):
+        self.set_exposure(exposure_time)
+        with tracer.span('snap', self.state.name, exposure=exposure_time):
+            frame = self.cam.snap(timeout=timeout)
+        if out is None:
+            return frame
+        with tracer.span('astype', self.state.name):
+            np.copyto(out, frame, casting='unsafe')
+        return out
+
+    def average_exposure(self, exposure_time=1, averages=5, return_variance=False):
         """
         Captures multiple images with the specified exposure time and returns the average.
 
         :param exposure_time: The exposure time in milliseconds (default is 1 ms).
         :param averages: Number of images to capture and average (default is 5).
-        :return: The averaged image as a NumPy array.
+        :param return_variance: If True, also return the per-pixel variance as a noise estimate (default is False).
+        :return: The averaged image as a float32 NumPy array, and the variance image if `return_variance` is True.
+        """
+        accumulator = RunningAverage(self.frame_shape, variance=return_variance)
+        for _, frame in self.stream(exposure_time=exposure_time, n_frames=averages):
+            accumulator.add(frame)
+        if return_variance:
+            return accumulator.mean(), accumulator.variance()
+        return accumulator.mean()
+
+    def stream(self, exposure_time=1, n_frames=None, buffer_frames=8, timeout=5.0):
+        """
+        Streams frames at the sensor frame rate using continuous acquisition.
+
+        The number of frames received and dropped is kept in `stream_status` while streaming.
+
+        :param exposure_time: The exposure time in milliseconds (default is 1 ms).
+        :param n_frames: Number of frames to acquire (default is None, stream until the caller stops iterating).
+        :param buffer_frames: Size of the camera's ring buffer in frames (default is 8).
+        :param timeout: Time in seconds to wait for each frame (default is 5 s).
+        :return: A generator of (frame_index, frame) tuples.
         """
-        self.cam.set_exposure(exposure_time)
-        exps = []
-        for i in range(averages):
-            exps.append(self.cam.snap())
-        return np.mean(exps, axis=0)
+        self.set_exposure(exposure_time)
+        self.stream_status = {}
+        return stream_frames(self.cam, n_frames=n_frames, buffer_frames=buffer_frames, timeout=timeout,
+                             status=self.stream_status)
 
     def multi_exposure(self, start_exposure=1e-4, doubles=10, discard_ratio=0.2):
         """
@@ -171,25 +372,21 @@ class Camera_BA():
 
         :param start_exposure: Initial exposure time in seconds (default is 0.0001 s).
         :param doubles: Number of times the exposure is doubled (default is 10).
-        :param discard_ratio: The percentage of extreme pixel values to discard (default is 0.2).
-        :return: The mean image after processing multiple exposures.
+        :param discard_ratio: The fraction of the pixel range at each end that is discarded (default is 0.2).
+        :return: The merged image, normalised to the starting exposure (NaN where no exposure was usable).
         """
-        raw_data = []
+        merger = HDRMerge(self.frame_shape, self.max_val, discard_ratio)
         for i in range(doubles):
-            self.cam.set_exposure(start_exposure * 2 ** i)
-            temp = self.cam.snap().astype(np.float32)
-            temp[temp >= self.max_val * (1 - discard_ratio)] = np.NaN
-            temp[temp <= self.max_val * discard_ratio] = np.NaN
-            raw_data.append(temp / (2 ** i))
-        raw_data = np.array(raw_data)
-        mean_data = np.nanmean(raw_data, axis=0)
-        return mean_data
+            self.set_exposure(start_exposure * 2 ** i)
+            merger.add(self.cam.snap(), 2 ** i)
+        return merger.result()
 
     def close(self):
         """
         Closes the camera connection. This method should be called after finishing camera operations.
         """
         self.cam.close()
+        shadow_state.unregister(self.state)
 
 
 def live_time_lapse():
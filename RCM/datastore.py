@@ -0,0 +1,266 @@
+# Import necessary libraries
+import os  # For file and directory operations
+import json  # For the metadata of spectral maps
+import h5py  # For reading and writing chunked HDF5 files
+import numpy as np  # For array handling
+
+
+class HyperspectralStore:
+    """
+    A single-file, chunked HDF5 container for hyperspectral datacubes and time series.
+
+    Frames are stored in the dataset 'data' with axes (time, wavelength, y, x). Each frame is its own compressed chunk,
+    so a single band or a single timepoint can be read back without decoding the rest of the file. The wavelength
+    axis (nm) is stored once in 'wavelengths' and the start time of each timepoint (s) in 'timestamps'.
+
+    The time axis grows as timepoints are appended, so a store can be written frame by frame during an acquisition
+    and read back while it is still running.
+    """
+
+    def __init__(self, filename, wavelengths=None, frame_shape=None, mode='r', dtype=np.uint16,
+                 compression='gzip', compression_opts=4, attrs=None):
+        """
+        Opens an existing store or creates a new one.
+
+        Args:
+            filename (str): Path of the HDF5 file.
+            wavelengths (array-like): The wavelength axis in nm (required when creating a store).
+            frame_shape (tuple): The (height, width) of each frame (required when creating a store).
+            mode (str): 'r' to read, 'a' to append to an existing store, 'w' to create a new store (default: 'r').
+            dtype: Data type of the frames (default: np.uint16).
+            compression (str): HDF5 compression filter applied to each chunk, e.g. 'gzip', 'lzf' or None (default: 'gzip').
+            compression_opts (int): Compression level for 'gzip' (default: 4).
+            attrs (dict): Extra metadata stored as attributes of the data set when creating a store (default: None).
+        """
+        self.filename = filename
+        self.file = h5py.File(filename, mode)
+
+        if mode == 'w':
+            assert wavelengths is not None and frame_shape is not None, \
+                'HyperspectralStore: wavelengths and frame_shape are needed to create a store'
+            wavelengths = np.asarray(wavelengths, dtype=np.float64)
+            n_wl = len(wavelengths)
+            height, width = frame_shape
+
+            self.data = self.file.create_dataset(
+                'data', shape=(0, n_wl, height, width), maxshape=(None, n_wl, height, width), dtype=dtype,
+                chunks=(1, 1, height, width), compression=compression,
+                compression_opts=compression_opts if compression == 'gzip' else None)
+            self.data.attrs['axes'] = 'time,wavelength,y,x'
+
+            wl = self.file.create_dataset('wavelengths', data=wavelengths)
+            wl.attrs['units'] = 'nm'
+
+            ts = self.file.create_dataset('timestamps', shape=(0,), maxshape=(None,), dtype=np.float64, chunks=(1024,))
+            ts.attrs['units'] = 's'
+
+            for key, value in (attrs or {}).items():
+                self.data.attrs[key] = value
+        else:
+            self.data = self.file['data']
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def wavelengths(self):
+        """
+        The wavelength axis in nm.
+        """
+        return self.file['wavelengths'][()]
+
+    @property
+    def timestamps(self):
+        """
+        The start time of each timepoint in seconds.
+        """
+        return self.file['timestamps'][()]
+
+    @property
+    def n_timepoints(self):
+        """
+        The number of timepoints in the store.
+        """
+        return self.data.shape[0]
+
+    def append_timepoint(self, timestamp=np.nan):
+        """
+        Extends the time axis by one timepoint.
+
+        Args:
+            timestamp (float): Start time of the timepoint in seconds (default: NaN).
+
+        Returns:
+            int: The index of the new timepoint, to be passed to write_frame().
+        """
+        t_index = self.n_timepoints
+        self.data.resize(t_index + 1, axis=0)
+        timestamps = self.file['timestamps']
+        timestamps.resize(t_index + 1, axis=0)
+        timestamps[t_index] = timestamp
+        return t_index
+
+    def write_frame(self, index, frame):
+        """
+        Writes a single frame.
+
+        Args:
+            index (tuple): (time index, wavelength index) of the frame.
+            frame (np.ndarray): The (height, width) frame.
+        """
+        t_index, wl_index = index
+        self.data[t_index, wl_index] = frame
+
+    def read_frame(self, t_index, wl_index):
+        """
+        Reads a single frame.
+
+        Returns:
+            np.ndarray: The (height, width) frame.
+        """
+        return self.data[t_index, wl_index]
+
+    def read_band(self, wl_index):
+        """
+        Reads every timepoint of a single band.
+
+        Returns:
+            np.ndarray: A (time, height, width) array.
+        """
+        return self.data[:, wl_index]
+
+    def read_timepoint(self, t_index):
+        """
+        Reads the datacube of a single timepoint.
+
+        Returns:
+            np.ndarray: A (wavelength, height, width) array.
+        """
+        return self.data[t_index]
+
+    def flush(self):
+        """
+        Flushes buffered data to disk.
+        """
+        self.file.flush()
+
+    def close(self):
+        """
+        Closes the file.
+        """
+        self.file.close()
+
+
+class SpectralMapStore:
+    """
+    A binary store for the spectra of an X-Y scan, one spectrum per grid point.
+
+    The spectra are kept in a single (ny, nx, n_pixels) float32 array in 'spectra.npy', memory-mapped so that each
+    point is written in place as soon as it is acquired; the wavelength axis ('wavelengths.npy'), the grid offsets
+    ('x_um.npy', 'y_um.npy') and the stage position measured at each point ('positions_um.npy') are stored once
+    alongside. Points not acquired yet are NaN, so an interrupted scan keeps everything acquired so far and
+    `acquired` shows which points are missing.
+    """
+
+    def __init__(self, folder, wavelengths=None, x_um=None, y_um=None, mode='r', attrs=None):
+        """
+        Opens an existing store or creates a new one.
+
+        Args:
+            folder (str): Directory holding the store's files.
+            wavelengths (array-like): The wavelength axis in nm (required when creating a store).
+            x_um (array-like): The X offsets of the grid columns in micrometers (required when creating a store).
+            y_um (array-like): The Y offsets of the grid rows in micrometers (required when creating a store).
+            mode (str): 'r' to read, 'r+' to write to an existing store, 'w' to create a new store (default: 'r').
+            attrs (dict): Extra metadata saved to 'metadata.json' when creating a store (default: None).
+        """
+        self.folder = folder
+
+        if mode == 'w':
+            assert wavelengths is not None and x_um is not None and y_um is not None, \
+                'SpectralMapStore: wavelengths, x_um and y_um are needed to create a store'
+            os.makedirs(folder, exist_ok=True)
+            np.save(os.path.join(folder, 'wavelengths.npy'), np.asarray(wavelengths, dtype=np.float64))
+            np.save(os.path.join(folder, 'x_um.npy'), np.asarray(x_um, dtype=np.float64))
+            np.save(os.path.join(folder, 'y_um.npy'), np.asarray(y_um, dtype=np.float64))
+            shape = (len(y_um), len(x_um))
+
+            self.spectra = np.lib.format.open_memmap(os.path.join(folder, 'spectra.npy'), mode='w+',
+                                                     dtype=np.float32, shape=shape + (len(wavelengths),))
+            self.spectra[...] = np.nan
+            self.positions_um = np.lib.format.open_memmap(os.path.join(folder, 'positions_um.npy'), mode='w+',
+                                                          dtype=np.float64, shape=shape + (2,))
+            self.positions_um[...] = np.nan
+
+            with open(os.path.join(folder, 'metadata.json'), 'w') as file:
+                json.dump(attrs or {}, file, indent=2)
+        else:
+            self.spectra = np.load(os.path.join(folder, 'spectra.npy'), mmap_mode=mode)
+            self.positions_um = np.load(os.path.join(folder, 'positions_um.npy'), mmap_mode=mode)
+
+        self.wavelengths = np.load(os.path.join(folder, 'wavelengths.npy'))
+        self.x_um = np.load(os.path.join(folder, 'x_um.npy'))
+        self.y_um = np.load(os.path.join(folder, 'y_um.npy'))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def acquired(self):
+        """
+        A (ny, nx) boolean map of the points that have been written.
+        """
+        return ~np.isnan(self.positions_um[..., 0])
+
+    def write_point(self, y_idx, x_idx, spectrum, position_um=(np.nan, np.nan)):
+        """
+        Writes the spectrum of a single grid point.
+
+        Args:
+            y_idx (int): Row (Y) index of the point.
+            x_idx (int): Column (X) index of the point.
+            spectrum (array-like): The (n_pixels,) spectrum.
+            position_um (tuple): The (x, y) stage position in micrometers at which it was acquired.
+        """
+        self.spectra[y_idx, x_idx] = spectrum
+        # The position is written last, so a point only shows as acquired once its spectrum is in place
+        self.positions_um[y_idx, x_idx] = position_um
+
+    def flush(self):
+        """
+        Flushes the memory-mapped arrays to disk.
+        """
+        if isinstance(self.spectra, np.memmap) and self.spectra.mode != 'r':
+            self.spectra.flush()
+            self.positions_um.flush()
+
+    def close(self):
+        """
+        Flushes and releases the memory-mapped arrays.
+        """
+        self.flush()
+        self.spectra = None
+        self.positions_um = None
+
+
+def load_spectral_map(folder):
+    """
+    Loads a spectral map saved by SpectralMapStore in one read.
+
+    Args:
+        folder (str): Directory of the store.
+
+    Returns:
+        tuple: The wavelengths as a (n_pixels,) array, the measured stage positions as a (ny, nx, 2) array of
+        (x, y) in micrometers, and the spectra as a (ny, nx, n_pixels) float32 array (NaN for points not acquired).
+    """
+    wavelengths = np.load(os.path.join(folder, 'wavelengths.npy'))
+    positions_um = np.load(os.path.join(folder, 'positions_um.npy'))
+    spectra = np.load(os.path.join(folder, 'spectra.npy'))
+    return wavelengths, positions_um, spectra
@@ -0,0 +1,130 @@
+# Import necessary libraries
+import numpy as np  # For array handling and numerical computations
+
+
+class RunningAverage:
+    """
+    A constant-memory running average of camera frames.
+
+    Frames are folded into preallocated buffers as they arrive, so memory use does not grow with the number of
+    frames averaged. Without variance, frames are summed into a uint32 buffer (exact for up to 2**20 frames of
+    12-bit data). With variance, Welford's algorithm keeps a float32 running mean and sum of squared deviations,
+    giving a per-pixel noise estimate at no extra capture cost.
+    """
+
+    def __init__(self, shape, variance=False):
+        """
+        Args:
+            shape (tuple): The (height, width) of the frames.
+            variance (bool): If True, also track the per-pixel variance (default: False).
+        """
+        self.shape = tuple(shape)
+        self.track_variance = variance
+        self.count = 0
+        if variance:
+            self._mean = np.zeros(self.shape, dtype=np.float32)
+            self._m2 = np.zeros(self.shape, dtype=np.float32)
+            self._delta = np.empty(self.shape, dtype=np.float32)
+            self._scratch = np.empty(self.shape, dtype=np.float32)
+        else:
+            self._sum = np.zeros(self.shape, dtype=np.uint32)
+
+    def add(self, frame):
+        """
+        Adds a frame to the average.
+
+        Args:
+            frame (np.ndarray): A (height, width) frame.
+        """
+        self.count += 1
+        if not self.track_variance:
+            np.add(self._sum, frame, out=self._sum, casting='unsafe')
+            return
+
+        # Welford update, done in place on the preallocated buffers
+        np.subtract(frame, self._mean, out=self._delta, casting='unsafe')  # x - mean_old
+        np.multiply(self._delta, 1.0 / self.count, out=self._scratch)
+        self._mean += self._scratch  # mean_new = mean_old + (x - mean_old) / n
+        np.subtract(frame, self._mean, out=self._scratch, casting='unsafe')  # x - mean_new
+        self._scratch *= self._delta
+        self._m2 += self._scratch  # M2 += (x - mean_old) * (x - mean_new)
+
+    def mean(self):
+        """
+        Returns:
+            np.ndarray: The per-pixel mean of the frames added so far, as float32.
+        """
+        if self.track_variance:
+            return self._mean.copy()
+        return np.divide(self._sum, max(self.count, 1), dtype=np.float32)
+
+    def variance(self, ddof=1):
+        """
+        Args:
+            ddof (int): Delta degrees of freedom; 1 gives the unbiased sample variance (default: 1).
+
+        Returns:
+            np.ndarray: The per-pixel variance of the frames added so far, as float32.
+        """
+        assert self.track_variance, 'RunningAverage: variance was not tracked'
+        return self._m2 / max(self.count - ddof, 1)
+
+
+class HDRMerge:
+    """
+    A streaming high-dynamic-range merge of an exposure bracket.
+
+    Each exposure is folded into running weighted-sum and weight buffers as it arrives, so only a handful of
+    frame-sized float32 buffers are held regardless of the number of exposures. Every pixel is weighted by a hat
+    function of its raw value: well-exposed pixels mid-range count most, and the weight falls linearly to zero at
+    the discard thresholds near the noise floor and saturation.
+    """
+
+    def __init__(self, shape, max_val, discard_ratio=0.2):
+        """
+        Args:
+            shape (tuple): The (height, width) of the frames.
+            max_val (int): The saturation level of the camera in counts.
+            discard_ratio (float): Fraction of the range at each end given zero weight, below 0.5 (default: 0.2).
+        """
+        assert 0 <= discard_ratio < 0.5, 'HDRMerge: discard_ratio must be in [0, 0.5)'
+        self.shape = tuple(shape)
+        self.max_val = max_val
+        self.discard_ratio = discard_ratio
+        self._weighted_sum = np.zeros(self.shape, dtype=np.float32)
+        self._weights = np.zeros(self.shape, dtype=np.float32)
+        self._w = np.empty(self.shape, dtype=np.float32)
+        self._scratch = np.empty(self.shape, dtype=np.float32)
+
+    def add(self, frame, exposure_ratio):
+        """
+        Adds an exposure to the merge.
+
+        Args:
+            frame (np.ndarray): A (height, width) raw frame.
+            exposure_ratio (float): Exposure time of this frame relative to the reference exposure.
+        """
+        # Hat weight: 1 at mid-range, falling linearly to 0 at discard_ratio and 1 - discard_ratio of the range
+        w = self._w
+        np.multiply(frame, 1.0 / self.max_val, out=w, casting='unsafe')
+        w -= 0.5
+        np.abs(w, out=w)
+        w *= -1.0 / (0.5 - self.discard_ratio)
+        w += 1.0
+        np.maximum(w, 0.0, out=w)
+
+        # Accumulate the weighted, exposure-normalised signal
+        np.multiply(frame, 1.0 / exposure_ratio, out=self._scratch, casting='unsafe')
+        self._scratch *= w
+        self._weighted_sum += self._scratch
+        self._weights += w
+
+    def result(self):
+        """
+        Returns:
+            np.ndarray: The merged float32 image in counts at the reference exposure; NaN where no exposure was
+            usable.
+        """
+        merged = np.full(self.shape, np.nan, dtype=np.float32)
+        np.divide(self._weighted_sum, self._weights, out=merged, where=self._weights > 0)
+        return merged
@@ -2,6 +2,9 @@
 import pyvisa
 import time
 
+# Shadow state that skips redundant writes of unchanged LED settings.
+from statecache import shadow_state
+
 class DC2200:
     """
     A class to control the Thorlabs DC2200 LED controller using PyVISA.
@@ -14,17 +17,31 @@ class DC2200:
 
         The connection is made via PyVISA's resource manager. You must ensure that the correct USB serial number is provided for your device.
         """
-        # Opens a resource manager to manage connections to instruments.
-        self.rm = pyvisa.ResourceManager()
+        # Opens the resource manager and the connection to the device.
+        self.rm, self.instr = self._open_instrument()
 
-        # Opens the connection to the device using its unique USB identifier.
-        # Note: Replace the serial number in the USB string with your device's serial number.
-        self.instr = self.rm.open_resource('USB0::0x1313::0x80C8::M00960538::INSTR')
+        # Register the controller's shadow state; nothing is known about a freshly opened device.
+        self.state = shadow_state.register('DC2200')
 
         # Queries and prints the identification information for the connected device.
         # The *IDN? command returns the device identification.
         print("Used device:", self.instr.query("*IDN?"))
 
+    def _open_instrument(self):
+        """
+        Opens the VISA connection to the device (overridden by the simulated controller).
+
+        Returns:
+            tuple: The resource manager and the open instrument.
+        """
+        # Opens a resource manager to manage connections to instruments.
+        rm = pyvisa.ResourceManager()
+
+        # Opens the connection to the device using its unique USB identifier.
+        # Note: Replace the serial number in the USB string with your device's serial number.
+        instr = rm.open_resource('USB0::0x1313::0x80C8::M00960538::INSTR')
+        return rm, instr
+
     def set_brightness(self, percent=1.1):
         """
         Sets the brightness of the LED in constant current mode.
@@ -34,14 +51,12 @@ class DC2200:
 
         The brightness value is passed as a string command to the device, and the LED is set to constant current mode.
         """
-        # Set the LED controller to constant current mode (CB = Constant Brightness).
-        self.instr.write("SOURCE1:MODE CB")
-
-        # Create the command string for setting the brightness percentage.
-        command = "SOURCE1:CBRIGHTNESS:BRIGHTNESS " + str(percent)
+        # Set the LED controller to constant current mode (CB = Constant Brightness), unless it already is.
+        self.state.apply('mode', 'CB', lambda mode: self.instr.write("SOURCE1:MODE " + mode))
 
-        # Write the command to the device to set the brightness.
-        self.instr.write(command)
+        # Write the brightness percentage to the device, unless it is already set.
+        self.state.apply('brightness', percent,
+                         lambda value: self.instr.write("SOURCE1:CBRIGHTNESS:BRIGHTNESS " + str(value)))
 
         # Print confirmation of the brightness level.
         print('Set brightness to ' + str(percent) + '%')
@@ -51,7 +66,7 @@ class DC2200:
         Switches the LED on by sending the appropriate command to the DC2200 controller.
         """
         # Command to turn the LED output on.
-        self.instr.write("OUTPUT1:STATE ON")
+        self.state.apply('output', 'ON', lambda state: self.instr.write("OUTPUT1:STATE " + state))
         print("Switch LED on.")
 
     def off(self):
@@ -59,7 +74,7 @@ class DC2200:
         Switches the LED off by sending the appropriate command to the DC2200 controller.
         """
         # Command to turn the LED output off.
-        self.instr.write("OUTPUT1:STATE OFF")
+        self.state.apply('output', 'OFF', lambda state: self.instr.write("OUTPUT1:STATE " + state))
         print("Switch LED off.")
 
     def close(self):
@@ -73,6 +88,7 @@ class DC2200:
 
         # Closes the resource manager.
         self.rm.close()
+        shadow_state.unregister(self.state)
         print("Connection closed.")
 
 if __name__ == '__main__':
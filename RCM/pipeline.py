@@ -0,0 +1,206 @@
+# Import necessary libraries
+import queue  # Provides thread-safe bounded FIFO queues used to connect the stages
+import threading  # Provides the worker threads that run each stage
+import time  # Provides time-related functions
+from tracer import tracer  # Per-step timing trace
+
+# Sentinel passed down the queues to tell the next stage that no more items will arrive.
+_STOP = object()
+
+
+class AcquisitionPipeline:
+    """
+    A pipelined acquisition engine for hyperspectral datacubes.
+
+    The acquisition of each band is split into four stages, each running in its own thread and connected by
+    bounded queues:
+    - tune: sets the tunable filter to the next wavelength and waits for it to settle
+    - expose: exposes the camera and reads out the frame
+    - process: post-processes the frame (e.g. type conversion)
+    - write: writes the processed frame to disk
+
+    Tuning and exposure share the optical path, so the filter is only moved once the previous frame has been read
+    out. Processing and writing of frame n therefore run while the filter is tuned to, and the camera exposed at,
+    wavelength n + 1.
+    """
+
+    def __init__(self, tune, expose, process=None, write=None, settle_s=3e-2, queue_size=2):
+        """
+        Initializes the AcquisitionPipeline with the callables used by each stage.
+
+        Args:
+            tune (callable): tune(index, wavelength), sets the filter to the given wavelength.
+            expose (callable): expose(index, wavelength) -> frame, exposes and reads out a single frame.
+            process (callable, optional): process(index, wavelength, frame) -> frame, post-processes a frame
+                (default: None passes frames through unchanged).
+            write (callable, optional): write(index, wavelength, frame), saves a processed frame
+                (default: None does not write frames).
+            settle_s (float or callable): Time in seconds to wait after tuning before the exposure may start, or
+                settle_s(index, wavelength) -> seconds, e.g. from a calibrated SettlingModel (default: 30 ms).
+            queue_size (int): Maximum number of frames held between the post-exposure stages (default: 2).
+        """
+        self.tune = tune
+        self.expose = expose
+        self.process = process
+        self.write = write
+        self.settle_s = settle_s
+        self.queue_size = queue_size
+
+        # Accumulated busy time of each stage in seconds, updated by run().
+        self.stage_times = {}
+
+    def run(self, wavelengths):
+        """
+        Runs the pipeline over the given wavelengths and blocks until every frame has been processed and written.
+
+        Args:
+            wavelengths (iterable): The wavelengths to acquire, in acquisition order.
+
+        Returns:
+            list: The processed frames, in the same order as `wavelengths`.
+
+        Raises:
+            Exception: Re-raises the first exception raised by any of the stages.
+        """
+        wavelengths = list(wavelengths)
+        results = [None] * len(wavelengths)
+
+        self.stage_times = {'tune': 0.0, 'expose': 0.0, 'process': 0.0, 'write': 0.0}
+        self._abort = threading.Event()
+        self._errors = []
+
+        # The filter may only be moved once the camera has finished reading out the previous frame.
+        self._filter_free = threading.Semaphore(1)
+
+        # Queues connecting the stages; the tuned queue holds a single item since the filter can only be at one wavelength.
+        tuned_q = queue.Queue(maxsize=1)
+        raw_q = queue.Queue(maxsize=self.queue_size)
+        processed_q = queue.Queue(maxsize=self.queue_size)
+
+        stages = [
+            threading.Thread(target=self._tune_stage, args=(wavelengths, tuned_q), name='pipeline-tune'),
+            threading.Thread(target=self._expose_stage, args=(tuned_q, raw_q), name='pipeline-expose'),
+            threading.Thread(target=self._process_stage, args=(raw_q, processed_q, results), name='pipeline-process'),
+            threading.Thread(target=self._write_stage, args=(processed_q,), name='pipeline-write'),
+        ]
+        for stage in stages:
+            stage.start()
+        for stage in stages:
+            stage.join()
+
+        if self._errors:
+            raise self._errors[0]
+        return results
+
+    def _fail(self, err):
+        """
+        Records an exception raised in a stage and asks every stage to stop.
+        """
+        self._errors.append(err)
+        self._abort.set()
+
+    def _put(self, q, item):
+        """
+        Puts an item on a bounded queue, giving up if the pipeline has been aborted.
+        """
+        while not self._abort.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, q):
+        """
+        Gets an item from a queue, returning the stop sentinel if the pipeline has been aborted.
+        """
+        while not self._abort.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _STOP
+
+    def _tune_stage(self, wavelengths, tuned_q):
+        """
+        Tunes the filter to each wavelength in turn, once the camera has released the optical path.
+        """
+        try:
+            for index, wl in enumerate(wavelengths):
+                # Wait until the previous exposure has been read out.
+                while not self._filter_free.acquire(timeout=0.1):
+                    if self._abort.is_set():
+                        return
+                t_start = time.perf_counter()
+                with tracer.span('tune', 'pipeline', index=index, wavelength=wl):
+                    self.tune(index, wl)
+                settle_s = self.settle_s(index, wl) if callable(self.settle_s) else self.settle_s
+                with tracer.span('settle', 'pipeline', settle_s=settle_s):
+                    time.sleep(settle_s)  # Wait for the filter to settle
+                self.stage_times['tune'] += time.perf_counter() - t_start
+                self._put(tuned_q, (index, wl))
+        except Exception as err:
+            self._fail(err)
+        finally:
+            self._put(tuned_q, _STOP)
+
+    def _expose_stage(self, tuned_q, raw_q):
+        """
+        Exposes the camera at each tuned wavelength and hands the frame to the processing stage.
+        """
+        try:
+            while True:
+                item = self._get(tuned_q)
+                if item is _STOP:
+                    break
+                index, wl = item
+                t_start = time.perf_counter()
+                with tracer.span('expose', 'pipeline', index=index, wavelength=wl):
+                    frame = self.expose(index, wl)
+                self.stage_times['expose'] += time.perf_counter() - t_start
+                self._filter_free.release()  # The filter can now be moved to the next wavelength
+                self._put(raw_q, (index, wl, frame))
+        except Exception as err:
+            self._fail(err)
+        finally:
+            self._put(raw_q, _STOP)
+
+    def _process_stage(self, raw_q, processed_q, results):
+        """
+        Post-processes each frame, stores it in the results and hands it to the writing stage.
+        """
+        try:
+            while True:
+                item = self._get(raw_q)
+                if item is _STOP:
+                    break
+                index, wl, frame = item
+                t_start = time.perf_counter()
+                if self.process is not None:
+                    with tracer.span('process', 'pipeline', index=index, wavelength=wl):
+                        frame = self.process(index, wl, frame)
+                self.stage_times['process'] += time.perf_counter() - t_start
+                results[index] = frame
+                if self.write is not None:
+                    self._put(processed_q, (index, wl, frame))
+        except Exception as err:
+            self._fail(err)
+        finally:
+            self._put(processed_q, _STOP)
+
+    def _write_stage(self, processed_q):
+        """
+        Writes each processed frame to disk.
+        """
+        try:
+            while True:
+                item = self._get(processed_q)
+                if item is _STOP:
+                    break
+                index, wl, frame = item
+                t_start = time.perf_counter()
+                with tracer.span('write', 'pipeline', index=index, wavelength=wl):
+                    self.write(index, wl, frame)
+                self.stage_times['write'] += time.perf_counter() - t_start
+        except Exception as err:
+            self._fail(err)
@@ -0,0 +1,72 @@
+# Import necessary libraries
+import threading  # Provides the lock protecting the registry
+
+
+class DeviceRegistry:
+    """
+    A registry of persistent device sessions, opened on first use and shared by every caller.
+
+    Opening some devices is expensive (USB enumeration, opening the device, reading its configuration), so a device
+    is opened once and the same session is handed out until it is explicitly closed. Devices are registered with a
+    factory rather than opened up front, so an instrument that is not attached only fails when it is actually used.
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._closers = {}
+        self._devices = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, factory, close='close'):
+        """
+        Registers a device without opening it.
+
+        Args:
+            name (str): The name the device is looked up by.
+            factory (callable): Opens the device and returns its driver, e.g. the driver class.
+            close (str): Name of the driver method that closes the device (default: 'close').
+        """
+        with self._lock:
+            self._factories[name] = factory
+            self._closers[name] = close
+
+    def get(self, name):
+        """
+        Returns the session of a device, opening it if it is not open yet.
+
+        Args:
+            name (str): The name of a registered device.
+
+        Returns:
+            The device driver.
+        """
+        with self._lock:
+            if name not in self._devices:
+                if name not in self._factories:
+                    raise KeyError(f"DeviceRegistry: no device registered as '{name}'")
+                # Only cache the session once the factory has succeeded, so a failed open is retried next time
+                self._devices[name] = self._factories[name]()
+            return self._devices[name]
+
+    def is_open(self, name):
+        """
+        Returns True if the device has been opened and not closed since.
+        """
+        with self._lock:
+            return name in self._devices
+
+    def close(self, name):
+        """
+        Closes a device if it is open; the next get() opens a new session.
+        """
+        with self._lock:
+            device = self._devices.pop(name, None)
+            if device is not None:
+                getattr(device, self._closers[name])()
+
+    def close_all(self):
+        """
+        Closes every open device.
+        """
+        for name in list(self._devices):
+            self.close(name)
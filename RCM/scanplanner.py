@@ -0,0 +1,170 @@
+# Import necessary libraries
+from collections import namedtuple  # For lightweight records describing each scan point
+import numpy as np  # For resampling fly-scan lines
+
+# A point of a scan: its grid indices, its offset from the scan origin in micrometers,
+# and the relative move in micrometers needed to reach it from the previous point.
+ScanPoint = namedtuple('ScanPoint', ['x_idx', 'y_idx', 'x_um', 'y_um', 'dx_um', 'dy_um'])
+
+
+def plan_serpentine(x_step, y_step, x_points, y_points):
+    """
+    Plans a serpentine (boustrophedon) raster over an X-Y grid starting at the current position.
+
+    Y is the fast axis: each column of Y points is visited in turn, alternating between increasing and decreasing Y,
+    so the stage never flies back across the grid. Only the minimal relative move is made between consecutive points,
+    and the first point is the current position.
+
+    Args:
+        x_step (float): The step size in micrometers between points in the X direction.
+        y_step (float): The step size in micrometers between points in the Y direction.
+        x_points (int): The number of points in the X direction.
+        y_points (int): The number of points in the Y direction.
+
+    Returns:
+        list: The ScanPoints in visiting order.
+    """
+    plan = []
+    x_prev, y_prev = 0.0, 0.0
+    for x_idx in range(x_points):
+        y_indices = range(y_points) if x_idx % 2 == 0 else reversed(range(y_points))
+        for y_idx in y_indices:
+            x_um = x_step * x_idx
+            y_um = y_step * y_idx
+            plan.append(ScanPoint(x_idx, y_idx, x_um, y_um, x_um - x_prev, y_um - y_prev))
+            x_prev, y_prev = x_um, y_um
+    return plan
+
+
+def estimate_scan(plan, motion_models=None, dwell_s=0.0):
+    """
+    Estimates the total stage travel and the duration of a scan before it starts.
+
+    Args:
+        plan (list): The ScanPoints of the scan, e.g. from plan_serpentine().
+        motion_models (tuple, optional): The (X, Y) MotionModels of the stage axes, e.g.
+            `controller.motion_models[:2]` (default: None only estimates the travel).
+        dwell_s (float): Time spent at each point, e.g. the spectrometer integration time (default: 0).
+
+    Returns:
+        dict: The X, Y and total travel in micrometers, the number of moves, and the estimated duration
+        in seconds (None if no motion models were given).
+    """
+    travel_x_um = sum(abs(point.dx_um) for point in plan)
+    travel_y_um = sum(abs(point.dy_um) for point in plan)
+    n_moves = sum((point.dx_um != 0) + (point.dy_um != 0) for point in plan)
+
+    duration_s = None
+    if motion_models is not None:
+        model_x, model_y = motion_models
+        # The X and Y moves are made one after the other, so their times add up
+        duration_s = len(plan) * dwell_s
+        for point in plan:
+            if point.dx_um != 0:
+                duration_s += model_x.predict_s(point.dx_um)
+            if point.dy_um != 0:
+                duration_s += model_y.predict_s(point.dy_um)
+
+    return {
+        'travel_x_um': travel_x_um,
+        'travel_y_um': travel_y_um,
+        'travel_um': travel_x_um + travel_y_um,
+        'moves': n_moves,
+        'duration_s': duration_s,
+    }
+
+
+def plan_wavelength_order(wavelengths, start_wavelength=None, transition_cost=None):
+    """
+    Plans the order in which to tune the filter through a set of bands, to minimise the total transition cost.
+
+    The bands are swept monotonically, either blue to red or red to blue, whichever costs less starting from the
+    wavelength the filter is currently tuned to. In repeated sweeps, e.g. a time series, this alternates the sweep
+    direction so that no sweep starts with a jump across the whole range. Ties are broken by the total wavelength
+    travel, then in favour of the ascending order.
+
+    Args:
+        wavelengths (array-like): The wavelengths of the bands in nanometers, in canonical (storage) order.
+        start_wavelength (float): The wavelength the filter is tuned to before the sweep, or None if unknown
+            (default: None keeps the ascending order).
+        transition_cost (callable): transition_cost(from_wavelength, to_wavelength) -> cost of a filter change,
+            e.g. its settling time (default: None uses the jump in nanometers).
+
+    Returns:
+        np.ndarray: The canonical indices of the bands in acquisition order.
+    """
+    wavelengths = np.asarray(wavelengths, dtype=float)
+    ascending = np.argsort(wavelengths, kind='stable')
+    if start_wavelength is None:
+        return ascending
+    if transition_cost is None:
+        transition_cost = lambda a, b: abs(b - a)
+
+    def total_cost(order):
+        path = [start_wavelength] + list(wavelengths[order])
+        cost = sum(transition_cost(a, b) for a, b in zip(path[:-1], path[1:]))
+        travel = sum(abs(b - a) for a, b in zip(path[:-1], path[1:]))
+        return cost, travel
+
+    descending = ascending[::-1]
+    return descending if total_cost(descending) < total_cost(ascending) else ascending
+
+
+def bin_fly_line(sample_times_s, spectra, trace, x_start_um, x_length_um, x_bins, n_pixels=None):
+    """
+    Resamples the spectra of one fly-scan line onto a regular grid of X bins.
+
+    Each spectrum is tagged with the stage position interpolated from the timestamped encoder reads at its
+    acquisition time, and the spectra falling in each bin are averaged. Spectra acquired before the first or after
+    the last encoder read of the move have no known position and are dropped, rather than being assigned to the
+    position at either end of the move. A spectrum acquired exactly at the end of the line goes into the last bin.
+
+    Args:
+        sample_times_s (array-like): The (n,) acquisition times of the spectra, on the same clock as the trace.
+        spectra (array-like): The (n, n_pixels) spectra.
+        trace (list): The (time_s, position_um) encoder reads of the move, e.g. from Controller.wait_for_move().
+        x_start_um (float): Stage position of the start of the line in micrometers.
+        x_length_um (float): Length of the line in micrometers.
+        x_bins (int): Number of bins along the line.
+        n_pixels (int): Number of pixels of each spectrum, needed if no spectrum was acquired during the line
+            (default: None takes it from `spectra`).
+
+    Returns:
+        tuple: The (n,) interpolated positions of the spectra relative to the start of the line (NaN for spectra
+        acquired outside the move), the (x_bins, n_pixels) binned spectra (NaN for empty bins), and the (x_bins,)
+        number of spectra in each bin.
+
+    Raises:
+        RuntimeError: If the trace has fewer than two encoder reads, so that no position can be interpolated.
+    """
+    trace = np.asarray(trace, dtype=np.float64).reshape(-1, 2)
+    if len(trace) < 2:
+        raise RuntimeError(f"bin_fly_line: the trace has {len(trace)} encoder reads, at least 2 are needed")
+    trace_times_s, trace_um = trace.T
+    sample_times_s = np.asarray(sample_times_s, dtype=np.float64)
+
+    # No spectrum completed during the line (e.g. a short line or a long exposure): every bin is empty
+    if len(sample_times_s) == 0:
+        assert n_pixels is not None, 'bin_fly_line: n_pixels is needed when no spectrum was acquired'
+        return (np.empty(0), np.full((x_bins, n_pixels), np.nan, dtype=np.float32),
+                np.zeros(x_bins, dtype=np.int64))
+    spectra = np.asarray(spectra, dtype=np.float32).reshape(len(sample_times_s), -1)
+
+    # np.interp would clamp samples outside the trace to its end positions, so leave them without a position
+    during_move = (sample_times_s >= trace_times_s[0]) & (sample_times_s <= trace_times_s[-1])
+    x_um = np.full(sample_times_s.shape, np.nan)
+    x_um[during_move] = np.interp(sample_times_s[during_move], trace_times_s, trace_um) - x_start_um
+
+    # Sum the spectra into their bins, dropping any acquired outside the move or outside the line
+    bins = np.zeros(x_um.shape, dtype=int)
+    bins[during_move] = np.floor(x_um[during_move] / x_length_um * x_bins)
+    at_end = during_move & (x_um == x_length_um)  # The arrival position belongs to the last bin
+    bins[at_end] = x_bins - 1
+    valid = during_move & (bins >= 0) & (bins < x_bins)
+    sums = np.zeros((x_bins, spectra.shape[1]), dtype=np.float32)
+    counts = np.bincount(bins[valid], minlength=x_bins)
+    np.add.at(sums, bins[valid], spectra[valid])
+
+    binned = np.full_like(sums, np.nan)
+    np.divide(sums, counts[:, None], out=binned, where=counts[:, None] > 0)
+    return x_um, binned, counts
@@ -0,0 +1,113 @@
+# Import necessary libraries
+import threading  # For interrupting the wait for the next deadline
+import time  # Provides the monotonic clock
+from collections import namedtuple  # For lightweight records of each timepoint
+
+# A timepoint of a schedule: its index on the nominal grid, and its planned and actual start times in seconds
+# from the start of the schedule.
+Tick = namedtuple('Tick', ['index', 'planned_s', 'actual_s'])
+
+
+class DeadlineScheduler:
+    """
+    Fires timepoints on a fixed grid of absolute deadlines, t0 + index * interval, on a monotonic clock.
+
+    Each deadline is computed from the start time rather than from the previous timepoint, so small delays do not
+    accumulate, and the scheduler sleeps until the next deadline instead of polling. When a timepoint overruns
+    past one or more later deadlines, the overrun policy decides what happens:
+
+    - 'skip': the missed deadlines are dropped and the schedule resumes at the next deadline still ahead, so every
+      timepoint stays on the nominal grid.
+    - 'catch_up': the missed timepoints are fired immediately, one after the other, until the schedule is back on time.
+    - 'stretch': the next timepoint is fired immediately and the rest of the grid is shifted by the delay, keeping
+      the interval between timepoints but not their absolute times.
+
+    Every timepoint is logged with its planned and actual start times, and skipped ones are logged as well.
+
+    Example:
+        scheduler = DeadlineScheduler(interval_s=10, total_s=3600, overrun='skip')
+        for tick in scheduler:
+            acquire(tick.index, tick.actual_s)
+        print(scheduler.summary())
+    """
+
+    POLICIES = ('skip', 'catch_up', 'stretch')
+
+    def __init__(self, interval_s, total_s, overrun='skip', clock=time.monotonic):
+        """
+        Args:
+            interval_s (float): Interval between timepoints in seconds.
+            total_s (float): Duration of the schedule in seconds; timepoints are fired at 0, interval_s, ...
+                up to and including total_s.
+            overrun (str): The overrun policy, 'skip', 'catch_up' or 'stretch' (default: 'skip').
+            clock (callable): The monotonic clock, in seconds (default: time.monotonic).
+        """
+        assert overrun in self.POLICIES, f'DeadlineScheduler: overrun must be one of {self.POLICIES}'
+        assert interval_s > 0, 'DeadlineScheduler: interval_s must be positive'
+        self.interval_s = interval_s
+        self.n_points = int(total_s / interval_s + 1e-9) + 1  # Tolerate rounding, e.g. 1.0 / 0.1
+        self.overrun = overrun
+        self.clock = clock
+        self.log = []  # (index, planned_s, actual_s, status) of every timepoint, status 'fired' or 'skipped'
+        self._stop = threading.Event()
+
+    def stop(self):
+        """
+        Ends the schedule after the current timepoint; safe to call from another thread.
+        """
+        self._stop.set()
+
+    def __iter__(self):
+        t0 = self.clock()
+        offset_s = 0.0  # Shift of the grid accumulated by the 'stretch' policy
+        index = 0
+        while index < self.n_points and not self._stop.is_set():
+            planned_s = index * self.interval_s + offset_s
+
+            # Sleep until the deadline; the wait returns early if the schedule is stopped
+            wait_s = t0 + planned_s - self.clock()
+            if wait_s > 0 and self._stop.wait(wait_s):
+                break
+
+            actual_s = self.clock() - t0
+            self.log.append((index, planned_s, actual_s, 'fired'))
+            yield Tick(index, planned_s, actual_s)
+
+            # Handle an overrun of the timepoint past the next deadline(s)
+            index += 1
+            now_s = self.clock() - t0
+            next_planned_s = index * self.interval_s + offset_s
+            if now_s > next_planned_s and index < self.n_points:
+                if self.overrun == 'skip':
+                    while index < self.n_points and index * self.interval_s + offset_s < now_s:
+                        self.log.append((index, index * self.interval_s + offset_s, None, 'skipped'))
+                        index += 1
+                elif self.overrun == 'stretch':
+                    offset_s += now_s - next_planned_s
+                # 'catch_up' fires the missed timepoints immediately, as their deadlines have passed
+
+    def summary(self):
+        """
+        Returns:
+            dict: The number of timepoints fired and skipped, and the mean and maximum lateness of the fired
+            timepoints in seconds.
+        """
+        lateness = [actual - planned for _, planned, actual, status in self.log if status == 'fired']
+        return {
+            'fired': len(lateness),
+            'skipped': sum(status == 'skipped' for *_, status in self.log),
+            'mean_late_s': sum(lateness) / len(lateness) if lateness else 0.0,
+            'max_late_s': max(lateness, default=0.0),
+        }
+
+    def save_log(self, filename):
+        """
+        Saves the planned and actual start time of every timepoint to a CSV file.
+
+        Args:
+            filename (str): Path of the CSV file.
+        """
+        with open(filename, 'w') as file:
+            file.write('index,planned_s,actual_s,status\n')
+            for index, planned_s, actual_s, status in self.log:
+                file.write(f"{index},{planned_s:.6f},{'' if actual_s is None else f'{actual_s:.6f}'},{status}\n")
@@ -0,0 +1,265 @@
+# Import necessary libraries
+import json  # For the on-disk cache of the calibration
+import os  # For the default cache location
+import time  # Provides time-related functions
+import numpy as np  # For interpolating the settling table
+
+# Default location of the cached calibration, next to the drivers.
+DEFAULT_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'filter_settling.json')
+
+# Names of the KURIOS bandwidth modes, used in the cache file and printouts.
+BANDWIDTH_NAMES = {1: 'BLACK', 2: 'WIDE', 4: 'MEDIUM', 8: 'NARROW'}
+
+
+class SettlingModel:
+    """
+    The measured settling time of the tunable filter as a function of the wavelength jump and bandwidth mode.
+
+    For each calibrated bandwidth mode the model holds a table of settling times at increasing jump sizes, and
+    settle_time() interpolates it linearly (jumps beyond the table use its last entry), multiplied by a safety
+    margin and never less than `min_s`. Until a mode has been calibrated, the fixed `default_s` is used for it.
+
+    Example:
+        model = SettlingModel.load()  # Cached calibration, or the 30 ms default
+        time.sleep(model.settle_time(420, 730, bandwidth=8))
+    """
+
+    def __init__(self, table=None, default_s=3e-2, margin=1.2, min_s=5e-3, info=None):
+        """
+        Args:
+            table (dict): {bandwidth: (jumps_nm, settle_s)}, the settling times measured at increasing jump sizes
+                for each bandwidth mode (default: None, not calibrated).
+            default_s (float): Settling time in seconds used for modes that have not been calibrated (default: 30 ms).
+            margin (float): Factor applied to the measured settling times (default: 1.2).
+            min_s (float): Shortest settling time in seconds waited after any wavelength change (default: 5 ms).
+            info (dict): Details of the calibration saved with it, e.g. the method and date (default: None).
+        """
+        self.table = {int(bw): (np.asarray(jumps, dtype=float), np.asarray(settle, dtype=float))
+                      for bw, (jumps, settle) in (table or {}).items()}
+        self.default_s = default_s
+        self.margin = margin
+        self.min_s = min_s
+        self.info = info or {}
+
+    @property
+    def calibrated(self):
+        """
+        bool: Whether at least one bandwidth mode has been calibrated.
+        """
+        return bool(self.table)
+
+    def settle_time(self, from_wavelength, to_wavelength, bandwidth=None):
+        """
+        Returns the time to wait for the filter to settle after a wavelength change.
+
+        Args:
+            from_wavelength (float): The previous wavelength in nanometers, or None if unknown (the largest
+                calibrated jump is assumed).
+            to_wavelength (float): The new wavelength in nanometers.
+            bandwidth (int): The bandwidth mode (1 = BLACK; 2 = WIDE; 4 = MEDIUM; 8 = NARROW), or None if unknown
+                (the slowest calibrated mode is assumed) (default: None).
+
+        Returns:
+            float: The settling time in seconds (0 if the wavelength is unchanged, otherwise at least `min_s`).
+        """
+        if from_wavelength is not None and int(from_wavelength) == int(to_wavelength):
+            return 0.0  # The filter is not moved
+        if bandwidth is None:
+            modes = list(self.table)
+        else:
+            modes = [bandwidth]
+        if not modes or any(mode not in self.table for mode in modes):
+            return self.default_s
+
+        settle_s = 0.0
+        for mode in modes:
+            jumps, settle = self.table[mode]
+            jump = jumps[-1] if from_wavelength is None else abs(to_wavelength - from_wavelength)
+            settle_s = max(settle_s, float(np.interp(jump, jumps, settle)))
+        return max(self.margin * settle_s, self.min_s)
+
+    def save(self, filename=DEFAULT_CACHE):
+        """
+        Saves the calibration to a JSON file.
+
+        Args:
+            filename (str): Path of the JSON file (default: 'filter_settling.json' next to the drivers).
+        """
+        data = {
+            'default_s': self.default_s,
+            'margin': self.margin,
+            'min_s': self.min_s,
+            'info': self.info,
+            'table': {BANDWIDTH_NAMES.get(bw, str(bw)): {'jumps_nm': jumps.tolist(), 'settle_s': settle.tolist()}
+                      for bw, (jumps, settle) in self.table.items()},
+        }
+        with open(filename, 'w') as file:
+            json.dump(data, file, indent=2)
+
+    @classmethod
+    def load(cls, filename=DEFAULT_CACHE, default_s=3e-2):
+        """
+        Loads a calibration saved by save().
+
+        Args:
+            filename (str): Path of the JSON file (default: 'filter_settling.json' next to the drivers).
+            default_s (float): Settling time in seconds if there is no cached calibration (default: 30 ms).
+
+        Returns:
+            SettlingModel: The cached calibration, or an uncalibrated model if the file does not exist.
+        """
+        if not os.path.exists(filename):
+            return cls(default_s=default_s)
+        with open(filename) as file:
+            data = json.load(file)
+        modes = {name: bw for bw, name in BANDWIDTH_NAMES.items()}
+        table = {modes.get(name) or int(name): (entry['jumps_nm'], entry['settle_s'])
+                 for name, entry in data['table'].items()}
+        return cls(table, default_s=data.get('default_s', default_s), margin=data.get('margin', 1.2),
+                   min_s=data.get('min_s', 5e-3), info=data.get('info'))
+
+
+# Fewest frames that must fit in the measurement window for the 'image' method to resolve the settling.
+MIN_IMAGE_FRAMES = 10
+
+
+def _image_settle_time(camera, exposure_time, t_set, timeout_s, tolerance):
+    """
+    Measures the settling time from the mean intensity of back-to-back camera frames after a wavelength change.
+
+    Frames are captured until `timeout_s` after the change; the final intensity is the median of the last three
+    frames, and the filter is taken as settled at the start of the first frame from which every frame is within
+    `tolerance` (relative) of it.
+
+    Returns:
+        float: The settling time in seconds from `t_set`, or None if no frame differs from the final intensity,
+        i.e. the transition could not be seen (e.g. a dark or saturated target).
+
+    Raises:
+        RuntimeError: If fewer than MIN_IMAGE_FRAMES frames fit in `timeout_s`.
+    """
+    starts, levels = [], []
+    while not starts or starts[-1] - t_set < timeout_s:
+        t_start = time.perf_counter()
+        frame = camera.single_exposure(exposure_time=exposure_time)
+        starts.append(t_start)
+        levels.append(float(np.mean(frame)))
+    if len(starts) < MIN_IMAGE_FRAMES:
+        raise RuntimeError(f"calibrate_settling: only {len(starts)} frames of {exposure_time} s fit in "
+                           f"{timeout_s} s, at least {MIN_IMAGE_FRAMES} are needed; shorten the exposure")
+
+    final = np.median(levels[-3:])
+    unstable = np.abs(np.asarray(levels) - final) > tolerance * max(abs(final), 1e-12)
+    if not unstable.any():
+        return None  # No transition detected
+    last_unstable = np.nonzero(unstable)[0][-1]
+    if last_unstable + 1 >= len(starts):
+        return timeout_s  # Never settled within the timeout
+    return starts[last_unstable + 1] - t_set
+
+
+def calibrate_settling(tunable_filter, bandwidths=(2, 4, 8), jumps_nm=(1, 5, 10, 20, 50, 100, 200, 310),
+                       wavelength_range=(420, 730), repeats=3, method='image', camera=None, exposure_time=1e-3,
+                       timeout_s=1.0, tolerance=0.01, margin=1.2):
+    """
+    Measures the settling time of the tunable filter for a range of wavelength jumps in each bandwidth mode.
+
+    Each jump is measured upwards from the bottom of the range and downwards from its top, `repeats` times, and the
+    slowest measurement is kept. Two methods are available:
+
+    - 'image': captures back-to-back frames with `camera` and waits for the mean intensity to stabilise. The
+      sample should be a bright, spectrally smooth target (e.g. a white reference) and the exposure short. This
+      measures the optical settling itself. If a measurement shows no transition at all, the bandwidth mode is
+      left uncalibrated (it keeps the model's default settling time) and a warning is printed.
+    - 'poll': polls KuriosGetStatus / KuriosGetWavelength until the filter is ready at the new wavelength (see
+      TunableFilter.wait_settled()). This only measures how long the controller takes to report the new
+      wavelength, so it is refused if the largest jump settles within two polls, i.e. if the controller reports
+      the new wavelength immediately.
+
+    Args:
+        tunable_filter (TunableFilter): The opened tunable filter.
+        bandwidths (iterable): Bandwidth modes to calibrate (1 = BLACK; 2 = WIDE; 4 = MEDIUM; 8 = NARROW)
+            (default: WIDE, MEDIUM and NARROW).
+        jumps_nm (iterable): Wavelength jumps to measure in nanometers, in increasing order.
+        wavelength_range (tuple): The tuning range of the filter in nanometers (default: (420, 730)).
+        repeats (int): Number of measurements of each jump and direction (default: 3).
+        method (str): 'image' or 'poll' (default: 'image').
+        camera (Camera_HS): The camera used by the 'image' method (default: None).
+        exposure_time (float): Exposure time of the camera in seconds for the 'image' method (default: 1 ms).
+        timeout_s (float): Longest settling time measured, in seconds (default: 1 s).
+        tolerance (float): Relative intensity change taken as settled by the 'image' method (default: 1%).
+        margin (float): Safety factor of the returned model (default: 1.2).
+
+    Returns:
+        SettlingModel: The calibrated model; save it with SettlingModel.save().
+
+    Raises:
+        RuntimeError: With the 'poll' method, if the filter reports the new wavelength as fast as it answers any
+            command, so that polling cannot measure the settling; with the 'image' method, if the exposure is too
+            long for MIN_IMAGE_FRAMES frames to fit in `timeout_s`.
+    """
+    assert method in ('poll', 'image'), "calibrate_settling: method must be 'poll' or 'image'"
+    assert method == 'poll' or camera is not None, "calibrate_settling: the 'image' method needs a camera"
+    low, high = wavelength_range
+    jumps_nm = [jump for jump in jumps_nm if 0 < jump <= high - low]
+
+    def measure(start, target):
+        # Park at the start wavelength until any previous move has settled
+        tunable_filter.set_wavelength(int(start))
+        if method == 'poll':
+            tunable_filter.wait_settled(int(start), timeout_s=timeout_s)
+        else:
+            time.sleep(timeout_s)
+        tunable_filter.set_wavelength(int(target))
+        t_set = time.perf_counter()
+        if method == 'poll':
+            settle_s = tunable_filter.wait_settled(int(target), timeout_s=timeout_s)
+            return timeout_s if settle_s is None else settle_s
+        return _image_settle_time(camera, exposure_time, t_set, timeout_s, tolerance)
+
+    info = {'method': method, 'repeats': repeats, 'date': time.strftime('%Y-%m-%d %H:%M:%S')}
+    if method == 'poll':
+        # Polling can only resolve settling that lasts longer than a couple of polls (status and wavelength reads)
+        latencies = []
+        for _ in range(5):
+            t_start = time.perf_counter()
+            tunable_filter.get_status()
+            tunable_filter.get_wavelength()
+            latencies.append(time.perf_counter() - t_start)
+        latency_s = float(np.median(latencies))
+        info['poll_latency_s'] = latency_s
+        tunable_filter.set_bandwidth(max(bandwidths))  # The narrowest mode settles slowest
+        largest_s = measure(low, high)
+        if largest_s <= 2 * latency_s:
+            raise RuntimeError(f"calibrate_settling: a {high - low} nm jump was reported settled after "
+                               f"{1e3 * largest_s:.1f} ms, within two polls ({1e3 * latency_s:.1f} ms each); "
+                               "the filter reports the new wavelength immediately, use method='image'")
+
+    def worst_settle_time(jump):
+        # The slowest measurement of a jump in either direction, or None if any showed no transition
+        worst_s = 0.0
+        for start, target in ((low, low + jump), (high, high - jump)):
+            for _ in range(repeats):
+                settle_s = measure(start, target)
+                if settle_s is None:
+                    return None
+                worst_s = max(worst_s, settle_s)
+        return worst_s
+
+    table = {}
+    for bandwidth in bandwidths:
+        name = BANDWIDTH_NAMES.get(bandwidth, bandwidth)
+        tunable_filter.set_bandwidth(bandwidth)
+        settle = []
+        for jump in jumps_nm:
+            worst_s = worst_settle_time(jump)
+            if worst_s is None:
+                # A failed measurement must not be cached as an instant settle
+                print(f"Settling {name} {jump} nm: no transition detected; {name} keeps the default settling time")
+                break
+            settle.append(worst_s)
+            print(f"Settling {name} {jump} nm: {1e3 * worst_s:.1f} ms")
+        else:
+            table[bandwidth] = ([0.0] + list(jumps_nm), [0.0] + settle)
+
+    return SettlingModel(table, margin=margin, info=info)
@@ -0,0 +1,674 @@
+# Simulated device backends for offline development and benchmarking.
+#
+# Each simulated device is a drop-in replacement for its hardware driver, with configurable latencies for exposure,
+# readout, stage motion and command round trips, so that acquisition throughput can be profiled on a machine with no
+# instruments attached. The simulation replaces only the lowest level (the pylablib camera, the serial port, the VISA
+# instrument, the KURIOS command library, the OceanDirect SDK) through each driver's _open_* hook, so that the real
+# driver code runs on top of it.
+
+# Import necessary libraries
+import collections  # For the frame ring buffer of the simulated camera
+import threading  # For the free-running acquisition of the simulated camera
+import time  # Provides time-related functions
+import numpy as np  # For array handling and numerical computations
+
+from camera import Camera_HS, Camera_BA  # Camera drivers run on top of the simulated pylablib camera
+from stage import Controller  # Stage driver runs on top of the simulated serial port
+from light import DC2200  # LED driver runs on top of the simulated VISA instrument
+from tunablefilter import TunableFilter  # Tunable filter driver runs on top of the simulated KURIOS library
+from spectrometer_VIS import Ocean_Spectrometer  # Spectrometer driver runs on top of the simulated OceanDirect SDK
+
+
+# Frame metadata returned by SimulatedTLCamera.read_multiple_images(return_info=True).
+TFrameInfo = collections.namedtuple('TFrameInfo', ['frame_index'])
+
+# Ring buffer status returned by SimulatedTLCamera.get_frames_status().
+TFramesStatus = collections.namedtuple('TFramesStatus', ['acquired', 'unread', 'skipped', 'buffer_size'])
+
+
+class SimulatedTLCamera:
+    """
+    A stand-in for pylablib's ThorlabsTLCamera that renders a synthetic image after a realistic delay.
+
+    Exposure times are in seconds, as in pylablib. A snap takes the exposure time plus the readout time, which scales
+    with the number of rows in the region of interest. In continuous acquisition, exposure and readout overlap, so
+    frames arrive every max(exposure, readout) seconds into a ring buffer; frames not read in time are overwritten.
+    """
+
+    def __init__(self, sensor_shape=(2616, 4096), readout_s=0.05, max_val=4095, full_well_counts_per_s=2e4):
+        """
+        Args:
+            sensor_shape (tuple): The (height, width) of the full sensor (default: (2616, 4096)).
+            readout_s (float): Readout time of the full sensor in seconds (default: 0.05).
+            max_val (int): Saturation level in counts (default: 4095).
+            full_well_counts_per_s (float): Count rate at the brightest point of the synthetic image (default: 2e4).
+        """
+        self.sensor_shape = sensor_shape
+        self.readout_s = readout_s
+        self.max_val = max_val
+        self.full_well_counts_per_s = full_well_counts_per_s
+        self.exposure = 1e-2
+        self.roi = (0, sensor_shape[1], 0, sensor_shape[0], 1, 1)
+        self._opened = False
+        self._pattern = None
+
+        # Continuous acquisition state
+        self._buffer_frames = 100
+        self._buffer = collections.deque()
+        self._acquired = 0
+        self._next_read = 0
+        self._acquiring = False
+        self._thread = None
+        self._new_frame = threading.Condition()
+
+    def open(self):
+        self._opened = True
+
+    def close(self):
+        self._opened = False
+
+    def is_opened(self):
+        return self._opened
+
+    def set_exposure(self, exposure):
+        self.exposure = exposure
+        return self.exposure
+
+    def get_exposure(self):
+        return self.exposure
+
+    def set_roi(self, hstart=0, hend=None, vstart=0, vend=None, hbin=1, vbin=1):
+        height, width = self.sensor_shape
+        hend = width if hend is None else min(hend, width)
+        vend = height if vend is None else min(vend, height)
+        self.roi = (hstart, hend, vstart, vend, hbin, vbin)
+        self._pattern = None
+        return self.roi
+
+    def get_roi(self):
+        return self.roi
+
+    def get_data_dimensions(self):
+        hstart, hend, vstart, vend, hbin, vbin = self.roi
+        return (vend - vstart) // vbin, (hend - hstart) // hbin
+
+    def _render(self):
+        """
+        Renders a frame: a smooth Gaussian spot on a dim background, scaled by the exposure time.
+        """
+        if self._pattern is None:
+            hstart, hend, vstart, vend, hbin, vbin = self.roi
+            height, width = self.sensor_shape
+            y = (np.arange(vstart, vend, vbin, dtype=np.float32) - height / 2) / (height / 4)
+            x = (np.arange(hstart, hend, hbin, dtype=np.float32) - width / 2) / (width / 4)
+            rows, cols = self.get_data_dimensions()
+            spot = np.exp(-y[:rows, None] ** 2) * np.exp(-x[None, :cols] ** 2)
+            self._pattern = (self.full_well_counts_per_s * (0.05 + 0.95 * spot) * hbin * vbin).astype(np.float32)
+        frame = self._pattern * self.exposure
+        np.clip(frame, 0, self.max_val, out=frame)
+        return frame.astype(np.uint16)
+
+    def _frame_readout_s(self):
+        """
+        Returns the readout time of the current region of interest.
+        """
+        rows = self.get_data_dimensions()[0] * self.roi[5]
+        return self.readout_s * rows / self.sensor_shape[0]
+
+    def snap(self, timeout=5.0):
+        t_start = time.perf_counter()
+        frame = self._render()
+        remaining_s = t_start + self.exposure + self._frame_readout_s() - time.perf_counter()
+        if remaining_s > 0:
+            time.sleep(remaining_s)
+        return frame
+
+    def setup_acquisition(self, nframes=100):
+        self._buffer_frames = nframes
+
+    def start_acquisition(self, frames_per_trigger='default', auto_start=True, nframes=None):
+        if nframes is not None:
+            self.setup_acquisition(nframes)
+        self.stop_acquisition()
+        self._buffer = collections.deque(maxlen=self._buffer_frames)
+        self._acquired = 0
+        self._next_read = 0
+        self._acquiring = True
+        self._thread = threading.Thread(target=self._acquisition_loop, name='simulated-camera', daemon=True)
+        self._thread.start()
+
+    def _acquisition_loop(self):
+        """
+        Free-running acquisition: renders frames into the ring buffer at the continuous frame rate.
+        """
+        period_s = max(self.exposure, self._frame_readout_s())
+        next_s = time.perf_counter() + self.exposure + self._frame_readout_s()
+        while self._acquiring:
+            frame = self._render()
+            remaining_s = next_s - time.perf_counter()
+            if remaining_s > 0:
+                time.sleep(remaining_s)
+            with self._new_frame:
+                self._buffer.append((self._acquired, frame))
+                self._acquired += 1
+                self._new_frame.notify_all()
+            next_s += period_s
+
+    def stop_acquisition(self):
+        self._acquiring = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def acquisition_in_progress(self):
+        return self._acquiring
+
+    def wait_for_frame(self, since='lastread', nframes=1, timeout=20.0, error_on_stopped=False):
+        with self._new_frame:
+            if not self._new_frame.wait_for(lambda: self._acquired >= self._next_read + nframes, timeout=timeout):
+                raise TimeoutError('SimulatedTLCamera: timeout waiting for frame')
+
+    def read_multiple_images(self, rng=None, peek=False, missing_frame='skip', return_info=False, return_rng=False):
+        with self._new_frame:
+            items = [(index, frame) for index, frame in self._buffer if index >= self._next_read]
+            if not peek:
+                self._next_read = self._acquired
+        frames = [frame for _, frame in items]
+        if return_info:
+            return frames, [TFrameInfo(index) for index, _ in items]
+        return frames
+
+    def get_frames_status(self):
+        with self._new_frame:
+            oldest = self._buffer[0][0] if self._buffer else self._acquired
+            unread = self._acquired - max(self._next_read, oldest)
+            skipped = max(0, oldest - self._next_read)
+            return TFramesStatus(self._acquired, unread, skipped, self._buffer_frames)
+
+
+class SimCamera_HS(Camera_HS):
+    """
+    Camera_HS running on a SimulatedTLCamera.
+    """
+
+    def __init__(self, readout_s=0.05):
+        """
+        Args:
+            readout_s (float): Readout time of the full sensor in seconds (default: 0.05).
+        """
+        self._readout_s = readout_s
+        super().__init__()
+
+    def _open_camera(self):
+        return SimulatedTLCamera(readout_s=self._readout_s)
+
+
+class SimCamera_BA(Camera_BA):
+    """
+    Camera_BA running on a SimulatedTLCamera.
+    """
+
+    def __init__(self, readout_s=0.05):
+        """
+        Args:
+            readout_s (float): Readout time of the full sensor in seconds (default: 0.05).
+        """
+        self._readout_s = readout_s
+        super().__init__()
+
+    def _open_camera(self):
+        return SimulatedTLCamera(readout_s=self._readout_s)
+
+
+class SimulatedMCM3000Port:
+    """
+    A stand-in for the serial port of a Thorlabs MCM3000 controller that speaks its binary protocol.
+
+    Each channel follows a trapezoidal velocity profile towards its target, so encoder reads during a move return
+    intermediate positions. Every command costs a fixed round-trip latency.
+    """
+
+    def __init__(self, um_per_count=0.2116667, velocity_um_s=1e3, acceleration_um_s2=5e3, latency_s=1e-3):
+        """
+        Args:
+            um_per_count (float): Micrometers per encoder count (default: 0.2116667, as the ZFM2030).
+            velocity_um_s (float): Maximum stage velocity in micrometers per second (default: 1e3).
+            acceleration_um_s2 (float): Stage acceleration in micrometers per second squared (default: 5e3).
+            latency_s (float): Round-trip latency of each command in seconds (default: 1 ms).
+        """
+        self.velocity = velocity_um_s / um_per_count  # counts/s
+        self.acceleration = acceleration_um_s2 / um_per_count  # counts/s^2
+        self.latency_s = latency_s
+        self._moves = [(0, 0, 0.0) for _ in range(3)]  # (start counts, target counts, start time) per channel
+        self._response = b''
+
+    def _counts(self, channel):
+        """
+        Returns the current encoder counts of a channel.
+        """
+        start, target, t_start = self._moves[channel]
+        d = abs(target - start)
+        t = time.perf_counter() - t_start
+        v, a = self.velocity, self.acceleration
+        if d < v ** 2 / a:  # Triangular profile
+            t_half = (d / a) ** 0.5
+            if t >= 2 * t_half:
+                return target
+            travelled = 0.5 * a * t ** 2 if t < t_half else d - 0.5 * a * (2 * t_half - t) ** 2
+        else:  # Trapezoidal profile
+            t_acc = v / a
+            t_total = d / v + t_acc
+            if t >= t_total:
+                return target
+            if t < t_acc:
+                travelled = 0.5 * a * t ** 2
+            elif t < t_total - t_acc:
+                travelled = 0.5 * v * t_acc + v * (t - t_acc)
+            else:
+                travelled = d - 0.5 * a * (t_total - t) ** 2
+        return int(round(start + travelled * (1 if target >= start else -1)))
+
+    def write(self, cmd):
+        time.sleep(self.latency_s / 2)
+        if cmd[:2] == b'\x0a\x04':  # Get encoder counts
+            channel = cmd[2]
+            counts = self._counts(channel)
+            self._response = (b'\x0b\x04\x06\x00\x00\x00' + channel.to_bytes(2, byteorder='little') +
+                              counts.to_bytes(4, 'little', signed=True))
+        elif cmd[:2] in (b'\x53\x04', b'\x09\x04'):  # Move to, or set, encoder counts
+            channel = int.from_bytes(cmd[6:8], byteorder='little')
+            counts = int.from_bytes(cmd[8:12], byteorder='little', signed=True)
+            if cmd[:2] == b'\x53\x04':
+                self._moves[channel] = (self._counts(channel), counts, time.perf_counter())
+            else:
+                self._moves[channel] = (counts, counts, 0.0)
+        return len(cmd)
+
+    def read(self, size=1):
+        time.sleep(self.latency_s / 2)
+        response, self._response = self._response[:size], self._response[size:]
+        return response
+
+    def inWaiting(self):
+        return len(self._response)
+
+    def close(self):
+        pass
+
+
+class SimController(Controller):
+    """
+    Controller running on a SimulatedMCM3000Port.
+    """
+
+    def __init__(self,
+                 which_port='SIM',
+                 name='MCM3000',
+                 stages=3 * ('ZFM2030',),
+                 reverse=(False, False, True),
+                 verbose=False,
+                 very_verbose=False,
+                 position_poll_s=0.1,
+                 velocity_um_s=1e3,
+                 acceleration_um_s2=5e3,
+                 latency_s=1e-3):
+        """
+        Args:
+            which_port, name, stages, reverse, verbose, very_verbose, position_poll_s: As for Controller.
+            velocity_um_s (float): Simulated stage velocity in micrometers per second (default: 1e3).
+            acceleration_um_s2 (float): Simulated stage acceleration in micrometers per second squared (default: 5e3).
+            latency_s (float): Simulated serial round-trip latency in seconds (default: 1 ms).
+        """
+        self._sim_params = {'velocity_um_s': velocity_um_s, 'acceleration_um_s2': acceleration_um_s2,
+                            'latency_s': latency_s}
+        super().__init__(which_port, name=name, stages=stages, reverse=reverse,
+                         verbose=verbose, very_verbose=very_verbose, position_poll_s=position_poll_s)
+
+    def _open_port(self, which_port):
+        return SimulatedMCM3000Port(**self._sim_params)
+
+
+class SimulatedKuriosLib:
+    """
+    A stand-in for the KURIOS_COMMAND_LIB module: the same functions, with the same return codes and output lists,
+    driving a simulated filter.
+
+    Every command costs `command_latency_s`. After a wavelength change the filter takes
+    settle_base_s + settle_per_nm_s * |jump| to settle, scaled by the bandwidth mode (narrower modes settle more
+    slowly); until then KuriosGetWavelength() still reports the previous wavelength.
+    """
+
+    # Relative settling time of each bandwidth mode (1 = BLACK; 2 = WIDE; 4 = MEDIUM; 8 = NARROW).
+    BANDWIDTH_SETTLE_FACTOR = {1: 1.0, 2: 1.0, 4: 1.5, 8: 2.5}
+
+    def __init__(self, command_latency_s=5e-3, settle_base_s=3e-3, settle_per_nm_s=4e-5):
+        """
+        Args:
+            command_latency_s (float): Round-trip latency of each command in seconds (default: 5 ms).
+            settle_base_s (float): Settling time of the smallest jump in WIDE mode in seconds (default: 3 ms).
+            settle_per_nm_s (float): Additional settling time per nanometer of jump in WIDE mode (default: 40 us).
+        """
+        self.command_latency_s = command_latency_s
+        self.settle_base_s = settle_base_s
+        self.settle_per_nm_s = settle_per_nm_s
+        self.wavelength = 550
+        self.bandwidth = 2
+        self.output_mode = 1
+        self.sequence = []
+        self.sequence_step = 0
+        self._settled_at = 0.0  # Time at which the last wavelength change settles
+        self._reported_wavelength = 550
+
+    def _command(self):
+        time.sleep(self.command_latency_s)
+        return 0
+
+    def _tune(self, wavelength):
+        """
+        Starts a wavelength change, settling after a time depending on the jump and the bandwidth mode.
+        """
+        if time.perf_counter() >= self._settled_at:
+            self._reported_wavelength = self.wavelength
+        factor = self.BANDWIDTH_SETTLE_FACTOR.get(self.bandwidth, 1.0)
+        jump = abs(wavelength - self.wavelength)
+        self._settled_at = time.perf_counter() + factor * (self.settle_base_s + self.settle_per_nm_s * jump)
+        self.wavelength = wavelength
+
+    def KuriosListDevices(self):
+        return [['SIMULATED', 'KURIOS-VB1 simulated']]
+
+    def KuriosOpen(self, serialNo, nBaud, timeout):
+        self._command()
+        return 0
+
+    def KuriosIsOpen(self, serialNo):
+        return 1
+
+    def KuriosClose(self, hdl):
+        return self._command()
+
+    def KuriosGetId(self, hdl, id):
+        id.append('KURIOS SN000001 CN000001 v3.1')
+        return self._command()
+
+    def KuriosGetStatus(self, hdl, value):
+        value[0] = 2  # Ready
+        return self._command()
+
+    def KuriosGetTemperature(self, hdl, value):
+        value[0] = 37.5
+        return self._command()
+
+    def KuriosGetSpecification(self, hdl, Max, Min):
+        Max[0], Min[0] = 730, 420
+        return self._command()
+
+    def KuriosGetOpticalHeadType(self, hdl, filterSpectrumRange, availableBandwidthMode):
+        filterSpectrumRange.append(chr(0b01))  # Visible
+        availableBandwidthMode.append(chr(0b1110))  # WIDE, MEDIUM and NARROW
+        return self._command()
+
+    def KuriosSetBandwidthMode(self, hdl, value):
+        self.bandwidth = value
+        return self._command()
+
+    def KuriosGetBandwidthMode(self, hdl, value):
+        value[0] = self.bandwidth
+        return self._command()
+
+    def KuriosSetWavelength(self, hdl, value):
+        self._tune(value)
+        return self._command()
+
+    def KuriosGetWavelength(self, hdl, value):
+        value[0] = self._reported_wavelength if time.perf_counter() < self._settled_at else self.wavelength
+        return self._command()
+
+    def KuriosSetDeleteSequenceStep(self, hdl, value):
+        if value == 0:
+            self.sequence = []
+        else:
+            del self.sequence[value - 1]
+        return self._command()
+
+    def KuriosSetDefaultTimeIntervalForSequence(self, hdl, value):
+        return self._command()
+
+    def KuriosSetInsertSequenceStep(self, hdl, index, wavelength, interval, bandwidthMode):
+        self.sequence.insert(index - 1, wavelength)
+        return self._command()
+
+    def KuriosGetSequenceLength(self, hdl, value):
+        value[0] = len(self.sequence)
+        return self._command()
+
+    def KuriosSetTriggerOutSignalMode(self, hdl, value):
+        return self._command()
+
+    def KuriosSetOutputMode(self, hdl, value):
+        self.output_mode = value
+        if value in (2, 3):
+            # A sequence starts at its first step
+            self.sequence_step = 0
+            self._tune(self.sequence[0])
+        return self._command()
+
+    def KuriosSetForceTrigger(self, hdl):
+        self.sequence_step = (self.sequence_step + 1) % len(self.sequence)
+        self._tune(self.sequence[self.sequence_step])
+        return self._command()
+
+
+class SimTunableFilter(TunableFilter):
+    """
+    TunableFilter running on a SimulatedKuriosLib.
+    """
+
+    def __init__(self, command_latency_s=5e-3, settle_base_s=3e-3, settle_per_nm_s=4e-5):
+        """
+        Args:
+            command_latency_s (float): Round-trip latency of each command in seconds (default: 5 ms).
+            settle_base_s (float): Settling time of the smallest jump in WIDE mode in seconds (default: 3 ms).
+            settle_per_nm_s (float): Additional settling time per nanometer of jump in WIDE mode (default: 40 us).
+        """
+        self._sim_params = {'command_latency_s': command_latency_s, 'settle_base_s': settle_base_s,
+                            'settle_per_nm_s': settle_per_nm_s}
+        super().__init__()
+
+    def _open_library(self):
+        return SimulatedKuriosLib(**self._sim_params)
+
+
+class SimulatedVisaInstrument:
+    """
+    A stand-in for the PyVISA resource of a DC2200 LED controller, with a fixed latency per command.
+    """
+
+    def __init__(self, latency_s=2e-3):
+        self.latency_s = latency_s
+        self.state = {}
+
+    def query(self, command):
+        time.sleep(self.latency_s)
+        if command == '*IDN?':
+            return 'Thorlabs,DC2200,SIMULATED,0.0'
+        return self.state.get(command.rstrip('?'), '0')
+
+    def write(self, command):
+        time.sleep(self.latency_s)
+        key, _, value = command.partition(' ')
+        self.state[key] = value
+        return len(command)
+
+    def close(self):
+        pass
+
+
+class SimulatedVisaResourceManager:
+    """
+    A stand-in for pyvisa.ResourceManager.
+    """
+
+    def close(self):
+        pass
+
+
+class SimDC2200(DC2200):
+    """
+    DC2200 running on a SimulatedVisaInstrument.
+    """
+
+    def __init__(self, latency_s=2e-3):
+        """
+        Args:
+            latency_s (float): Latency of each VISA command in seconds (default: 2 ms).
+        """
+        self._latency_s = latency_s
+        super().__init__()
+
+    def _open_instrument(self):
+        return SimulatedVisaResourceManager(), SimulatedVisaInstrument(self._latency_s)
+
+
+class SimulatedOceanDevice:
+    """
+    A stand-in for an OceanDirect spectrometer device object, returning a synthetic spectrum.
+    """
+
+    def __init__(self, n_pixels=2048, wavelength_range=(340.0, 1030.0), overhead_s=2e-3, counts_per_s=2e5):
+        self.wavelengths = list(np.linspace(wavelength_range[0], wavelength_range[1], n_pixels))
+        self.overhead_s = overhead_s
+        self.counts_per_s = counts_per_s
+        self.integration_time_us = 100000
+        self.scans_to_average = 1
+        centre = np.mean(wavelength_range)
+        width = (wavelength_range[1] - wavelength_range[0]) / 6
+        self._profile = np.exp(-((np.asarray(self.wavelengths) - centre) / width) ** 2)
+
+    def get_serial_number(self):
+        return 'SIMULATED'
+
+    def set_integration_time(self, integration_time_us):
+        time.sleep(self.overhead_s)
+        self.integration_time_us = integration_time_us
+
+    def set_scans_to_average(self, scans):
+        time.sleep(self.overhead_s)
+        self.scans_to_average = scans
+
+    def get_wavelengths(self):
+        time.sleep(self.overhead_s)
+        return list(self.wavelengths)
+
+    def get_formatted_spectrum(self):
+        exposure_s = self.integration_time_us * 1e-6
+        time.sleep(self.overhead_s + exposure_s * self.scans_to_average)
+        counts = np.minimum(self.counts_per_s * exposure_s * self._profile, 65535)
+        return list(counts)
+
+    # The data buffer is modelled from the clock: while enabled, the detector produces one spectrum per integration
+    # period, and spectra beyond the buffer capacity overwrite the oldest ones.
+
+    def is_feature_id_enabled(self, feature_id):
+        return True
+
+    def set_buffer_capacity(self, capacity):
+        self.buffer_capacity = capacity
+
+    def get_buffer_capacity(self):
+        return getattr(self, 'buffer_capacity', 1000)
+
+    def set_buffer_enabled(self, enabled):
+        self._buffer_start_s = time.perf_counter() if enabled else None
+
+    def clear_data_buffer(self):
+        self._buffer_start_s = time.perf_counter()
+        self._produced = 0
+
+    def _buffer_window(self):
+        # Index of the oldest spectrum still in the buffer and number of spectra produced so far
+        period_s = self.integration_time_us * 1e-6
+        produced = int((time.perf_counter() - self._buffer_start_s) / period_s)
+        return max(self._produced, produced - self.get_buffer_capacity()), produced
+
+    def get_number_of_elements_in_buffer(self):
+        oldest, produced = self._buffer_window()
+        return produced - oldest
+
+    def get_raw_spectrum_with_metadata(self, list_raw_spectra, list_timestamp, buffer_length):
+        time.sleep(self.overhead_s)
+        # Wait for at least one spectrum
+        oldest, produced = self._buffer_window()
+        while produced == oldest:
+            time.sleep(self.integration_time_us * 1e-6 / 4)
+            oldest, produced = self._buffer_window()
+        n = min(buffer_length, produced - oldest)
+        counts = list(np.minimum(self.counts_per_s * self.integration_time_us * 1e-6 * self._profile, 65535))
+        for index in range(oldest, oldest + n):
+            list_raw_spectra.append(counts)
+            list_timestamp.append((index + 1) * self.integration_time_us)  # Microseconds
+        self._produced = oldest + n
+        return n
+
+
+class SimulatedOceanDirectError(Exception):
+    """
+    A stand-in for OceanDirectError.
+    """
+
+    def get_error_details(self):
+        return [-1, str(self)]
+
+
+class SimulatedOceanDirectAPI:
+    """
+    A stand-in for OceanDirectAPI, with a single SimulatedOceanDevice connected.
+    """
+
+    def __init__(self, n_pixels=2048, overhead_s=2e-3):
+        self._device = SimulatedOceanDevice(n_pixels=n_pixels, overhead_s=overhead_s)
+
+    def find_usb_devices(self):
+        return 1
+
+    def get_device_ids(self):
+        return [0]
+
+    def open_device(self, device_id):
+        return self._device
+
+    def close_device(self, device_id):
+        pass
+
+    def shutdown(self):
+        pass
+
+
+class SimulatedOceanDirectSDK:
+    """
+    A stand-in for the oceandirect.OceanDirectAPI module.
+    """
+
+    OceanDirectError = SimulatedOceanDirectError
+    FeatureID = collections.namedtuple('FeatureID', ['DATA_BUFFER'])(DATA_BUFFER='DATA_BUFFER')
+
+    def __init__(self, n_pixels=2048, overhead_s=2e-3):
+        self.OceanDirectAPI = lambda: SimulatedOceanDirectAPI(n_pixels=n_pixels, overhead_s=overhead_s)
+
+
+class SimOcean_Spectrometer(Ocean_Spectrometer):
+    """
+    Ocean_Spectrometer running on a SimulatedOceanDirectSDK.
+    """
+
+    def __init__(self, n_pixels=2048, overhead_s=2e-3):
+        """
+        Args:
+            n_pixels (int): Number of detector pixels (default: 2048).
+            overhead_s (float): Latency of each device call in seconds (default: 2 ms).
+        """
+        self._sim_params = {'n_pixels': n_pixels, 'overhead_s': overhead_s}
+        super().__init__()
+
+    def _open_library(self):
+        return SimulatedOceanDirectSDK(**self._sim_params)
@@ -0,0 +1,114 @@
+# Import necessary libraries
+import time  # For timestamps when the device has no data buffer
+import numpy as np  # For the preallocated spectrum buffers
+
+
+def stream_spectra(device, n_pixels, integration_time_us, n_spectra=None, batch_size=64, buffered=True,
+                   buffer_capacity=None, status=None):
+    """
+    Streams spectra from an OceanDirect spectrometer device as fast as the detector produces them.
+
+    With `buffered`, the spectrometer free-runs into its on-board data buffer and spectra are read out in batches
+    with their device timestamps, so no spectrum is lost to USB round trips between reads. If the device buffer
+    fills up before it is read, the oldest spectra are lost; this is counted as an overrun, and the gaps it leaves
+    in the timestamps are counted as dropped spectra. Without `buffered` (devices with no data buffer), spectra are
+    read back to back and timestamped on arrival.
+
+    Each batch is written into the same preallocated (batch_size, n_pixels) buffer, so the arrays yielded are only
+    valid until the next batch is requested; copy them to keep them.
+
+    Args:
+        device: The opened OceanDirect spectrometer device.
+        n_pixels (int): Number of detector pixels.
+        integration_time_us (int): The integration time in microseconds, already set on the device.
+        n_spectra (int): Number of spectra to acquire (default: None, stream until the caller stops iterating).
+        batch_size (int): Maximum number of spectra per batch (default: 64).
+        buffered (bool): Read from the device data buffer rather than back to back (default: True).
+        buffer_capacity (int): Capacity of the device data buffer in spectra (default: None keeps the device setting).
+        status (dict): Optional dict updated in place with the number of 'spectra' received, 'overruns' of the
+            device buffer and spectra 'dropped' (only detected when buffered).
+
+    Returns:
+        A generator of (timestamps, spectra) batches: timestamps in seconds from the first spectrum as a (n,)
+        array, and spectra (counts) as a (n, n_pixels) array.
+    """
+    if status is None:
+        status = {}
+    status['spectra'] = 0
+    status['overruns'] = 0
+    status['dropped'] = 0
+
+    # Preallocate the batch buffers once; each batch is a view of their first rows.
+    spectra = np.empty((batch_size, n_pixels), dtype=np.float64)
+    timestamps = np.empty(batch_size, dtype=np.float64)
+    period_s = integration_time_us * 1e-6
+    t0 = None
+    t_prev = None
+
+    if buffered:
+        # Start free-running into an empty device buffer.
+        if buffer_capacity is not None:
+            device.set_buffer_capacity(buffer_capacity)
+        capacity = device.get_buffer_capacity()
+        device.set_buffer_enabled(True)
+        device.clear_data_buffer()
+    try:
+        while n_spectra is None or status['spectra'] < n_spectra:
+            n = batch_size if n_spectra is None else min(batch_size, n_spectra - status['spectra'])
+
+            if buffered:
+                # A full buffer means spectra have been overwritten since the last read.
+                if device.get_number_of_elements_in_buffer() >= capacity:
+                    status['overruns'] += 1
+                raw_spectra, raw_timestamps = [], []
+                n = device.get_raw_spectrum_with_metadata(raw_spectra, raw_timestamps, n)
+                for i in range(n):
+                    spectra[i] = raw_spectra[i]
+                # Device timestamps are in microseconds.
+                timestamps[:n] = raw_timestamps[:n]
+                timestamps[:n] *= 1e-6
+            else:
+                for i in range(n):
+                    spectra[i] = device.get_formatted_spectrum()
+                    timestamps[i] = time.perf_counter()
+
+            if n == 0:
+                continue
+            if t0 is None:
+                t0 = timestamps[0]
+            timestamps[:n] -= t0
+
+            # Spectra overwritten in the device buffer show up as gaps of more than one integration period.
+            if buffered:
+                gaps = np.diff(timestamps[:n], prepend=timestamps[0] if t_prev is None else t_prev)
+                status['dropped'] += int(np.sum(np.maximum(np.round(gaps / period_s) - 1, 0)))
+                t_prev = timestamps[n - 1]
+
+            status['spectra'] += n
+            yield timestamps[:n], spectra[:n]
+    finally:
+        if buffered:
+            device.set_buffer_enabled(False)
+
+
+def collect_spectra(batches, n_spectra, n_pixels):
+    """
+    Collects streamed batches of spectra into preallocated arrays.
+
+    Args:
+        batches: A generator of (timestamps, spectra) batches, e.g. from stream_spectra().
+        n_spectra (int): Number of spectra the generator yields.
+        n_pixels (int): Number of detector pixels.
+
+    Returns:
+        tuple: The timestamps as a (n_spectra,) array and the spectra as a (n_spectra, n_pixels) array.
+    """
+    timestamps = np.empty(n_spectra, dtype=np.float64)
+    spectra = np.empty((n_spectra, n_pixels), dtype=np.float64)
+    i = 0
+    for batch_timestamps, batch_spectra in batches:
+        n = len(batch_timestamps)
+        timestamps[i:i + n] = batch_timestamps
+        spectra[i:i + n] = batch_spectra
+        i += n
+    return timestamps, spectra
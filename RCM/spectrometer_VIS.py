@@ -1,17 +1,23 @@
 # Import necessary libraries
-from oceandirect.OceanDirectAPI import OceanDirectAPI, OceanDirectError, FeatureID  # Import OceanDirect API for spectrometer control
+import importlib  # For loading the OceanDirect SDK when a spectrometer is opened
 import matplotlib.pyplot as plt  # Import for plotting data
+import numpy as np  # For the cached wavelength axis
+from spectrastream import stream_spectra, collect_spectra  # Buffered, high-rate spectrum streaming
+from statecache import shadow_state  # Skips redundant writes of unchanged spectrometer settings
+from tracer import tracer  # Per-step timing trace
 
 # Spectrometer control script to input gain, exposure time, and repeats to return counts vs wavelength
 
 # Note: The product manual contains detailed explanations of error codes in Appendix A.
 # https://www.oceanoptics.com/wp-content/uploads/2024/05/MNL-1025-OceanDirect-User-Manual-060822.pdf
 
-class Ocean_Spectrometer(OceanDirectAPI):
+class Ocean_Spectrometer:
     """
     A class to control and interface with an Ocean Optics spectrometer using the OceanDirectAPI.
 
-    This class handles initialization, device setup, spectrum reading, and device shutdown.
+    This class handles initialization, device setup, spectrum reading, and device shutdown. The OceanDirect SDK is
+    loaded by _open_library() when the spectrometer is opened, so the driver can also run on top of a stand-in SDK
+    (see simulated.py).
     """
 
     def __init__(self):
@@ -20,20 +26,22 @@ class Ocean_Spectrometer(OceanDirectAPI):
 
         Raises:
             RuntimeError: If no spectrometers are found.
+            OceanDirectError: If the device could not be opened.
         """
-        # Initialize the parent OceanDirectAPI class.
-        super().__init__()
+        # Load the OceanDirect SDK and initialize its API.
+        self.sdk = self._open_library()
+        self.api = self.sdk.OceanDirectAPI()
 
         try:
             # Find connected USB spectrometer devices.
-            device_count = self.find_usb_devices()
+            device_count = self.api.find_usb_devices()
 
             # If no devices are found, raise an error.
             if device_count == 0:
                 raise RuntimeError("No ocean spectroscopes found")
 
             # Get the list of device IDs for the detected devices.
-            device_ids = self.get_device_ids()
+            device_ids = self.api.get_device_ids()
             print("Device id: ", device_ids)
 
             # If more than one device is found, use the first one.
@@ -42,16 +50,35 @@ class Ocean_Spectrometer(OceanDirectAPI):
 
             # Open the first detected device and store its ID and serial number.
             self.device_id = device_ids[0]
-            self.device = self.open_device(self.device_id)
+            self.device = self.api.open_device(self.device_id)
             self.serial_number = self.device.get_serial_number()
 
+            # The wavelength axis is fixed by the device calibration, so read it once rather than on every spectrum.
+            # It is shared by every spectrum returned, so it is made read-only.
+            self.wavelengths = np.array(self.device.get_wavelengths(), dtype=np.float64)
+            self.wavelengths.setflags(write=False)
+
+            # Register the spectrometer's shadow state; nothing is known about a freshly opened device.
+            self.state = shadow_state.register('Ocean_Spectrometer')
+
             # Print the serial number of the initialized device.
             print(f"Device with serial number {self.serial_number} has been initialised.")
 
-        # Catch any errors that occur during initialization and display the error code and message.
-        except OceanDirectError as err:
+        # Display the error code and message of any error during initialization, then re-raise it so that the
+        # half-initialised spectrometer is not used.
+        except self.sdk.OceanDirectError as err:
             [errorCode, errorMsg] = err.get_error_details()
             print(f"Ocean_Spectrometer initialisation has failed: {errorCode} | {errorMsg}")
+            raise
+
+    def _open_library(self):
+        """
+        Loads the OceanDirect SDK.
+
+        Returns:
+            The oceandirect.OceanDirectAPI module, providing OceanDirectAPI, OceanDirectError and FeatureID.
+        """
+        return importlib.import_module('oceandirect.OceanDirectAPI')
 
     def close_device(self):
         """
@@ -60,8 +87,9 @@ class Ocean_Spectrometer(OceanDirectAPI):
         This method should be called when the device is no longer needed to properly release resources.
         """
         # Close the device using its ID and shut down the API.
-        self.close_device(self.device_id)
-        self.shutdown()
+        self.api.close_device(self.device_id)
+        self.api.shutdown()
+        shadow_state.unregister(self.state)
 
     def read_spectra(self, exposure_time_Us: int, num_average: int):
         """
@@ -72,7 +100,7 @@ class Ocean_Spectrometer(OceanDirectAPI):
             num_average (int): The number of scans to average for the final spectrum.
 
         Returns:
-            tuple: A tuple containing two lists - wavelengths and corresponding spectra data (counts).
+            tuple: The cached wavelength axis as a read-only NumPy array and the corresponding spectra data (counts).
 
         Raises:
             OceanDirectError: If there is an error during spectrum acquisition.
@@ -82,25 +110,86 @@ class Ocean_Spectrometer(OceanDirectAPI):
             Setting the exposure too high can lead to saturation, while setting it too low may result in insufficient signal.
         """
         try:
-            # Set the integration (exposure) time for the spectrometer in microseconds.
-            self.device.set_integration_time(exposure_time_Us)
+            # Set the integration (exposure) time for the spectrometer in microseconds, unless it is already set.
+            self.state.apply('integration_time', exposure_time_Us, self.device.set_integration_time)
 
-            # Set the number of scans to average.
-            self.device.set_scans_to_average(num_average)
-
-            # Retrieve the wavelengths measured by the spectrometer.
-            wavelengths = self.device.get_wavelengths()
+            # Set the number of scans to average, unless it is already set.
+            self.state.apply('scans_to_average', num_average, self.device.set_scans_to_average)
 
             # Retrieve the spectrum data (counts) from the spectrometer.
-            spectra = self.device.get_formatted_spectrum()
+            with tracer.span('get_formatted_spectrum', self.state.name, integration_time_us=exposure_time_Us,
+                             scans_to_average=num_average):
+                spectra = self.device.get_formatted_spectrum()
 
-            # Return the wavelengths and spectra data.
-            return wavelengths, spectra
+            # Return the cached wavelengths and spectra data.
+            return self.wavelengths, spectra
 
-        # Catch and display any errors that occur during spectrum reading.
-        except OceanDirectError as err:
+        # Display any error that occurs during spectrum reading, then re-raise it.
+        except self.sdk.OceanDirectError as err:
             [errorCode, errorMsg] = err.get_error_details()
             print(f"Ocean_Spectrometer.read_spectra() exception: {errorCode} | {errorMsg}")
+            raise
+
+    def supports_data_buffer(self):
+        """
+        Checks whether the spectrometer has an on-board data buffer for streaming.
+
+        Returns:
+            bool: True if the data buffer feature is available.
+        """
+        try:
+            return self.device.is_feature_id_enabled(self.sdk.FeatureID.DATA_BUFFER)
+        except self.sdk.OceanDirectError:
+            return False
+
+    def stream(self, exposure_time_Us: int, n_spectra=None, batch_size=64, buffer_capacity=None):
+        """
+        Streams single-scan spectra as fast as the detector produces them.
+
+        The spectrometer's data buffer is used when it has one, otherwise spectra are read back to back. The number
+        of spectra received, device buffer overruns and dropped spectra are kept in `stream_status` while streaming.
+
+        Args:
+            exposure_time_Us (int): The exposure time in microseconds for each spectrum.
+            n_spectra (int): Number of spectra to acquire (default: None, stream until the caller stops iterating).
+            batch_size (int): Maximum number of spectra per batch (default: 64).
+            buffer_capacity (int): Capacity of the device data buffer in spectra (default: None keeps the device setting).
+
+        Returns:
+            A generator of (timestamps, spectra) batches, see spectrastream.stream_spectra(). The arrays are reused
+            between batches.
+        """
+        # Buffered spectra are single scans, so averaging is switched off.
+        self.state.apply('integration_time', exposure_time_Us, self.device.set_integration_time)
+        self.state.apply('scans_to_average', 1, self.device.set_scans_to_average)
+        self.stream_status = {}
+        return stream_spectra(self.device, len(self.wavelengths), exposure_time_Us, n_spectra=n_spectra,
+                              batch_size=batch_size, buffered=self.supports_data_buffer(),
+                              buffer_capacity=buffer_capacity, status=self.stream_status)
+
+    def acquire_kinetics(self, exposure_time_Us: int, n_spectra: int, batch_size=64, buffer_capacity=None):
+        """
+        Acquires a fixed number of spectra at the full detector rate, e.g. for kinetics measurements.
+
+        Args:
+            exposure_time_Us (int): The exposure time in microseconds for each spectrum.
+            n_spectra (int): Number of spectra to acquire.
+            batch_size (int): Maximum number of spectra read from the device at once (default: 64).
+            buffer_capacity (int): Capacity of the device data buffer in spectra (default: None keeps the device setting).
+
+        Returns:
+            tuple: The timestamps in seconds from the first spectrum as a (n_spectra,) array, and the spectra (counts)
+            as a (n_spectra, n_pixels) array. The wavelengths are in `self.wavelengths`.
+        """
+        # Fill preallocated arrays batch by batch.
+        timestamps, spectra = collect_spectra(self.stream(exposure_time_Us, n_spectra, batch_size, buffer_capacity),
+                                              n_spectra, len(self.wavelengths))
+
+        # Report any spectra lost to buffer overruns.
+        if self.stream_status['overruns'] or self.stream_status['dropped']:
+            print(f"Ocean_Spectrometer: {self.stream_status['overruns']} buffer overruns, "
+                  f"{self.stream_status['dropped']} spectra dropped")
+        return timestamps, spectra
 
 
 if __name__ == "__main__":
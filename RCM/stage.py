@@ -1,6 +1,94 @@
 # Import necessary libraries
 import time  # Provides time-related functions
+import queue  # For the command queue of the I/O thread
+import threading  # For the I/O thread that owns the serial port
+from concurrent.futures import Future  # For the results of queued commands
 import serial  # Provides support for serial communication
+from tracer import tracer  # Per-step timing trace
+
+# Sentinel telling the I/O thread to exit.
+_STOP = object()
+
+
+class MotionModel:
+    """
+    A trapezoidal velocity-profile model of a single stage axis, used to predict how long a move will take.
+
+    The stage accelerates at `acceleration_um_s2` up to `velocity_um_s`, cruises, and decelerates again; short moves
+    never reach full speed. The nominal figures are only starting estimates: every completed move feeds its observed
+    duration back through update(), which refines a time scale factor for the axis.
+
+    Polling starts `early_wake_s` before the predicted arrival. A move is only timed accurately if the stage is
+    still moving at the first poll; if it has already arrived, the observed time is only an upper bound: the time
+    scale is only lowered to it, never raised, and the early wake is doubled until arrivals are bracketed by the
+    polls again.
+    """
+
+    def __init__(self, velocity_um_s, acceleration_um_s2, learning_rate=0.3, early_wake_s=20e-3, max_early_wake_s=1.0):
+        """
+        Args:
+            velocity_um_s (float): Nominal maximum velocity in micrometers per second.
+            acceleration_um_s2 (float): Nominal acceleration in micrometers per second squared.
+            learning_rate (float): Weight given to each new observation when refining the model (default: 0.3).
+            early_wake_s (float): Initial (and minimum) time before the predicted arrival at which polling starts
+                (default: 20 ms).
+            max_early_wake_s (float): Largest early wake time in seconds (default: 1 s).
+        """
+        self.velocity_um_s = velocity_um_s
+        self.acceleration_um_s2 = acceleration_um_s2
+        self.learning_rate = learning_rate
+        self.time_scale = 1.0  # Calibrated ratio of observed to nominal move time
+        self.min_early_wake_s = early_wake_s
+        self.max_early_wake_s = max_early_wake_s
+        self.early_wake_s = early_wake_s  # Current time before the predicted arrival at which polling starts
+
+    def _nominal_s(self, distance_um):
+        """
+        Returns the move time predicted by the nominal velocity and acceleration.
+        """
+        d = abs(distance_um)
+        v = self.velocity_um_s
+        a = self.acceleration_um_s2
+        if d < v ** 2 / a:
+            return 2 * (d / a) ** 0.5  # Triangular profile, full speed is never reached
+        return d / v + v / a  # Trapezoidal profile
+
+    def predict_s(self, distance_um):
+        """
+        Predicts the duration of a move.
+
+        Args:
+            distance_um (float): The length of the move in micrometers.
+
+        Returns:
+            float: The predicted duration in seconds.
+        """
+        return self.time_scale * self._nominal_s(distance_um)
+
+    def update(self, distance_um, observed_s, bracketed=True):
+        """
+        Refines the model from the observed duration of a completed move.
+
+        Args:
+            distance_um (float): The length of the move in micrometers.
+            observed_s (float): The time from sending the move command to detecting arrival, in seconds.
+            bracketed (bool): Whether the stage was seen moving before it was seen arrived. If not, `observed_s` is
+                only an upper bound: the time scale is only lowered towards it, and polling will start earlier
+                (default: True).
+        """
+        if bracketed:
+            # Let the early wake drift back towards its minimum
+            self.early_wake_s = max(0.8 * self.early_wake_s, self.min_early_wake_s)
+        else:
+            self.early_wake_s = min(2 * self.early_wake_s, self.max_early_wake_s)
+
+        nominal_s = self._nominal_s(distance_um)
+        if nominal_s <= 0:
+            return
+        ratio = min(max(observed_s / nominal_s, 0.2), 5.0)  # Ignore outliers such as interrupted moves
+        if not bracketed and ratio >= self.time_scale:
+            return  # An upper bound above the current estimate carries no information
+        self.time_scale += self.learning_rate * (ratio - self.time_scale)
 
 
 class Controller:
@@ -23,11 +111,16 @@ class Controller:
                  stages=3 * (None,),  # e.g., ('None', 'None', 'ZFM2030')
                  reverse=3 * (False,),  # e.g., (False, False, True)
                  verbose=True,
-                 very_verbose=False):
+                 very_verbose=False,
+                 position_poll_s=0.1):
         """
         Initializes the Controller class by connecting to the specified COM port, setting the stage parameters, 
         and configuring movement options such as reverse directions and verbosity.
 
+        The serial port is owned by a dedicated I/O thread, which runs the commands of every caller in order from a
+        queue and, in between, refreshes the encoder counts and `position_um` of every channel, so the Controller
+        can be used from several threads and positions can be read without a serial round trip.
+
         Args:
             which_port (str): The serial port to which the controller is connected (e.g., 'COM4').
             name (str): The name of the controller (default is 'MCM3000').
@@ -35,6 +128,8 @@ class Controller:
             reverse (tuple): Tuple specifying if the stage movements should be reversed (True/False).
             verbose (bool): Flag to enable/disable basic output logs.
             very_verbose (bool): Flag to enable/disable detailed output logs for debugging.
+            position_poll_s (float): Interval in seconds at which the I/O thread refreshes the positions of all
+                channels (default is 0.1 s; None disables polling).
 
         Raises:
             IOError: If the controller is not connected or the COM port is unavailable.
@@ -45,24 +140,24 @@ class Controller:
         self.verbose = verbose
         self.very_verbose = very_verbose
 
+        # Ensure stages and reverse parameters are tuples of correct length
+        assert isinstance(self.stages, tuple) and isinstance(self.reverse, tuple)
+        assert len(self.stages) == 3 and len(self.reverse) == 3
+        for element in self.reverse:
+            assert isinstance(element, bool)
+
         if self.verbose:
             print(f"{self.name}: opening...", end='')
 
         # Try opening the serial port with the specified baud rate and timeout
         try:
-            self.port = serial.Serial(port=which_port, baudrate=460800, timeout=5)
+            self.port = self._open_port(which_port)
         except serial.serialutil.SerialException:
             raise IOError(f'{self.name}: no connection on port {which_port}')
 
         if self.verbose:
             print(" done.")
 
-        # Ensure stages and reverse parameters are tuples of correct length
-        assert isinstance(self.stages, tuple) and isinstance(self.reverse, tuple)
-        assert len(self.stages) == 3 and len(self.reverse) == 3
-        for element in self.reverse:
-            assert isinstance(element, bool)
-
         # Initialize internal variables for encoder counts and movement parameters
         self._encoder_counts = 3 * [None]
         self._encoder_counts_tol = 3 * [1]  # Tolerance in encoder counts (can hang if < 1 count)
@@ -70,25 +165,50 @@ class Controller:
         self._um_per_count = 3 * [None]
         self._position_limit_um = 3 * [None]
         self.position_um = 3 * [None]
+        self.position_time_s = 3 * [None]  # time.perf_counter() of the last encoder read of each channel
+
+        # Motion model of each channel, and the start time and length of the move in progress
+        self.motion_models = 3 * [None]
+        self._move_start_s = 3 * [None]
+        self._move_distance_um = 3 * [None]
 
-        # Supported stages and their corresponding micrometers per encoder count and position limits
+        # Per-channel statistics of completed moves: count, total time, predicted time and encoder polls
+        self.move_stats = [{'moves': 0, 'total_s': 0.0, 'predicted_s': 0.0, 'polls': 0} for _ in range(3)]
+
+        # Supported stages and their corresponding micrometers per encoder count, position limits,
+        # and nominal velocity (um/s) and acceleration (um/s^2) used as starting points for the motion model
         supported_stages = {
-            'ZFM2020': (0.2116667, 1e3 * 12.7),
-            'ZFM2030': (0.2116667, 1e3 * 12.7),
-            'MMP-2XY': (0.5, 1e3 * 25.4)
+            'ZFM2020': (0.2116667, 1e3 * 12.7, 1e3, 5e3),
+            'ZFM2030': (0.2116667, 1e3 * 12.7, 1e3, 5e3),
+            'MMP-2XY': (0.5, 1e3 * 25.4, 3e3, 1e4)
         }
 
-        # Initialize channels for connected stages
+        # Start the I/O thread, which owns the serial port from here on
+        self.position_poll_s = position_poll_s
+        self._polled_channels = ()  # Set once the channels are initialized
+        self._io_queue = queue.Queue()
+        self._io_thread = threading.Thread(target=self._io_loop, name=f'{self.name}-io', daemon=True)
+        self._io_thread.start()
+
+        # Initialize channels for connected stages; on failure, stop the I/O thread and release the port
         self.channels = []
-        for channel, stage in enumerate(self.stages):
-            if stage is not None:
-                assert stage in supported_stages, f'{self.name}: stage "{stage}" not supported'
-                self.channels.append(channel)
-                self._um_per_count[channel] = supported_stages[stage][0]
-                self._position_limit_um[channel] = supported_stages[stage][1]
-                self._get_encoder_counts(channel)
+        try:
+            for channel, stage in enumerate(self.stages):
+                if stage is not None:
+                    assert stage in supported_stages, f'{self.name}: stage "{stage}" not supported'
+                    self.channels.append(channel)
+                    self._um_per_count[channel] = supported_stages[stage][0]
+                    self._position_limit_um[channel] = supported_stages[stage][1]
+                    self.motion_models[channel] = MotionModel(*supported_stages[stage][2:])
+                    self._get_encoder_counts(channel)
+        except BaseException:
+            self._io_queue.put(_STOP)
+            self._io_thread.join()
+            self.port.close()
+            raise
 
         self.channels = tuple(self.channels)
+        self._polled_channels = self.channels
 
         if self.verbose:
             print(f"{self.name}: stages:", self.stages)
@@ -97,6 +217,18 @@ class Controller:
             print(f"{self.name}: position_limit_um:", self._position_limit_um)
             print(f"{self.name}: position_um:", self.position_um)
 
+    def _open_port(self, which_port):
+        """
+        Opens the serial port to the controller (overridden by the simulated controller).
+
+        Args:
+            which_port (str): The serial port to which the controller is connected (e.g., 'COM4').
+
+        Returns:
+            serial.Serial: The open serial port.
+        """
+        return serial.Serial(port=which_port, baudrate=460800, timeout=5)
+
     def _encoder_counts_to_um(self, channel, encoder_counts):
         """
         Converts encoder counts to micrometers (um) based on the channel's stage configuration.
@@ -137,10 +269,66 @@ class Controller:
             print(f'{self.name}(ch{channel}): -> {um:.2f}um = encoder counts {encoder_counts}')
         return encoder_counts
 
+    def _io_loop(self):
+        """
+        Runs on the I/O thread: executes the queued commands in order and refreshes the encoder counts of every
+        channel every `position_poll_s` seconds.
+        """
+        next_poll_s = time.perf_counter()
+        while True:
+            # Refresh the positions when they are due, even if commands keep arriving
+            if self.position_poll_s is not None and time.perf_counter() >= next_poll_s:
+                for channel in self._polled_channels:
+                    try:
+                        self._get_encoder_counts(channel)
+                    except Exception as err:
+                        print(f'{self.name}(ch{channel}): position poll failed: {err!r}')
+                next_poll_s = time.perf_counter() + self.position_poll_s
+
+            # Wait for a command until the next poll is due
+            timeout = None if self.position_poll_s is None else max(next_poll_s - time.perf_counter(), 0)
+            try:
+                item = self._io_queue.get(timeout=timeout)
+            except queue.Empty:
+                continue
+            if item is _STOP:
+                break
+
+            cmd, channel, response_bytes, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self._transact(cmd, channel, response_bytes))
+            except Exception as err:
+                future.set_exception(err)
+
+    def submit(self, cmd, channel, response_bytes=None):
+        """
+        Queues a command for the I/O thread without waiting for it.
+
+        Args:
+            cmd (bytes): The command to send.
+            channel (int): The channel (0, 1, or 2) to send the command to.
+            response_bytes (int, optional): Number of bytes to read from the response.
+
+        Returns:
+            Future: Resolves to the response from the device, if any.
+
+        Raises:
+            AssertionError: If the specified channel is not available.
+        """
+        assert channel in self.channels, f'{self.name}: channel "{channel}" is not available'
+        assert self._io_thread.is_alive(), f'{self.name}: the controller is closed'
+        future = Future()
+        self._io_queue.put((cmd, channel, response_bytes, future))
+        return future
+
     def _send(self, cmd, channel, response_bytes=None):
         """
         Sends a command to the specified channel and optionally reads a response.
 
+        The command is run by the I/O thread; this blocks until it has completed.
+
         Args:
             cmd (bytes): The command to send.
             channel (int): The channel (0, 1, or 2) to send the command to.
@@ -152,15 +340,24 @@ class Controller:
         Raises:
             AssertionError: If the specified channel is not available.
         """
+        if threading.current_thread() is self._io_thread:
+            return self._transact(cmd, channel, response_bytes)
+        return self.submit(cmd, channel, response_bytes).result()
+
+    def _transact(self, cmd, channel, response_bytes=None):
+        """
+        Writes a command to the serial port and reads its response; only called on the I/O thread.
+        """
         assert channel in self.channels, f'{self.name}: channel "{channel}" is not available'
         if self.very_verbose:
             print(f'{self.name}(ch{channel}): sending cmd: {cmd}')
 
-        self.port.write(cmd)  # Send the command
+        with tracer.span('serial', self.name, cmd=cmd[:2].hex(), channel=channel):
+            self.port.write(cmd)  # Send the command
 
-        # If response is expected, read it
-        response = self.port.read(response_bytes) if response_bytes is not None else None
-        assert self.port.inWaiting() == 0  # Ensure the buffer is empty
+            # If response is expected, read it
+            response = self.port.read(response_bytes) if response_bytes is not None else None
+            assert self.port.inWaiting() == 0  # Ensure the buffer is empty
 
         if self.very_verbose:
             print(f'{self.name}(ch{channel}): -> response: {response}')
@@ -196,8 +393,23 @@ class Controller:
         # Update internal state with the encoder counts
         self._encoder_counts[channel] = encoder_counts
         self.position_um[channel] = self._encoder_counts_to_um(channel, encoder_counts)
+        self.position_time_s[channel] = time.perf_counter()
         return encoder_counts
 
+    def get_position_um(self, channel):
+        """
+        Returns the last known position of a channel without any serial round trip.
+
+        The position is refreshed by the I/O thread every `position_poll_s` seconds, and by every encoder read.
+
+        Args:
+            channel (int): The axis (0, 1, or 2).
+
+        Returns:
+            tuple: The position in micrometers and its age in seconds.
+        """
+        return self.position_um[channel], time.perf_counter() - self.position_time_s[channel]
+
     def _set_encoder_counts_to_zero(self, channel):
         """
         Resets the encoder counts for the specified channel to zero.
@@ -247,23 +459,35 @@ class Controller:
             print(f'{self.name}(ch{channel}): moving to encoder counts = {encoder_counts}')
 
         self._target_encoder_counts[channel] = encoder_counts
+        self._move_distance_um[channel] = abs(encoder_counts - self._encoder_counts[channel]) * self._um_per_count[channel]
 
         # Prepare and send the move command
         encoder_bytes = encoder_counts.to_bytes(4, 'little', signed=True)
         channel_bytes = channel.to_bytes(2, byteorder='little')
         cmd = b'\x53\x04\x06\x00\x00\x00' + channel_bytes + encoder_bytes
+        self._move_start_s[channel] = time.perf_counter()
         self._send(cmd, channel)
 
         if block:
             self._finish_move(channel)
 
-    def _finish_move(self, channel, polling_wait_s=0.1):
+    def _finish_move(self, channel, polling_wait_s=5e-3, early_wake_s=None, trace=None):
         """
         Waits until the movement of the specified channel is finished.
 
+        The channel's motion model predicts when the stage will arrive; this sleeps until shortly before that time
+        and then polls the encoder at a short interval until the target is reached. The observed move time is fed
+        back into the model; if the stage had already arrived at the first poll, it is only an upper bound, and the
+        model wakes earlier next time instead.
+
         Args:
             channel (int): The axis (0, 1, or 2) to monitor.
-            polling_wait_s (float): Time (in seconds) to wait between polling.
+            polling_wait_s (float): Time (in seconds) to wait between polls once the stage is near its target.
+            early_wake_s (float): Time (in seconds) before the predicted arrival at which polling starts
+                (default: None uses the motion model's adaptive early wake).
+            trace (list, optional): If given, the encoder is polled for the whole move and a (time_s, position_um)
+                pair is appended for every poll, timestamped at the middle of the serial transaction with
+                time.perf_counter().
 
         Returns:
             None
@@ -271,23 +495,50 @@ class Controller:
         if self._target_encoder_counts[channel] is None:
             return
 
-        while True:
-            encoder_counts = self._get_encoder_counts(channel)
-            if self.verbose:
-                print('.', end='')  # Progress indicator
-
-            time.sleep(polling_wait_s)
-            target = self._target_encoder_counts[channel]
-            tolerance = self._encoder_counts_tol[channel]
-
-            # Check if the movement has finished
-            if target - tolerance <= encoder_counts <= target + tolerance:
-                break
+        # Trace the wait under this controller's name, so several controllers can be told apart
+        with tracer.span('finish_move', self.name, channel=channel):
+            model = self.motion_models[channel]
+            distance_um = self._move_distance_um[channel]
+            move_start_s = self._move_start_s[channel]
+            predicted_s = model.predict_s(distance_um)
+            if early_wake_s is None:
+                early_wake_s = model.early_wake_s
+
+            # Sleep until shortly before the predicted arrival time, unless the whole move is traced
+            remaining_s = move_start_s + predicted_s - early_wake_s - time.perf_counter()
+            if remaining_s > 0 and trace is None:
+                time.sleep(remaining_s)
+
+            polls = 0
+            while True:
+                poll_start_s = time.perf_counter()
+                encoder_counts = self._get_encoder_counts(channel)
+                polls += 1
+                if trace is not None:
+                    trace.append((0.5 * (poll_start_s + time.perf_counter()), self.position_um[channel]))
+                target = self._target_encoder_counts[channel]
+                tolerance = self._encoder_counts_tol[channel]
+
+                # Check if the movement has finished
+                if target - tolerance <= encoder_counts <= target + tolerance:
+                    break
+
+                time.sleep(polling_wait_s)
+
+            # Calibrate the motion model from the observed move time
+            observed_s = time.perf_counter() - move_start_s
+            model.update(distance_um, observed_s, bracketed=polls > 1)
+            stats = self.move_stats[channel]
+            stats['moves'] += 1
+            stats['total_s'] += observed_s
+            stats['predicted_s'] += predicted_s
+            stats['polls'] += polls
 
-        if self.verbose:
-            print(f'\n{self.name}(ch{channel}): -> finished move.')
+            if self.verbose:
+                print(f'{self.name}(ch{channel}): -> finished move '
+                      f'({1e3 * observed_s:.0f} ms, predicted {1e3 * predicted_s:.0f} ms, {polls} polls).')
 
-        self._target_encoder_counts[channel] = None
+            self._target_encoder_counts[channel] = None
 
     def _legalize_move_um(self, channel, move_um, relative):
         """
@@ -349,6 +600,21 @@ class Controller:
 
         return legal_move_um
 
+    def wait_for_move(self, channel, polling_wait_s=5e-3, trace=None):
+        """
+        Waits until a move started with `block=False` is finished.
+
+        Args:
+            channel (int): The axis (0, 1, or 2) to monitor.
+            polling_wait_s (float): Time (in seconds) to wait between encoder polls.
+            trace (list, optional): If given, the encoder is polled for the whole move and timestamped
+                (time_s, position_um) pairs are appended, e.g. to interpolate the position during a fly scan.
+
+        Returns:
+            None
+        """
+        self._finish_move(channel, polling_wait_s=polling_wait_s, trace=trace)
+
     def close(self):
         """
         Closes the serial connection to the controller and releases resources.
@@ -359,6 +625,9 @@ class Controller:
         if self.verbose:
             print(f"{self.name}: closing...", end=' ')
 
+        # Let the I/O thread finish the queued commands, then close the port
+        self._io_queue.put(_STOP)
+        self._io_thread.join()
         self.port.close()
 
         if self.verbose:
@@ -418,5 +687,11 @@ if __name__ == '__main__':
         controller.move_um(channel, 0, relative=False)
         controller.move_um(channel, 0.2116667, relative=False)
 
+    print('\n# Move statistics:')
+    stats = controller.move_stats[channel]
+    print(f"{stats['moves']} moves, mean {1e3 * stats['total_s'] / stats['moves']:.0f} ms, "
+          f"{stats['polls'] / stats['moves']:.1f} polls per move, "
+          f"time scale {controller.motion_models[channel].time_scale:.2f}")
+
     # Close the connection to the device.
     controller.close()
@@ -0,0 +1,173 @@
+# Import necessary libraries
+import threading  # Provides the lock protecting the shadow state
+
+
+class DeviceState:
+    """
+    The shadow state of a single device: the last value successfully applied to each of its parameters.
+
+    Drivers route parameter writes through apply() (or is_current() and update() when the write reports failure
+    through a return code), and writes of a value the device already holds are skipped. The shadow state must be
+    invalidated whenever the device may have changed behind the driver's back, e.g. on (re)connection.
+    """
+
+    def __init__(self, name):
+        """
+        Args:
+            name (str): The name of the device, used when reporting statistics.
+        """
+        self.name = name
+        self._values = {}
+        self._lock = threading.Lock()
+        self.writes = 0  # Number of writes sent to the device
+        self.skipped = 0  # Number of writes skipped because the value was unchanged
+        self.saved_calls = 0  # Number of device I/O calls saved by skipping writes
+
+    def is_current(self, parameter, value, io_calls=1):
+        """
+        Checks whether the device already holds a value, counting the skipped write if it does.
+
+        Args:
+            parameter (str): The name of the parameter.
+            value: The value about to be written.
+            io_calls (int): Number of device I/O calls the write would cost (default: 1).
+
+        Returns:
+            bool: True if the write can be skipped.
+        """
+        with self._lock:
+            if parameter in self._values and self._values[parameter] == value:
+                self.skipped += 1
+                self.saved_calls += io_calls
+                return True
+            return False
+
+    def update(self, parameter, value):
+        """
+        Records a value that has been successfully written to the device.
+        """
+        with self._lock:
+            self._values[parameter] = value
+            self.writes += 1
+
+    def apply(self, parameter, value, write, io_calls=1):
+        """
+        Writes a value with `write(value)` unless the device already holds it.
+
+        The value is only recorded if `write` returns without raising.
+
+        Args:
+            parameter (str): The name of the parameter.
+            value: The value to write.
+            write (callable): Writes the value to the device.
+            io_calls (int): Number of device I/O calls the write costs (default: 1).
+
+        Returns:
+            bool: True if the value was written, False if the write was skipped.
+        """
+        if self.is_current(parameter, value, io_calls):
+            return False
+        write(value)
+        self.update(parameter, value)
+        return True
+
+    def get(self, parameter, default=None):
+        """
+        Returns the last value applied to a parameter, or `default` if it is unknown.
+        """
+        with self._lock:
+            return self._values.get(parameter, default)
+
+    def invalidate(self, parameter=None):
+        """
+        Forgets the value of one parameter, or of every parameter if none is given, so that the next write is sent.
+        """
+        with self._lock:
+            if parameter is None:
+                self._values.clear()
+            else:
+                self._values.pop(parameter, None)
+
+    def stats(self):
+        """
+        Returns:
+            dict: The number of writes sent, writes skipped and I/O calls saved.
+        """
+        return {'writes': self.writes, 'skipped': self.skipped, 'saved_calls': self.saved_calls}
+
+
+class ShadowState:
+    """
+    The registry of the shadow states of every open device driver in the process.
+
+    Drivers register their shadow state when they open the device and unregister it when they close it, so that
+    reopening a device in a long-running process does not pile up stale entries. The statistics of closed devices
+    are kept in the 'total'.
+    """
+
+    def __init__(self):
+        self._devices = []
+        self._lock = threading.Lock()
+        self._closed = {'writes': 0, 'skipped': 0, 'saved_calls': 0}  # Statistics of unregistered devices
+
+    def register(self, name):
+        """
+        Creates the shadow state of a new device.
+
+        Args:
+            name (str): The name of the device; a number is appended if the name is already taken.
+
+        Returns:
+            DeviceState: The shadow state of the device.
+        """
+        with self._lock:
+            names = {device.name for device in self._devices}
+            unique_name, n = name, 1
+            while unique_name in names:
+                n += 1
+                unique_name = f'{name}#{n}'
+            device = DeviceState(unique_name)
+            self._devices.append(device)
+            return device
+
+    def unregister(self, device):
+        """
+        Removes the shadow state of a closed device, adding its statistics to the total of closed devices.
+
+        Args:
+            device (DeviceState): The shadow state returned by register(); unregistering it again does nothing.
+        """
+        with self._lock:
+            if device not in self._devices:
+                return
+            self._devices.remove(device)
+            for key, value in device.stats().items():
+                self._closed[key] += value
+        device.invalidate()
+
+    def invalidate_all(self):
+        """
+        Forgets the shadow state of every device.
+        """
+        with self._lock:
+            devices = list(self._devices)
+        for device in devices:
+            device.invalidate()
+
+    def stats(self):
+        """
+        Returns:
+            dict: The statistics of every open device, keyed by device name, plus the 'total' of all devices,
+            including those already closed.
+        """
+        with self._lock:
+            devices = list(self._devices)
+            closed = dict(self._closed)
+        stats = {device.name: device.stats() for device in devices}
+        stats['total'] = {key: closed[key] + sum(device[key] for device in stats.values())
+                          for key in ('writes', 'skipped', 'saved_calls')}
+        return stats
+
+
+# The process-wide shadow state shared by all device drivers.
+shadow_state = ShadowState()
@@ -0,0 +1,190 @@
+# Import necessary libraries
+import collections  # For the ring buffer of recorded spans
+import functools  # For the tracing decorator
+import json  # For the Chrome trace export
+import os  # For the process id of the trace events
+import threading  # For the thread of each span
+import time  # Provides the span clock
+
+
+class _Span:
+    """
+    A span being timed; recorded into the tracer's ring buffer when it exits.
+    """
+
+    __slots__ = ('tracer', 'name', 'device', 'args', 'start_ns')
+
+    def __init__(self, tracer, name, device, args):
+        self.tracer = tracer
+        self.name = name
+        self.device = device
+        self.args = args
+
+    def __enter__(self):
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end_ns = time.perf_counter_ns()
+        self.tracer._events.append((self.name, self.device, self.start_ns, end_ns - self.start_ns,
+                                    threading.get_ident(), self.args))
+        return False
+
+
+class _NullSpan:
+    """
+    The span returned while tracing is disabled: entering and exiting it does nothing.
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """
+    A low-overhead tracer of the time spent in each step of an acquisition.
+
+    Code is instrumented with spans, e.g. `with tracer.span('snap', 'Camera_HS', exposure=t):`, or with the
+    @tracer.traced decorator. While tracing is enabled, every span is recorded with its device, parameters,
+    duration and thread into a fixed-size ring buffer (the oldest spans are dropped when it is full). While it is
+    disabled, a span is a shared no-op context manager, so instrumentation can stay in place in production runs.
+
+    The recorded spans can be exported as Chrome trace JSON, to be opened in chrome://tracing or ui.perfetto.dev,
+    and summarised per device and step.
+    """
+
+    def __init__(self, capacity=100000, enabled=False):
+        """
+        Args:
+            capacity (int): Maximum number of spans kept in the ring buffer (default: 100000).
+            enabled (bool): Whether spans are recorded (default: False).
+        """
+        self.enabled = enabled
+        self._events = collections.deque(maxlen=capacity)
+        self._thread_names = {}
+
+    def enable(self):
+        """
+        Starts recording spans.
+        """
+        self.enabled = True
+
+    def disable(self):
+        """
+        Stops recording spans; the spans recorded so far are kept.
+        """
+        self.enabled = False
+
+    def clear(self):
+        """
+        Forgets every recorded span.
+        """
+        self._events.clear()
+
+    def span(self, name, device=None, **args):
+        """
+        Returns a context manager timing a step.
+
+        Args:
+            name (str): The name of the step, e.g. 'snap'.
+            device (str): The device the step runs on, e.g. 'Camera_HS' (default: None).
+            **args: Parameters of the step recorded with it, e.g. exposure=10.
+
+        Returns:
+            A context manager recording the span on exit (a no-op while tracing is disabled).
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        thread = threading.current_thread()
+        self._thread_names.setdefault(thread.ident, thread.name)
+        return _Span(self, name, device, args)
+
+    def traced(self, name=None, device=None):
+        """
+        Returns a decorator recording a span for every call of a function or method.
+
+        Args:
+            name (str): The name of the step (default: None uses the function name).
+            device (str): The device the step runs on (default: None).
+        """
+        def decorator(func):
+            span_name = name or func.__name__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with self.span(span_name, device):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def spans(self):
+        """
+        Returns:
+            list: The recorded spans as (name, device, start_ns, duration_ns, thread_id, args) tuples.
+        """
+        return list(self._events)
+
+    def export_chrome(self, filename):
+        """
+        Saves the recorded spans as a Chrome trace (JSON), viewable in chrome://tracing or ui.perfetto.dev.
+
+        Args:
+            filename (str): Path of the JSON file.
+        """
+        pid = os.getpid()
+        # Name the threads, then add one complete event per span
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': thread_name}}
+                  for tid, thread_name in self._thread_names.items()]
+        for name, device, start_ns, duration_ns, tid, args in self.spans():
+            events.append({
+                'name': name,
+                'cat': device or '',
+                'ph': 'X',  # Complete event, with a start and a duration
+                'ts': start_ns / 1e3,  # Microseconds
+                'dur': duration_ns / 1e3,
+                'pid': pid,
+                'tid': tid,
+                'args': {key: value if isinstance(value, (int, float, str, bool)) or value is None else repr(value)
+                         for key, value in args.items()},
+            })
+        with open(filename, 'w') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+
+    def summary(self):
+        """
+        Returns:
+            dict: For every (device, name) step, the number of spans and their total, mean and maximum duration in
+            seconds, sorted by decreasing total duration.
+        """
+        steps = {}
+        for name, device, _, duration_ns, _, _ in self.spans():
+            stats = steps.setdefault((device, name), [0, 0, 0])
+            stats[0] += 1
+            stats[1] += duration_ns
+            stats[2] = max(stats[2], duration_ns)
+        rows = sorted(steps.items(), key=lambda item: -item[1][1])
+        return {key: {'count': count, 'total_s': total * 1e-9, 'mean_s': total * 1e-9 / count, 'max_s': peak * 1e-9}
+                for key, (count, total, peak) in rows}
+
+    def print_summary(self):
+        """
+        Prints the summary as a table.
+        """
+        print(f"{'device':<20} {'step':<28} {'count':>7} {'total (s)':>10} {'mean (ms)':>10} {'max (ms)':>10}")
+        for (device, name), stats in self.summary().items():
+            print(f"{device or '':<20} {name:<28} {stats['count']:>7} {stats['total_s']:>10.3f} "
+                  f"{1e3 * stats['mean_s']:>10.2f} {1e3 * stats['max_s']:>10.2f}")
+
+
+# The process-wide tracer shared by all device drivers and acquisition methods.
+tracer = Tracer()
@@ -1,7 +1,8 @@
 # Import necessary libraries
 import re  # For regular expressions
 import time  # For sleep function (used in loops to introduce delays)
-from KURIOS_COMMAND_LIB import *  # Import commands for controlling the KURIOS tunable filter
+from statecache import shadow_state  # Skips redundant writes of unchanged filter settings
+from tracer import tracer  # Per-step timing trace
 
 def GetDeviceSNCN(IDStr):
     """
@@ -51,17 +52,18 @@ def GetDeviceOpticalHeadTypeNumber(hex_string, target_dict, max_length=4):
     return target_ls  # Return the matched features from the binary string
 
 
-def CommonFunc(serialNumber):
+def CommonFunc(serialNumber, lib):
     """
     Common initialization function for the Kurios device, retrieving device status, temperature, and specifications.
 
     Args:
         serialNumber (str): The serial number of the device to open.
+        lib: The KURIOS command library (KURIOS_COMMAND_LIB, or a stand-in with the same functions).
 
     Returns:
         int: The handle for the opened device (hdl) if successful, otherwise returns -1.
     """
-    hdl = KuriosOpen(serialNumber, 115200, 3)  # Open the device with specified baud rate and timeout
+    hdl = lib.KuriosOpen(serialNumber, 115200, 3)  # Open the device with specified baud rate and timeout
     if hdl < 0:
         print("Connect ", serialNumber, "fail")
         return -1
@@ -69,12 +71,12 @@ def CommonFunc(serialNumber):
         print("Connect ", serialNumber, "successful")
 
     # Check if the device is open
-    result = KuriosIsOpen(serialNumber)
+    result = lib.KuriosIsOpen(serialNumber)
     print("KuriosIsOpen ", result)
 
     # Retrieve device ID information
     id = []
-    result = KuriosGetId(hdl, id)
+    result = lib.KuriosGetId(hdl, id)
     if result < 0:
         print("KuriosGetId fail ", result)
     else:
@@ -89,7 +91,7 @@ def CommonFunc(serialNumber):
     # Get device status
     DeviceStatus = [0]
     DeviceStatusList = {0: 'initialization', 1: 'warm up', 2: 'ready'}
-    result = KuriosGetStatus(hdl, DeviceStatus)
+    result = lib.KuriosGetStatus(hdl, DeviceStatus)
     if result < 0:
         print("Get device status fail", result)
     else:
@@ -97,7 +99,7 @@ def CommonFunc(serialNumber):
 
     # Get device temperature
     DeviceTem = [0]
-    result = KuriosGetTemperature(hdl, DeviceTem)
+    result = lib.KuriosGetTemperature(hdl, DeviceTem)
     if result < 0:
         print("Get device Temperature fail", result)
     else:
@@ -106,7 +108,7 @@ def CommonFunc(serialNumber):
     # Get device wavelength specification
     MaxWavelength = [0]
     MinWavelength = [0]
-    result = KuriosGetSpecification(hdl, MaxWavelength, MinWavelength)
+    result = lib.KuriosGetSpecification(hdl, MaxWavelength, MinWavelength)
     if result < 0:
         print("KuriosGetSpecification fail ", result)
     else:
@@ -117,7 +119,7 @@ def CommonFunc(serialNumber):
     SpectrumRangeList = {0: 'Visible', 1: 'NIR'}
     BandwidthMode = [0]
     BandwidthModeList = {0: 'BLACK', 1: 'WIDE', 2: 'MEDIUM', 3: 'NARROW'}
-    result = KuriosGetOpticalHeadType(hdl, SpectrumRange, BandwidthMode)
+    result = lib.KuriosGetOpticalHeadType(hdl, SpectrumRange, BandwidthMode)
     if result < 0:
         print("KuriosGetOpticalHeadType fail ", result)
     else:
@@ -139,27 +141,46 @@ class TunableFilter:
         Initializes the TunableFilter class without connecting to the device.
         """
         self.hdl = None  # Device handle is initialized to None
+        self.lib = None  # KURIOS command library, loaded by open()
+        self.state = None  # Last wavelength and bandwidth applied, registered by open()
+
+    def _open_library(self):
+        """
+        Loads the KURIOS command library. The DLL is loaded here rather than at import, so that the driver can run
+        on top of a stand-in library (see simulated.py).
+
+        Returns:
+            The KURIOS_COMMAND_LIB module.
+        """
+        import KURIOS_COMMAND_LIB  # Commands for controlling the KURIOS tunable filter
+        return KURIOS_COMMAND_LIB
 
     def open(self):
         """
         Opens the connection to the first detected KURIOS Tunable Filter device.
         """
-        # List connected devices
-        devs = KuriosListDevices()
+        # Load the command library and list connected devices
+        if self.lib is None:
+            self.lib = self._open_library()
+        devs = self.lib.KuriosListDevices()
         print(devs)
         if len(devs) <= 0:
             print('There are no devices connected')
             exit()
 
-        # Open the first device
+        # Open the first device; its settings are unknown until written
         Kurios = devs[0]
-        self.hdl = CommonFunc(Kurios[0])
+        self.hdl = CommonFunc(Kurios[0], self.lib)
+        if self.state is not None:
+            shadow_state.unregister(self.state)  # Reopened without close()
+        self.state = shadow_state.register('TunableFilter')
 
     def close(self):
         """
         Closes the connection to the KURIOS Tunable Filter device.
         """
-        result = KuriosClose(self.hdl)  # Close the device
+        result = self.lib.KuriosClose(self.hdl)  # Close the device
+        shadow_state.unregister(self.state)
         if result == 0:
             print("Kurios Close successfully!")
         else:
@@ -172,8 +193,13 @@ class TunableFilter:
         Args:
             bandwidth (int): The bandwidth mode (1 = BLACK; 2 = WIDE; 4 = MEDIUM; 8 = NARROW).
 
+        The set and the verifying get are skipped if the filter is already in this mode.
         """
-        result = KuriosSetBandwidthMode(self.hdl, bandwidth)
+        if self.state.is_current('bandwidth', bandwidth, io_calls=2):
+            return
+
+        with tracer.span('set_bandwidth', self.state.name, bandwidth=bandwidth):
+            result = self.lib.KuriosSetBandwidthMode(self.hdl, bandwidth)
         if result < 0:
             print("Set Bandwidth mode fail", result)
         else:
@@ -182,11 +208,14 @@ class TunableFilter:
         # Verify the current bandwidth mode
         BandwidthMode = [0]
         BandwidthModeList = {1: 'BLACK', 2: 'WIDE', 4: 'MEDIUM', 8: 'NARROW'}
-        result = KuriosGetBandwidthMode(self.hdl, BandwidthMode)
+        with tracer.span('get_bandwidth', self.state.name):
+            result = self.lib.KuriosGetBandwidthMode(self.hdl, BandwidthMode)
         if result < 0:
             print("Get Bandwidth mode fail", result)
         else:
             print("Get Bandwidth mode:", BandwidthModeList.get(BandwidthMode[0]))
+            if BandwidthMode[0] == bandwidth:
+                self.state.update('bandwidth', bandwidth)
 
     def set_wavelength(self, wavelength=550):
         """
@@ -196,9 +225,148 @@ class TunableFilter:
             wavelength (int): The desired wavelength in nanometers (range: 420-730nm).
 
         """
-        result = KuriosSetWavelength(self.hdl, wavelength)
+        if self.state.is_current('wavelength', wavelength):
+            return
+
+        with tracer.span('set_wavelength', self.state.name, wavelength=wavelength):
+            result = self.lib.KuriosSetWavelength(self.hdl, wavelength)
         if result < 0:
             print(f"Set wavelength {wavelength}nm fail", result)
+        else:
+            self.state.update('wavelength', wavelength)
+
+    def get_status(self):
+        """
+        Reads the status of the KURIOS Tunable Filter.
+
+        Returns:
+            int: 0 = initialization, 1 = warm up, 2 = ready, or None if the status could not be read.
+        """
+        DeviceStatus = [0]
+        result = self.lib.KuriosGetStatus(self.hdl, DeviceStatus)
+        if result < 0:
+            print("Get device status fail", result)
+            return None
+        return DeviceStatus[0]
+
+    def get_wavelength(self):
+        """
+        Reads the wavelength the KURIOS Tunable Filter reports being tuned to.
+
+        Returns:
+            int: The wavelength in nanometers, or None if it could not be read.
+        """
+        Wavelength = [0]
+        result = self.lib.KuriosGetWavelength(self.hdl, Wavelength)
+        if result < 0:
+            print("Get wavelength fail", result)
+            return None
+        return Wavelength[0]
+
+    def wait_settled(self, wavelength, timeout_s=1.0, poll_s=1e-3):
+        """
+        Polls the filter until it is ready and reports the requested wavelength.
+
+        Args:
+            wavelength (int): The wavelength last set, in nanometers.
+            timeout_s (float): Maximum time to poll in seconds (default: 1 s).
+            poll_s (float): Time between polls in seconds (default: 1 ms).
+
+        Returns:
+            float: The time in seconds until the filter reported being settled, or None on timeout.
+        """
+        t_start = time.perf_counter()
+        with tracer.span('wait_settled', self.state.name, wavelength=wavelength):
+            while time.perf_counter() - t_start < timeout_s:
+                if self.get_status() == 2 and self.get_wavelength() == int(wavelength):
+                    return time.perf_counter() - t_start
+                time.sleep(poll_s)
+        return None
+
+    @tracer.traced('load_sequence', 'TunableFilter')
+    def load_sequence(self, wavelengths, interval_ms=100, bandwidth=None):
+        """
+        Uploads a list of wavelengths to the KURIOS as a sequence, replacing any sequence already stored.
+
+        Args:
+            wavelengths (iterable): The wavelengths of the sequence steps in nanometers, in acquisition order.
+            interval_ms (int): Dwell time of each step in milliseconds, used in the internally clocked mode (default: 100).
+            bandwidth (int): Bandwidth mode of every step (1 = BLACK; 2 = WIDE; 4 = MEDIUM; 8 = NARROW)
+                (default: None uses the current bandwidth mode).
+
+        Raises:
+            RuntimeError: If the current bandwidth mode could not be read, or any step could not be written to the
+                device.
+        """
+        if bandwidth is None:
+            BandwidthMode = [0]
+            result = self.lib.KuriosGetBandwidthMode(self.hdl, BandwidthMode)
+            if result < 0:
+                raise RuntimeError(f"Get Bandwidth mode fail {result}")
+            bandwidth = BandwidthMode[0]
+
+        # Delete all existing steps
+        result = self.lib.KuriosSetDeleteSequenceStep(self.hdl, 0)
+        if result < 0:
+            raise RuntimeError(f"Delete sequence fail {result}")
+
+        result = self.lib.KuriosSetDefaultTimeIntervalForSequence(self.hdl, int(interval_ms))
+        if result < 0:
+            raise RuntimeError(f"Set sequence interval fail {result}")
+
+        # Sequence steps are numbered from 1
+        for index, wl in enumerate(wavelengths):
+            result = self.lib.KuriosSetInsertSequenceStep(self.hdl, index + 1, int(wl), int(interval_ms), bandwidth)
+            if result < 0:
+                raise RuntimeError(f"Insert sequence step {index + 1} ({int(wl)}nm) fail {result}")
+
+        SequenceLength = [0]
+        self.lib.KuriosGetSequenceLength(self.hdl, SequenceLength)
+        print("Sequence loaded, length:", SequenceLength[0])
+
+    def start_sequence(self, triggered=True):
+        """
+        Starts stepping through the loaded sequence.
+
+        In triggered mode the filter sits at the first step and advances one step per rising edge on its trigger
+        input (e.g. wired to the camera's frame trigger output) or per call to trigger(). Otherwise the filter steps
+        on its own internal clock using the interval given to load_sequence().
+
+        Args:
+            triggered (bool): If True, step on external triggers; if False, step on the internal clock (default: True).
+        """
+        # Normal (non-inverted) trigger out signal
+        result = self.lib.KuriosSetTriggerOutSignalMode(self.hdl, 0)
+        if result < 0:
+            print("Set trigger out signal mode fail", result)
+
+        # The sequence now drives the wavelength and bandwidth
+        self.state.invalidate('wavelength')
+        self.state.invalidate('bandwidth')
+
+        # Output mode 2 = sequenced (internal clock), 3 = sequenced (external trigger)
+        result = self.lib.KuriosSetOutputMode(self.hdl, 3 if triggered else 2)
+        if result < 0:
+            raise RuntimeError(f"Set sequence output mode fail {result}")
+
+    def trigger(self):
+        """
+        Advances a triggered sequence by one step from software (requires firmware version 3.1 or above).
+        """
+        with tracer.span('trigger', self.state.name):
+            result = self.lib.KuriosSetForceTrigger(self.hdl)
+        if result < 0:
+            print("Force trigger fail", result)
+
+    def stop_sequence(self):
+        """
+        Stops the sequence and returns the filter to manual mode, so that set_wavelength() takes effect again.
+        """
+        result = self.lib.KuriosSetOutputMode(self.hdl, 1)
+        if result < 0:
+            print("Set manual output mode fail", result)
+        self.state.invalidate('wavelength')
+        self.state.invalidate('bandwidth')
 
 
 if __name__ == '__main__':
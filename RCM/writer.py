@@ -0,0 +1,147 @@
+# Import necessary libraries
+import queue  # Provides the bounded FIFO queue that holds frames waiting to be written
+import threading  # Provides the background writer threads
+import time  # Provides time-related functions
+import imageio  # For writing image files
+from tracer import tracer  # Per-step timing trace
+
+# Sentinel telling a writer thread to exit.
+_STOP = object()
+
+
+class AsyncImageWriter:
+    """
+    Writes images to disk in the background so that acquisition loops are not held up by image encoding.
+
+    Frames are handed over through a bounded queue and written by a small pool of threads. When the queue is full,
+    write() blocks until a slot frees up (backpressure), so memory use stays bounded if the disk cannot keep up.
+    Frames must not be modified by the caller after they have been submitted.
+    """
+
+    def __init__(self, workers=2, max_queue=8, write_func=imageio.imwrite):
+        """
+        Initializes the writer and starts its worker threads.
+
+        Args:
+            workers (int): Number of writer threads (default: 2).
+            max_queue (int): Maximum number of frames waiting to be written before write() blocks (default: 8).
+            write_func (callable): write_func(filename, frame) used to save each frame (default: imageio.imwrite).
+                Any key understood by write_func may be passed in place of a filename, e.g. HyperspectralStore.write_frame.
+        """
+        self.write_func = write_func
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._errors = []
+        self._closed = False
+
+        # Counters reported by stats()
+        self._frames_written = 0
+        self._bytes_written = 0
+        self._blocked_s = 0.0
+        self._t_start = time.perf_counter()
+
+        self._threads = [threading.Thread(target=self._worker, name=f'image-writer-{i}', daemon=True)
+                         for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def queue_depth(self):
+        """
+        The number of frames currently waiting to be written.
+        """
+        return self._queue.qsize()
+
+    def write(self, filename, frame):
+        """
+        Queues a frame to be written to `filename`, blocking while the queue is full.
+
+        Args:
+            filename (str): The path to write the frame to.
+            frame (np.ndarray): The image to write.
+
+        Raises:
+            RuntimeError: If the writer has been closed.
+            Exception: Re-raises the first error raised by a writer thread.
+        """
+        if self._closed:
+            raise RuntimeError('AsyncImageWriter: write() called after close()')
+        if self._errors:
+            raise self._errors[0]
+
+        t_start = time.perf_counter()
+        self._queue.put((filename, frame))
+        blocked = time.perf_counter() - t_start
+        with self._lock:
+            self._blocked_s += blocked
+
+    def stats(self):
+        """
+        Reports the state and throughput of the writer.
+
+        Returns:
+            dict: queue depth, frames and megabytes written, throughput in frames/s and MB/s since the writer was
+            created, and the total time callers spent blocked on a full queue.
+        """
+        with self._lock:
+            elapsed = time.perf_counter() - self._t_start
+            mb_written = self._bytes_written / 1e6
+            return {
+                'queue_depth': self.queue_depth,
+                'frames_written': self._frames_written,
+                'mb_written': mb_written,
+                'frames_per_s': self._frames_written / elapsed if elapsed > 0 else 0.0,
+                'mb_per_s': mb_written / elapsed if elapsed > 0 else 0.0,
+                'blocked_s': self._blocked_s,
+            }
+
+    def flush(self):
+        """
+        Blocks until every queued frame has been written.
+        """
+        self._queue.join()
+        if self._errors:
+            raise self._errors[0]
+
+    def close(self):
+        """
+        Writes every queued frame, then stops the worker threads.
+
+        Raises:
+            Exception: Re-raises the first error raised by a writer thread.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        if self._errors:
+            raise self._errors[0]
+
+    def _worker(self):
+        """
+        Writes queued frames until the stop sentinel is received.
+        """
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                filename, frame = item
+                with tracer.span('encode_write', 'AsyncImageWriter', file=filename, nbytes=frame.nbytes):
+                    self.write_func(filename, frame)
+                with self._lock:
+                    self._frames_written += 1
+                    self._bytes_written += frame.nbytes
+            except Exception as err:
+                self._errors.append(err)
+            finally:
+                self._queue.task_done()
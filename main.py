@@ -5,13 +5,26 @@ sys.path.append('../RCM/RCM')  # Append the path for custom modules
 # Import other libraries and custom modules
 import numpy as np  # For array handling and numerical computations
 import matplotlib.pyplot as plt  # For plotting images and graphs
-from camera import Camera_HS  # High-speed camera interface
-from camera import Camera_BA  # Baseline camera interface
-# from light import DC2200  # LED controller interface
-from stage import Controller  # Stage controller interface
-from tunablefilter import TunableFilter  # Tunable filter control interface
+from pipeline import AcquisitionPipeline  # Pipelined filter tuning, exposure, processing and saving
+from writer import AsyncImageWriter  # Background image writing
+from datastore import HyperspectralStore  # Chunked single-file HDF5 storage
+from datastore import SpectralMapStore  # Binary storage of X-Y spectral maps
+from scanplanner import plan_serpentine, estimate_scan  # Serpentine X-Y scan planning
+from scanplanner import bin_fly_line  # Resampling of fly-scan lines
+from scanplanner import plan_wavelength_order  # Order of the bands minimising filter transitions
+import threading  # For tracking the stage position during fly scans
+from statecache import shadow_state  # Counters of device writes skipped by the drivers
+from registry import DeviceRegistry  # Persistent, lazily opened device sessions
+from scheduler import DeadlineScheduler  # Timepoints on a fixed grid of deadlines
+from tracer import tracer  # Per-step timing trace of the devices and acquisitions
+from settling import SettlingModel, calibrate_settling  # Measured settling time of the tunable filter
+from asyncdevices import AsyncDevice  # Asyncio facades running each device on its own worker thread
+import asyncio  # For the asynchronous acquisition methods
+import functools  # For binding the arguments of background saves
+from concurrent.futures import ThreadPoolExecutor  # For saving data in the background
 import time  # For time delays and time management
 import os  # For file and directory operations
+import json  # For writing acquisition metadata
 import cv2  # OpenCV for image processing
 import imageio  # For writing image files
 
@@ -28,10 +41,41 @@ class FullControlMicroscope:
     This class provides functions to control each component and capture data from the system.
     """
 
-    def __init__(self):
+    def __init__(self, simulate=False, trace=False):
         """
         Initializes and connects all the peripherals (cameras, LED, stage, tunable filter) required for microscope control.
+
+        Args:
+            simulate (bool): If True, build the microscope from the simulated devices in `simulated.py`, so that
+                acquisitions can be run and profiled without any instruments attached (default: False).
+            trace (bool): If True, record the time spent in every device call and acquisition step; see
+                save_trace() (default: False).
         """
+        if trace:
+            tracer.enable()
+
+        # Import the device drivers, or their simulated counterparts. The drivers are imported here rather than at
+        # module level because the tunable filter and spectrometer SDKs can only be loaded on the acquisition PC.
+        if simulate:
+            from simulated import SimCamera_HS as Camera_HS  # Simulated high-speed camera
+            from simulated import SimCamera_BA as Camera_BA  # Simulated baseline camera
+            from simulated import SimController as Controller  # Simulated stage controller
+            from simulated import SimTunableFilter as TunableFilter  # Simulated tunable filter
+            from simulated import SimOcean_Spectrometer as Ocean_Spectrometer  # Simulated spectrometer
+        else:
+            from camera import Camera_HS  # High-speed camera interface
+            from camera import Camera_BA  # Baseline camera interface
+            # from light import DC2200  # LED controller interface
+            from stage import Controller  # Stage controller interface
+            from tunablefilter import TunableFilter  # Tunable filter control interface
+            from spectrometer_VIS import Ocean_Spectrometer  # Ocean Optics spectrometer interface
+
+        # Register the devices that are opened on first use and then kept open until close()
+        self.devices = DeviceRegistry()
+        self.devices.register('spectrometer_vis', Ocean_Spectrometer, close='close_device')
+        if not simulate:
+            self.devices.register('spectrometer_swir', self._open_swir_spectrometer)
+
         # Initialize the high-speed camera
         self.chs = Camera_HS()
         print('HS camera connected')
@@ -58,6 +102,21 @@ class FullControlMicroscope:
         self.lcf.open()  # Open connection to the tunable filter
         print('LC connected')
 
+        # Load the cached settling-time calibration of the tunable filter (30 ms per change until calibrated)
+        self.settling = SettlingModel.load()
+        if not self.settling.calibrated:
+            print('Filter settling not calibrated; see calibrate_filter_settling()')
+
+        # Asyncio facades for the asynchronous acquisition methods; each device runs one command at a time on its
+        # own worker thread, so commands to different devices overlap
+        self.achs = AsyncDevice(self.chs, 'camera_hs')
+        # self.aled = AsyncDevice(self.led, 'led')  # Uncomment with the LED controller
+        self.asta = AsyncDevice(self.sta, 'stage')
+        self.alcf = AsyncDevice(self.lcf, 'filter')
+        self._aspec_vis = None
+        self.last_acquisition_order = None  # Canonical indices of the bands of the last datacube, in acquisition order
+        self._save_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='save')  # Background saving
+
     def close(self):
         """
         Closes all peripherals and releases resources.
@@ -69,46 +128,246 @@ class FullControlMicroscope:
         # self.led.close()  # Close the LED controller
         self.sta.close()  # Close the motorized stage
         self.lcf.close()  # Close the tunable filter
+        self.devices.close_all()  # Close the spectrometers, if they were used
+        for facade in (self.achs, self.asta, self.alcf, self._aspec_vis):
+            if facade is not None:
+                facade.shutdown()
+        self._save_executor.shutdown()  # Waits for background saves to finish
+        print('Device writes skipped:', shadow_state.stats()['total'])
+
+    def save_trace(self, filename):
+        """
+        Saves the recorded timing trace as Chrome trace JSON and prints a summary table of the time per step.
+
+        The JSON file can be opened in chrome://tracing or https://ui.perfetto.dev. Tracing is enabled with
+        `FullControlMicroscope(trace=True)` or `tracer.enable()`.
+
+        Args:
+            filename (str): Path of the JSON file.
+        """
+        tracer.export_chrome(filename)
+        tracer.print_summary()
+
+    def calibrate_filter_settling(self, method='image', bandwidths=(2, 4, 8), exposure_time=1e-3, repeats=3, cache=True):
+        """
+        Measures the settling time of the tunable filter against the wavelength jump in each bandwidth mode.
+
+        The result replaces the fixed settle time of aquire_HS_datacube(), and is cached on disk so that it is loaded
+        again the next time the microscope is started.
+
+        Args:
+            method (str): 'image' waits for the mean intensity of the high-speed camera to stabilise, with a bright
+                uniform target in view; 'poll' polls the filter's status and wavelength, which only works if the
+                filter reports the new wavelength once it has settled (default: 'image').
+            bandwidths (iterable): Bandwidth modes to calibrate (1 = BLACK; 2 = WIDE; 4 = MEDIUM; 8 = NARROW)
+                (default: WIDE, MEDIUM and NARROW).
+            exposure_time (float): Camera exposure time in seconds for the 'image' method (default: 1 ms).
+            repeats (int): Number of measurements of each jump and direction (default: 3).
+            cache (bool): If True, save the calibration to 'filter_settling.json' (default: True).
+
+        Returns:
+            SettlingModel: The calibrated settling model.
+        """
+        bandwidth = self.lcf.state.get('bandwidth')
+        self.settling = calibrate_settling(self.lcf, bandwidths=bandwidths, repeats=repeats, method=method,
+                                           camera=self.chs, exposure_time=exposure_time)
+        # Restore the bandwidth mode used before the calibration
+        if bandwidth is not None:
+            self.lcf.set_bandwidth(bandwidth)
+        if cache:
+            self.settling.save()
+        return self.settling
+
+    @property
+    def spec_vis(self):
+        """
+        The persistent Ocean Optics spectrometer session, opened on first use.
+        """
+        return self.devices.get('spectrometer_vis')
+
+    @property
+    def aspec_vis(self):
+        """
+        The asyncio facade over the Ocean Optics spectrometer, opening it on first use.
+        """
+        if self._aspec_vis is None:
+            self._aspec_vis = AsyncDevice(self.spec_vis, 'spectrometer_vis')
+        return self._aspec_vis
+
+    @property
+    def spec_swir(self):
+        """
+        The persistent SWIR spectrometer session, opened on first use.
+        """
+        return self.devices.get('spectrometer_swir')
 
-    def aquire_HS_datacube(self, wavelength_range=[420, 730], no_spectra=5, exposuretime=[], save_folder=[]):
+    @staticmethod
+    def _open_swir_spectrometer():
+        """
+        Opens the SWIR spectrometer. Its driver is imported here as it loads the HSSUSB2 .NET assembly at import.
+        """
+        from Spectrometer_SWIR import SWIRSpectrometer  # Hamamatsu SWIR spectrometer interface
+        return SWIRSpectrometer()
+
+    def _apply_roi(self, roi=None, binning=1):
+        """
+        Applies a region of interest and binning to the high-speed camera.
+
+        Args:
+            roi (tuple): Region of interest (hstart, hend, vstart, vend) in sensor pixels (default: None uses the full sensor).
+            binning (int): Binning factor applied in both directions (default: 1).
+
+        Returns:
+            dict: The ROI, binning and frame shape actually applied by the camera, to be saved with the data.
+        """
+        hstart, hend, vstart, vend = self.chs.sensor_roi if roi is None else roi
+        self.chs.set_roi(hstart, hend, vstart, vend, binning, binning)
+        applied = self.chs.roi
+        return {'roi': [int(v) for v in applied[:4]],
+                'binning': [int(v) for v in applied[4:]],
+                'frame_shape': [int(v) for v in self.chs.frame_shape]}
+
+    def _write_metadata(self, save_folder, metadata, wavelengths):
+        """
+        Writes acquisition metadata to 'image_cap_metadata.json' in the save folder.
+        """
+        metadata = dict(metadata, wavelengths=[float(wl) for wl in wavelengths])
+        with open(os.path.join(save_folder, 'image_cap_metadata.json'), 'w') as file:
+            json.dump(metadata, file, indent=2)
+
+    def aquire_HS_datacube(self, wavelength_range=[420, 730], no_spectra=5, exposuretime=[], save_folder=[], settle_s=None, memmap_path=None, save_format='png', hardware_sequence=False, force_trigger=False, roi=None, binning=1, wavelength_order='auto'):
         """
         Acquires a hyper-spectral datacube using the high-speed camera at different wavelengths controlled by the tunable filter.
 
+        The acquisition is pipelined (see AcquisitionPipeline): the filter is tuned to the next wavelength while the
+        previous frame is still being written to disk. The datacube is allocated once and every frame is read
+        straight into its slice.
+
         Args:
             wavelength_range (list): The range of wavelengths to capture, in nanometers (default: [420, 730]).
             no_spectra (int): The number of spectral points to capture (default: 5).
             exposuretime (list or int): Exposure time for the camera in milliseconds (default: [] uses the camera's current exposure).
             save_folder (str): Folder to save captured images (default: [] does not save images).
+            settle_s (float): Time in seconds to wait for the filter to settle after each wavelength change
+                (default: None waits the settling time measured by calibrate_filter_settling() for each jump).
+            memmap_path (str): Path of a .npy file to memory-map the datacube to (default: None keeps it in RAM).
+            save_format (str): 'png' saves one 16-bit PNG per band, 'hdf5' saves a single chunked 'datacube.h5'
+                HyperspectralStore (default: 'png').
+            hardware_sequence (bool): If True, the wavelengths are uploaded once as a KURIOS sequence and the filter
+                steps on its trigger input, which must be wired to the camera's trigger (strobe) output, with that
+                output enabled in the camera, so that it advances at the end of each exposure. The camera driver does
+                not configure the output, so the wavelength the filter reports is checked before each exposure, and a
+                RuntimeError is raised if it has not stepped (default: False sets each wavelength from software).
+            force_trigger (bool): With `hardware_sequence`, step the filter with a software trigger instead of the
+                hardware trigger line; use this when the trigger line is not wired (default: False).
+            roi (tuple): Region of interest (hstart, hend, vstart, vend) in sensor pixels (default: None uses the full sensor).
+            binning (int): Binning factor applied in both directions (default: 1).
+            wavelength_order (str): 'auto' sweeps the bands blue to red or red to blue, whichever has the lower
+                filter transition cost from the current wavelength (see plan_wavelength_order), so repeated
+                datacubes alternate direction; 'ascending' always sweeps blue to red (default: 'auto').
+
+        The ROI, binning, exposure and acquisition order (the canonical indices of the bands in the order they were
+        acquired) are saved with the data: as attributes of the HDF5 store, or in 'image_cap_metadata.json' next to
+        the PNGs. The acquisition order of the last datacube is also kept in `last_acquisition_order`.
 
         Returns:
-            tuple: A tuple containing the wavelengths and captured images (hypercube) if `save_folder` is not provided.
+            tuple: The wavelengths as a (no_spectra,) array and the hypercube as a (no_spectra, H, W) uint16 array,
+            both in ascending wavelength order whatever the acquisition order.
         """
-        step_size = (wavelength_range[1] - wavelength_range[0]) / no_spectra  # Calculate step size for wavelengths
-        wavelengths = np.arange(wavelength_range[0], wavelength_range[1], step_size)  # Generate wavelength steps
+        assert wavelength_order in ('auto', 'ascending'), "wavelength_order must be 'auto' or 'ascending'"
 
         # Set exposure time to current camera exposure if not provided
         exposure_time = self.chs.exposure if exposuretime == [] else exposuretime
 
-        wavelengths = []  # List to store wavelengths used
-        hypercube = []  # List to store captured images
-
-        # Iterate through the specified wavelength range and capture images
-        for wl in np.linspace(wavelength_range[0], wavelength_range[1], no_spectra):
-            wavelengths.append(wl)  # Append the wavelength to the list
-            self.lcf.set_wavelength(int(wl))  # Set the tunable filter to the current wavelength
-            time.sleep(3e-2)  # Small delay to ensure the filter is set
-            hypercube.append(self.chs.single_exposure(exposure_time=exposure_time))  # Capture the image
-
-        # Return the data or save images based on the `save_folder` parameter
-        if save_folder == []:
-            return wavelengths, hypercube
+        # Wavelengths to capture, in canonical (ascending) order
+        wavelengths = np.linspace(wavelength_range[0], wavelength_range[1], no_spectra)
+
+        # Order in which the bands are acquired, as canonical indices; frames are stored in canonical order
+        start_wavelength = self.lcf.state.get('wavelength') if wavelength_order == 'auto' else None
+        bandwidth = self.lcf.state.get('bandwidth')
+        order = plan_wavelength_order(wavelengths, start_wavelength,
+                                      lambda a, b: self.settling.settle_time(a, b, bandwidth))
+        self.last_acquisition_order = order
+
+        # Apply the region of interest and binning (skipped by the camera if unchanged)
+        metadata = self._apply_roi(roi, binning)
+        metadata['exposure_time'] = float(exposure_time)
+        metadata['acquisition_order'] = [int(index) for index in order]
+
+        # Allocate the datacube once, either in memory or memory-mapped to disk
+        shape = (no_spectra,) + self.chs.frame_shape
+        if memmap_path is None:
+            hypercube = np.empty(shape, dtype=np.uint16)
         else:
-            for index, wl in enumerate(wavelengths):
+            hypercube = np.lib.format.open_memmap(memmap_path, mode='w+', dtype=np.uint16, shape=shape)
+
+        # The pipeline indices below are positions in the acquisition order
+        def tune(index, wl):
+            if not hardware_sequence:
+                self.lcf.set_wavelength(int(wl))  # Set the tunable filter to the current wavelength
+            else:
+                if force_trigger and index > 0:
+                    self.lcf.trigger()  # Step the filter to the next wavelength of the sequence
+                # Nothing else confirms that the filter stepped, so check the wavelength it reports before exposing
+                if self.lcf.wait_settled(int(wl)) is None:
+                    raise RuntimeError(f"aquire_HS_datacube: the filter did not step to {int(wl)} nm (it reports "
+                                       f"{self.lcf.get_wavelength()} nm); check that the camera's trigger output is "
+                                       "enabled and wired to the filter's trigger input, or use force_trigger=True")
+
+        def expose(index, wl):
+            # Capture the image straight into its slice of the datacube
+            return self.chs.single_exposure(exposure_time=exposure_time, out=hypercube[order[index]])
+
+        # Open a single-file store if requested
+        store = None
+        if save_folder != [] and save_format == 'hdf5':
+            store = HyperspectralStore(os.path.join(save_folder, 'datacube.h5'), wavelengths, shape[1:], mode='w',
+                                       attrs=metadata)
+            t_index = store.append_timepoint(0.0)
+        elif save_folder != []:
+            self._write_metadata(save_folder, metadata, wavelengths)
+
+        def write(index, wl, frame):
+            index = order[index]  # Canonical index of the band
+            if store is not None:
+                store.write_frame((t_index, index), frame)  # Save image as a compressed chunk
+            else:
                 # Save each captured image to the specified folder
                 fn = os.path.join(save_folder, f'image_cap_{index:04d}_{wl}_img.png')
-                imageio.imwrite(fn, hypercube[index].astype(np.uint16))  # Save image as 16-bit PNG
-
-    def aquire_HS_time_series(self, wavelength_range=[420, 730], no_spectra=5, exposuretime=[], save_folder=[], time_increment=10, total_time=7200):
+                imageio.imwrite(fn, frame)  # Save image as 16-bit PNG
+
+        # Wait for the filter to settle after each change, for the time measured for its jump and bandwidth mode
+        if settle_s is None:
+            previous = [None if hardware_sequence else self.lcf.state.get('wavelength')]
+
+            def settle_s(index, wl):
+                wait_s = self.settling.settle_time(previous[0], int(wl), bandwidth)
+                previous[0] = int(wl)
+                return wait_s
+
+        pipeline = AcquisitionPipeline(tune, expose,
+                                       write=None if save_folder == [] else write,
+                                       settle_s=settle_s)
+        # Upload the wavelengths once; the filter then waits at the first step for triggers
+        if hardware_sequence:
+            self.lcf.load_sequence(wavelengths[order])
+            self.lcf.start_sequence(triggered=True)
+
+        try:
+            with tracer.span('datacube', 'FullControlMicroscope', no_spectra=no_spectra, exposure=exposure_time):
+                pipeline.run(wavelengths[order])
+        finally:
+            if hardware_sequence:
+                self.lcf.stop_sequence()
+            if store is not None:
+                store.close()
+
+        if memmap_path is not None:
+            hypercube.flush()
+
+        return wavelengths, hypercube
+
+    def aquire_HS_time_series(self, wavelength_range=[420, 730], no_spectra=5, exposuretime=[], save_folder=[], time_increment=10, total_time=7200, writer_threads=2, writer_queue=None, save_format='png', roi=None, binning=1, overrun='skip', wavelength_order='auto'):
         """
         Acquires a time-series of hyper-spectral images using the high-speed camera, capturing at regular intervals.
 
@@ -119,34 +378,86 @@ class FullControlMicroscope:
             save_folder (str): Folder to save captured images (default: [] does not save images).
             time_increment (int): Time increment between each acquisition in seconds (default: 10).
             total_time (int): Total time duration for the acquisition in seconds (default: 7200 seconds).
+            writer_threads (int): Number of background threads encoding and writing images (default: 2).
+            writer_queue (int): Maximum number of images waiting to be written before acquisition blocks
+                (default: None holds two datacubes).
+            save_format (str): 'png' saves one 16-bit PNG per frame, 'hdf5' appends every frame to a single chunked
+                'time_series.h5' HyperspectralStore with axes (time, wavelength, y, x) (default: 'png').
+            roi (tuple): Region of interest (hstart, hend, vstart, vend) in sensor pixels (default: None uses the full sensor).
+            binning (int): Binning factor applied in both directions (default: 1).
+            overrun (str): What to do when a datacube takes longer than `time_increment`: 'skip' the missed
+                timepoints, 'catch_up' by acquiring them straight away, or 'stretch' the rest of the series by the
+                delay (default: 'skip'). See DeadlineScheduler.
+            wavelength_order (str): 'auto' alternates the sweep direction between timepoints, so that no datacube
+                starts with a jump back across the whole range; 'ascending' always sweeps blue to red. Frames are
+                saved in ascending wavelength order either way, and the acquisition order of every timepoint is saved
+                as the (timepoints, no_spectra) 'acquisition_order' attribute of the HDF5 store or entry of
+                'image_cap_metadata.json' (default: 'auto').
 
         This function captures data at regular time intervals, saving the captured images in the specified folder.
+        Images are written in the background by an AsyncImageWriter so that PNG encoding does not delay the next timepoint.
+        Timepoints are scheduled on absolute deadlines of a monotonic clock, and their planned and actual start times
+        are saved to 'schedule.csv' in the save folder.
         """
+        assert wavelength_order in ('auto', 'ascending'), "wavelength_order must be 'auto' or 'ascending'"
+
+        max_queue = 2 * no_spectra if writer_queue is None else writer_queue
+
+        # Apply the region of interest and binning once for the whole series
+        metadata = self._apply_roi(roi, binning)
+        metadata['exposure_time'] = float(self.chs.exposure if exposuretime == [] else exposuretime)
+        metadata['time_increment'] = time_increment
+        wavelengths = np.linspace(wavelength_range[0], wavelength_range[1], no_spectra)
+
+        # Open a single-file store if requested; HDF5 writes are serialised, so a single writer thread is used
+        store = None
+        if save_format == 'hdf5':
+            store = HyperspectralStore(os.path.join(save_folder, 'time_series.h5'), wavelengths,
+                                       self.chs.frame_shape, mode='w', attrs=metadata)
+            writer = AsyncImageWriter(workers=1, max_queue=max_queue, write_func=store.write_frame)
+        else:
+            self._write_metadata(save_folder, metadata, wavelengths)
+            writer = AsyncImageWriter(workers=writer_threads, max_queue=max_queue)
 
-        t0 = time.time()  # Start time
-        ti = time.time()  # Current time
-        n = 0  # Counter for time steps
-        
-        # Loop until the total time is reached
-        while ti - t0 < total_time + 1: # one second added to capture image(s) at final time
-
-            # compute time since last acquisition sequence
-            time_since_last_acquisition = ti - (n - 1) * time_increment - t0
+        # Timepoints at 0, time_increment, ... up to and including total_time
+        scheduler = DeadlineScheduler(time_increment, total_time, overrun=overrun)
+        acquisition_order = []  # Canonical indices of the bands in acquisition order, per timepoint
 
-            # Capture data at each time increment
-            if time_since_last_acquisition > time_increment or n == 0:
+        try:
+            # Sleep until each timepoint's deadline, then acquire it
+            for tick in scheduler:
                 # Acquire hyperspectral datacube
-                wavelengths, hypercube = self.aquire_HS_datacube(wavelength_range=wavelength_range, no_spectra=no_spectra, exposuretime=exposuretime, save_folder=[])
-
-                # Save each captured image
-                for index, wl in enumerate(wavelengths):
-                    fn = os.path.join(save_folder, f'image_cap_{n:04d}_{wl}_{ti - t0:.2f}_img.png')
-                    imageio.imwrite(fn, hypercube[index].astype(np.uint16))  # Save image as 16-bit PNG
-
-                n += 1  # Increment the time increment counter
-            
-            time.sleep(1e-3) # Small delay to avoid excessive CPU usage
-            ti = time.time() # Update current time
+                wavelengths, hypercube = self.aquire_HS_datacube(wavelength_range=wavelength_range, no_spectra=no_spectra, exposuretime=exposuretime, save_folder=[], roi=roi, binning=binning, wavelength_order=wavelength_order)
+                acquisition_order.append([int(index) for index in self.last_acquisition_order])
+
+                # Queue each captured image for saving; time blocked on a full writer queue shows up in the trace
+                with tracer.span('queue_frames', 'FullControlMicroscope', timepoint=tick.index):
+                    if store is not None:
+                        t_index = store.append_timepoint(tick.actual_s)
+                    for index, wl in enumerate(wavelengths):
+                        if store is not None:
+                            writer.write((t_index, index), hypercube[index])  # Append to the store in the background
+                        else:
+                            fn = os.path.join(save_folder, f'image_cap_{tick.index:04d}_{wl}_{tick.actual_s:.2f}_img.png')
+                            writer.write(fn, hypercube[index])  # Save image as 16-bit PNG in the background
+        finally:
+            # Report and save the schedule
+            print('Schedule:', scheduler.summary())
+            if save_folder != []:
+                scheduler.save_log(os.path.join(save_folder, 'schedule.csv'))
+                if store is None:
+                    self._write_metadata(save_folder, dict(metadata, acquisition_order=acquisition_order),
+                                         wavelengths)
+
+            # Wait for all queued images to be written
+            try:
+                writer.close()
+                print('Image writer:', writer.stats())
+            finally:
+                if store is not None:
+                    if acquisition_order:
+                        store.data.attrs['acquisition_order'] = np.asarray(acquisition_order, dtype=np.int64)
+                    store.close()
 
     def aquire_single_spec_vis(self, exposure_time_Us=100000, num_average=5):
         """
@@ -159,21 +470,35 @@ class FullControlMicroscope:
         Returns:
             tuple: A tuple containing the wavelengths and the corresponding spectrum (counts).
 
-        This method uses the Ocean Optic spectrometer to capture a spectrum at the given exposure time.
+        This method uses the Ocean Optic spectrometer to capture a spectrum at the given exposure time. The
+        spectrometer is opened on the first call and kept open, so later calls only cost the integration time.
         """
-        # Initialize the spectrometer
-        spectrometer = Ocean_Spectrometer()
-
         # Capture the spectrum
-        wavelengths, spectrum = spectrometer.read_spectra(exposure_time_Us=exposure_time_Us, num_average=num_average)
+        wavelengths, spectrum = self.spec_vis.read_spectra(exposure_time_Us=exposure_time_Us, num_average=num_average)
 
         # Return the captured data
         return wavelengths, spectrum
 
+    def aquire_single_spec_swir(self, exposure_time_Us=20000, num_average=1):
+        """
+        Captures a single spectrum using the SWIR spectrometer.
+
+        Args:
+            exposure_time_Us (int): The exposure time in microseconds for the spectrometer (default: 20000).
+            num_average (int): The number of frames to average for the final spectrum (default: 1).
+
+        Returns:
+            tuple: A tuple containing the wavelengths and the corresponding spectrum (counts).
+        """
+        return self.spec_swir.read_spectra(exposure_time_Us=exposure_time_Us, num_average=num_average)
+
     def scan_xy_and_acquire_spectra(self, x_step, y_step, x_points, y_points, exposure_time_Us=100000, num_average=5, save_folder=None):
         """
         Moves the stage in X and Y directions relative to the current position over a grid of points and acquires a spectrum at each point.
 
+        The grid is visited in serpentine order (see plan_serpentine), so there is no flyback between rows and only
+        the minimal relative move is made between consecutive points. The first point is the current position.
+
         Args:
             x_step (float): The step size in micrometers for each move in the X direction.
             y_step (float): The step size in micrometers for each move in the Y direction.
@@ -181,51 +506,249 @@ class FullControlMicroscope:
             y_points (int): The number of points to measure in the Y direction.
             exposure_time_Us (int): The exposure time for the spectrometer in microseconds (default: 100000).
             num_average (int): The number of scans to average for the final spectrum (default: 5).
-            save_folder (str): The folder to save each spectrum (if provided).
+            save_folder (str): The folder to save the spectral map to (if provided). Each spectrum is written to the
+                SpectralMapStore as soon as it is acquired, so an interrupted scan keeps its data; reload it with
+                load_spectral_map().
 
         Returns:
-            dict: A dictionary with the (x, y) relative moves as keys and the captured spectra as values.
+            tuple: The wavelengths as a (n_pixels,) array and the spectra as a (y_points, x_points, n_pixels) float32
+            array, indexed by grid row and column.
         """
-        # Initialize the spectrometer
-        spectrometer = Ocean_Spectrometer()
+        # Use the persistent spectrometer session
+        spectrometer = self.spec_vis
+        wavelengths = spectrometer.wavelengths
+        x_um = x_step * np.arange(x_points)
+        y_um = y_step * np.arange(y_points)
+
+        # Allocate the spectral map, on disk if it is to be saved
+        store = None
+        if save_folder is not None:
+            store = SpectralMapStore(save_folder, wavelengths, x_um, y_um, mode='w',
+                                     attrs={'exposure_time_Us': exposure_time_Us, 'num_average': num_average})
+            spectral_map = store.spectra
+        else:
+            spectral_map = np.full((y_points, x_points, len(wavelengths)), np.nan, dtype=np.float32)
 
-        # Dictionary to store the spectra at each relative position
-        spectra_data = {}
+        # Plan the scan and report its expected cost
+        plan = plan_serpentine(x_step, y_step, x_points, y_points)
+        estimate = estimate_scan(plan, self.sta.motion_models[:2], dwell_s=num_average * exposure_time_Us * 1e-6)
+        print(f"Scan plan: {len(plan)} points, {estimate['moves']} moves, "
+              f"travel X: {estimate['travel_x_um']:.1f} um, Y: {estimate['travel_y_um']:.1f} um, "
+              f"estimated time: {estimate['duration_s']:.1f} s")
 
         # Start the scan from the current position
         print("Starting scan...")
 
-        for x_idx in range(x_points):
-            for y_idx in range(y_points):
-                # Calculate the relative move for the current step
-                x_move = x_step * x_idx  # Move in X direction by x_step * x_idx
-                y_move = y_step * y_idx  # Move in Y direction by y_step * y_idx
+        try:
+            for point in plan:
+                x_move, y_move = point.x_um, point.y_um
 
-                print(f"Moving relative to current position by X: {x_move:.2f} um, Y: {y_move:.2f} um")
+                print(f"Moving relative to current position by X: {point.dx_um:.2f} um, Y: {point.dy_um:.2f} um")
 
-                # Move stage by relative distance in X and Y axes
-                self.sta.move_um(0, x_step, relative=True)  # Relative move in X-axis (channel 0)
-                self.sta.move_um(1, y_step, relative=True)  # Relative move in Y-axis (channel 1)
+                # Move stage by relative distance in X and Y axes, skipping axes that do not move
+                if point.dx_um != 0:
+                    self.sta.move_um(0, point.dx_um, relative=True)  # Relative move in X-axis (channel 0)
+                if point.dy_um != 0:
+                    self.sta.move_um(1, point.dy_um, relative=True)  # Relative move in Y-axis (channel 1)
 
                 # Acquire the spectrum at the current relative position
                 wavelengths, spectrum = spectrometer.read_spectra(exposure_time_Us=exposure_time_Us, num_average=num_average)
 
-                # Store the spectrum in the dictionary with (x_move, y_move) as the key
-                spectra_data[(x_move, y_move)] = (wavelengths, spectrum)
-
-                # Optionally save the spectrum as a file
-                if save_folder is not None:
-                    filename = os.path.join(save_folder, f'spectrum_X{x_move:.2f}_Y{y_move:.2f}.csv')
-                    data = np.column_stack((wavelengths, spectrum))
-                    np.savetxt(filename, data, delimiter=',', header='Wavelength, Spectrum', comments='')
+                # Store the spectrum at its grid point, with the stage position it was acquired at
+                if store is not None:
+                    store.write_point(point.y_idx, point.x_idx, spectrum, self.sta.position_um[:2])
+                else:
+                    spectral_map[point.y_idx, point.x_idx] = spectrum
 
                 print(f"Spectrum acquired at relative X: {x_move:.2f} um, Y: {y_move:.2f} um")
+        finally:
+            if store is not None:
+                store.flush()
+
+        # Return the collected spectra
+        return wavelengths, spectral_map
+
+    def fly_scan_xy_and_acquire_spectra(self, x_length, y_step, x_bins, y_points, exposure_time_Us=100000, num_average=1, save_folder=None, polling_wait_s=2e-3):
+        """
+        Acquires a spectral map with the X axis moving continuously ("fly scan"), relative to the current position.
+
+        Each line is a single non-blocking X move, alternating direction between lines. While the stage moves,
+        spectra are acquired back to back and the encoder is polled in a background thread; every spectrum is then
+        tagged with the X position interpolated at the middle of its acquisition, and the spectra are averaged into
+        `x_bins` bins along the line. A line therefore takes about as long as the move itself, with no acceleration,
+        settling or polling cost per point. The stage speed is set by the controller, so the number of spectra per
+        bin follows from the line length, the stage speed and the exposure time.
+
+        Args:
+            x_length (float): The length of each line in micrometers in the X direction.
+            y_step (float): The step size in micrometers between lines in the Y direction.
+            x_bins (int): The number of points the spectra of each line are binned into in the X direction.
+            y_points (int): The number of lines in the Y direction.
+            exposure_time_Us (int): The exposure time for the spectrometer in microseconds (default: 100000).
+            num_average (int): The number of scans to average for each spectrum (default: 1).
+            save_folder (str): The folder to save the spectral map to (if provided), as a SpectralMapStore.
+            polling_wait_s (float): Time in seconds between encoder reads during each line (default: 2 ms).
 
-            # Move back to the starting Y position after finishing the Y moves for the current X position
-            self.sta.move_um(1, -y_step * y_points, relative=True)  # Reset Y to start of row
+        Returns:
+            tuple: The wavelengths as a (n_pixels,) array and the spectra as a (y_points, x_bins, n_pixels) float32
+            array, NaN for bins in which no spectrum was acquired.
+        """
+        # Use the persistent spectrometer session
+        spectrometer = self.spec_vis
+        wavelengths = spectrometer.wavelengths
+        x_um = (np.arange(x_bins) + 0.5) * x_length / x_bins  # Bin centres
+        y_um = y_step * np.arange(y_points)
+
+        # Allocate the spectral map, on disk if it is to be saved
+        store = None
+        if save_folder is not None:
+            store = SpectralMapStore(save_folder, wavelengths, x_um, y_um, mode='w',
+                                     attrs={'exposure_time_Us': exposure_time_Us, 'num_average': num_average,
+                                            'fly_scan': True})
+            spectral_map = store.spectra
+        else:
+            spectral_map = np.full((y_points, x_bins, len(wavelengths)), np.nan, dtype=np.float32)
+
+        # Lines start and end at the current X position and X position + x_length
+        self.sta.wait_for_move(0)
+        x_origin = self.sta.position_um[0]
+        print("Starting fly scan...")
+
+        try:
+            for y_idx in range(y_points):
+                if y_idx > 0:
+                    self.sta.move_um(1, y_step, relative=True)  # Step to the next line in the Y-axis (channel 1)
+
+                # Start the X move and trace the encoder while it runs
+                x_end = x_origin + x_length if y_idx % 2 == 0 else x_origin
+                self.sta.move_um(0, x_end, relative=False, block=False)
+                trace, tracker_errors = [], []
+
+                def track():
+                    # Keep any error of the tracking thread, which would otherwise be lost
+                    try:
+                        self.sta.wait_for_move(0, polling_wait_s=polling_wait_s, trace=trace)
+                    except Exception as err:
+                        tracker_errors.append(err)
+
+                tracker = threading.Thread(target=track, name='fly-scan-tracker')
+                tracker.start()
+
+                # Acquire spectra back to back until the stage arrives
+                sample_times_s, spectra = [], []
+                while tracker.is_alive():
+                    t_start = time.perf_counter()
+                    _, spectrum = spectrometer.read_spectra(exposure_time_Us=exposure_time_Us, num_average=num_average)
+                    sample_times_s.append(0.5 * (t_start + time.perf_counter()))
+                    spectra.append(spectrum)
+                tracker.join()
+                for err in tracker_errors:
+                    print(f"Line {y_idx + 1}/{y_points}: encoder tracking failed after {len(trace)} reads: {err!r}")
+
+                # Bin the spectra along the line by their interpolated positions
+                _, binned, counts = bin_fly_line(sample_times_s, spectra, trace, x_origin, x_length, x_bins,
+                                                 n_pixels=len(wavelengths))
+                if store is not None:
+                    for x_idx in np.flatnonzero(counts):
+                        store.write_point(y_idx, x_idx, binned[x_idx], (x_origin + x_um[x_idx], self.sta.position_um[1]))
+                else:
+                    spectral_map[y_idx] = binned
+
+                print(f"Line {y_idx + 1}/{y_points}: {len(spectra)} spectra, {np.count_nonzero(counts)}/{x_bins} bins filled")
+        finally:
+            if store is not None:
+                store.flush()
 
         # Return the collected spectra
-        return spectra_data
+        return wavelengths, spectral_map
+
+    async def aquire_HS_datacube_async(self, **kwargs):
+        """
+        Asynchronous variant of aquire_HS_datacube(), run on the camera's worker thread.
+
+        The pipeline threads of the datacube drive the tunable filter directly, so the filter facade's lock is held
+        for the whole datacube: calls made through `alcf` in the meantime wait until it has been acquired, rather
+        than retuning the filter in the middle of it.
+
+        Args:
+            **kwargs: As for aquire_HS_datacube().
+
+        Returns:
+            tuple: The wavelengths and the hypercube, as returned by aquire_HS_datacube().
+        """
+        def acquire():
+            with self.alcf.lock:
+                return self.aquire_HS_datacube(**kwargs)
+
+        return await self.achs.run(acquire)
+
+    async def aquire_single_spec_vis_async(self, exposure_time_Us=100000, num_average=5):
+        """
+        Asynchronous variant of aquire_single_spec_vis(), run on the spectrometer's worker thread.
+
+        Returns:
+            tuple: A tuple containing the wavelengths and the corresponding spectrum (counts).
+        """
+        return await self.aspec_vis.read_spectra(exposure_time_Us=exposure_time_Us, num_average=num_average)
+
+    async def move_xy_async(self, x_um, y_um, relative=False):
+        """
+        Moves the stage in X and Y, starting both axes before waiting for either.
+
+        Args:
+            x_um (float): The X position (or move, if relative) in micrometers.
+            y_um (float): The Y position (or move, if relative) in micrometers.
+            relative (bool): If True, the move is relative to the current position (default: False).
+        """
+        await self.asta.move_um(0, x_um, relative=relative, block=False)
+        await self.asta.move_um(1, y_um, relative=relative, block=False)
+        await self.asta.wait_for_move(0)
+        await self.asta.wait_for_move(1)
+
+    def _save_datacube(self, filename, wavelengths, hypercube, attrs):
+        """
+        Saves a datacube to a HyperspectralStore with a single timepoint.
+        """
+        with HyperspectralStore(filename, wavelengths, hypercube.shape[1:], mode='w', attrs=attrs) as store:
+            t_index = store.append_timepoint(0.0)
+            for index, frame in enumerate(hypercube):
+                store.write_frame((t_index, index), frame)
+
+    async def aquire_HS_mosaic_async(self, positions_um, save_folder, **kwargs):
+        """
+        Acquires a hyper-spectral datacube at each of a list of absolute stage positions.
+
+        The datacubes are acquired one after the other, but each is saved in the background while the stage
+        moves to the next position, so neither the move nor the file write holds up the camera.
+
+        Args:
+            positions_um (list): The (x, y) stage positions in micrometers.
+            save_folder (str): The folder the datacubes are saved to, as 'tile_XXX.h5' HyperspectralStores.
+            **kwargs: Further arguments of aquire_HS_datacube() (e.g. wavelength_range, no_spectra, exposuretime).
+
+        Returns:
+            list: The (x, y) stage positions in micrometers measured at each tile.
+        """
+        saves = []
+        measured_um = []
+        try:
+            for index, (x_um, y_um) in enumerate(positions_um):
+                # Move to the tile while the previous tile is still being saved
+                await self.move_xy_async(x_um, y_um)
+                measured_um.append(tuple(self.sta.position_um[:2]))
+
+                # Acquire the datacube, keeping the frames in memory
+                wavelengths, hypercube = await self.aquire_HS_datacube_async(save_folder=[], **kwargs)
+
+                # Save it in the background and carry on with the next tile
+                filename = os.path.join(save_folder, f'tile_{index:03d}.h5')
+                attrs = {'position_um': measured_um[-1]}
+                save = functools.partial(self._save_datacube, filename, wavelengths, hypercube, attrs)
+                saves.append(asyncio.get_running_loop().run_in_executor(self._save_executor, save))
+                print(f"Tile {index + 1}/{len(positions_um)} acquired at X: {x_um:.2f} um, Y: {y_um:.2f} um")
+        finally:
+            await asyncio.gather(*saves)
+        return measured_um
 
 
 if __name__ == '__main__':